@@ -1,7 +1,10 @@
+import base64
+import collections
 import glob
+import hashlib
 import json
 import os
-import queue
+import statistics
 import threading
 import uuid
 import subprocess
@@ -9,208 +12,295 @@ import sys
 import time
 from datetime import datetime
 
-from flask import Flask, Response, jsonify, render_template, request, send_from_directory
+from flask import Flask, Response, g, jsonify, render_template, request, send_from_directory
 
 os.environ.setdefault("MPLBACKEND", "Agg")
 
 import create_map_poster as poster
+import event_bus
+import geocoder
+import job_runner
+import job_store
+import job_timing
+import metrics
 import mockup_generator
+import poster_index
+import preview
+import tiles
 
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
-JOBS = {}
-JOBS_LOCK = threading.Lock()
-JOB_QUEUE = queue.Queue()
+# Reverse proxies in front of the app whose X-Forwarded-For entries are trusted.
+# Without one, the header is client-supplied and request.remote_addr is used as is.
+TRUSTED_PROXIES = int(os.environ.get("MAPTOPOSTER_TRUSTED_PROXIES", "0"))
+if TRUSTED_PROXIES > 0:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# Job records and queue live in SQLite so every gunicorn worker sees the same jobs
+JOB_STORE = job_store.JobStore()
+# Wakes local dispatcher threads as soon as this process enqueues a job
+JOB_AVAILABLE = threading.Event()
+# Set MAPTOPOSTER_EMBEDDED_WORKER=0 when dedicated render workers (app.py --worker) run the queue
+EMBEDDED_WORKER = os.environ.get("MAPTOPOSTER_EMBEDDED_WORKER", "1") != "0"
+WORKER_POLL_INTERVAL = 1.0
 WORKER_STARTED = False
-MAX_CONCURRENT_JOBS = 1  # Can be increased for multi-worker setup
+WORKER_LOCK = threading.Lock()
+
+# SSE fan-out: one producer per topic, any number of subscribers
+EVENT_BUS = event_bus.EventBus()
+JOB_STREAM_INTERVAL = 0.5
+POSTERS_STREAM_INTERVAL = 2
+STREAMS_STARTED = False
+STREAMS_LOCK = threading.Lock()
+
+POSTER_INDEX = poster_index.PosterIndex(poster.POSTERS_DIR)
+
+# Run-time model fitted from past job timings, used for ETAs
+TIMING = job_runner.timing_model()
+# Renders are re-entrant (see poster.RenderContext), so several jobs can run side by side
+MAX_CONCURRENT_JOBS = max(1, int(os.environ.get("MAX_CONCURRENT_JOBS", "1")))
+# Executes jobs in-process or in worker processes (MAPTOPOSTER_EXECUTOR=thread|process)
+RUNNER = job_runner.make_runner()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route template, not path, to keep the number of series bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    started = g.get("request_started")
+    if started is not None:
+        metrics.HTTP_DURATION.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+    return response
 
 
 def load_theme_catalog():
-    themes = []
-    for theme_name in poster.get_available_themes():
-        theme_path = os.path.join(poster.THEMES_DIR, f"{theme_name}.json")
-        try:
-            with open(theme_path, "r") as handle:
-                theme_data = json.load(handle)
-        except Exception:
-            theme_data = {}
-        themes.append(
-            {
-                "id": theme_name,
-                "name": theme_data.get("name", theme_name),
-                "description": theme_data.get("description", ""),
-                "category": theme_data.get("category", "other"),
-                "colors": {
-                    "bg": theme_data.get("bg", "#FFFFFF"),
-                    "text": theme_data.get("text", "#111111"),
-                    "water": theme_data.get("water", "#C0C0C0"),
-                    "parks": theme_data.get("parks", "#F0F0F0"),
-                    "road_motorway": theme_data.get("road_motorway", theme_data.get("road_primary", "#1A1A1A")),
-                    "road_primary": theme_data.get("road_primary", "#1A1A1A"),
-                    "road_secondary": theme_data.get("road_secondary", "#2A2A2A"),
-                    "road_tertiary": theme_data.get("road_tertiary", "#3A3A3A"),
-                },
-            }
-        )
-    return themes
+    """Return (catalog, etag) served from the in-memory theme store."""
+    return poster.THEME_STORE.catalog()
+
+
+def job_remaining(job):
+    """Estimated seconds left for a running job (whole seconds, never negative)."""
+    if job["status"] != "running" or not job["estimate"] or not job["started_at"]:
+        return None
+    return max(0, int(round(job["estimate"] - (time.time() - job["started_at"]))))
+
+
+def estimate_job(job):
+    """Predicted run time for a job about to be queued."""
+    cache_hit = False
+    if job.get("lat") is not None and job.get("lng") is not None:
+        cache_hit = poster.is_map_cached(job["lat"], job["lng"], job["distance"])
+    return TIMING.estimate(job["distance"], job["dpi"], job["format"], cache_hit=cache_hit, cost=job.get("cost"))
+
+
+def job_event(job):
+    """Progress snapshot sent to SSE clients."""
+    return {
+        "status": job["status"],
+        "stage": job["stage"],
+        "percent": job["progress"],
+        "message": job["message"],
+        "output": job["output"],
+        "output_url": job["output_url"],
+        "error": job["error"],
+        "eta_seconds": job_remaining(job),
+    }
 
 
-def push_event(job_id, payload):
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return
-        if "status" in payload:
-            job["status"] = payload["status"]
-        if "stage" in payload:
-            job["stage"] = payload["stage"]
-        if "percent" in payload:
-            job["progress"] = payload["percent"]
-        if "message" in payload:
-            job["message"] = payload["message"]
-        if "output" in payload:
-            job["output"] = payload["output"]
-        if "output_url" in payload:
-            job["output_url"] = payload["output_url"]
-        if "error" in payload:
-            job["error"] = payload["error"]
-        event = {
-            "status": job["status"],
-            "stage": job["stage"],
-            "percent": job["progress"],
-            "message": job["message"],
-            "output": job["output"],
-            "output_url": job["output_url"],
-            "error": job["error"],
-        }
-        job["queue"].put(event)
+def poster_result(output_file):
+    """Completion fields for a finished poster file."""
+    base_name = os.path.basename(output_file).rsplit(".", 1)[0]
+    return {
+        "message": "Poster ready (reused existing render)",
+        "output": output_file,
+        "output_url": f"/posters/{os.path.basename(output_file)}",
+        "thumb_url": f"/posters/{base_name}_thumb.png",
+    }
 
 
-def run_job(job_id, city, country, theme, distance, dpi, output_format, lat=None, lng=None, font=None, tagline=None, pin=None, pin_color=None, aspect_ratio="2:3", collection=None):
-    def progress(info):
-        payload = dict(info)
-        payload["status"] = "running"
-        push_event(job_id, payload)
+def find_existing_poster(render_key):
+    """
+    Look for a finished poster rendered with identical parameters whose file still exists.
+    Checks the job store first, then the render_key saved in poster configs.
+    """
+    job = JOB_STORE.find_done(render_key)
+    if job and job["output"] and os.path.exists(job["output"]):
+        return poster_result(job["output"])
 
-    try:
-        push_event(
-            job_id,
-            {
-                "status": "running",
-                "stage": "queued",
-                "percent": 0,
-                "message": "Preparing map generation",
-            },
-        )
+    item = POSTER_INDEX.find(render_key)
+    if item is not None:
+        output_file = os.path.join(poster.POSTERS_DIR, item["filename"])
+        if os.path.exists(output_file):
+            return poster_result(output_file)
+    return None
 
-        available_themes = poster.get_available_themes()
-        if theme not in available_themes:
-            raise ValueError(
-                f"Theme '{theme}' not found. Available themes: {', '.join(available_themes)}"
-            )
 
-        poster.THEME = poster.load_theme(theme)
+def submit_jobs(jobs):
+    """
+    Queue jobs, skipping work that is already done or in flight.
 
-        # Use direct coordinates if provided, otherwise geocode city/country
-        if lat is not None and lng is not None:
-            coords = (lat, lng)
-            progress({"stage": "geocode", "percent": 10, "message": "Using provided coordinates"})
+    A job identical to a queued/running one is attached to it, and one identical
+    to a finished poster that still exists completes immediately; either way the
+    poster is filed in the job's collection, if it names one.
+    Returns a list of {"job_id", "queue_position", "reused"} dicts, in order.
+    """
+    results = [None] * len(jobs)
+    pending = []
+    for index, job in enumerate(jobs):
+        job["render_key"] = job_runner.render_key(job)
+        job["cost"] = job_runner.estimate_cost(job)
+        job["estimate"] = estimate_job(job)
+        existing = find_existing_poster(job["render_key"])
+        if existing:
+            if job.get("collection") and job_runner.file_poster(existing["output"], job["collection"]):
+                POSTER_INDEX.invalidate()
+            JOB_STORE.add_finished(job, existing)
+            results[index] = {"job_id": job["id"], "queue_position": 0, "reused": True}
         else:
-            coords = poster.get_coordinates(city, country, progress=progress)
+            pending.append(index)
+
+    if pending:
+        queued = JOB_STORE.enqueue([jobs[index] for index in pending])
+        for index, (job_id, position) in zip(pending, queued):
+            results[index] = {
+                "job_id": job_id,
+                "queue_position": position,
+                "reused": job_id != jobs[index]["id"],
+            }
+        JOB_AVAILABLE.set()
+    return results
 
-        output_file = poster.generate_output_filename(city, theme, output_format)
-        poster.create_poster(
-            city, country, coords, distance, output_file, output_format, dpi=dpi, progress=progress, font_family=font, tagline=tagline, pin=pin, pin_color=pin_color, aspect_ratio=aspect_ratio
-        )
 
-        # Save config JSON for this poster
-        config = {
-            "city": city,
-            "country": country,
-            "lat": coords[0],
-            "lng": coords[1],
-            "distance": distance,
-            "theme": theme,
-            "font": font,
-            "dpi": dpi,
-            "format": output_format,
-            "tagline": tagline,
-            "pin": pin,
-            "pin_color": pin_color,
-            "aspect_ratio": aspect_ratio,
-            "collection": collection,
-            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-        }
-        config_file = output_file.rsplit('.', 1)[0] + '_config.json'
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=2)
+def client_id():
+    """
+    Identity used to fair-share the queue between users: the client address,
+    taken from X-Forwarded-For only behind MAPTOPOSTER_TRUSTED_PROXIES proxies.
+    """
+    return "client:" + (request.remote_addr or "unknown")
 
-        output_url = f"/posters/{os.path.basename(output_file)}"
-        thumb_url = f"/posters/{os.path.basename(output_file).rsplit('.', 1)[0]}_thumb.png"
-        push_event(
-            job_id,
-            {
-                "status": "done",
-                "stage": "done",
-                "percent": 100,
-                "message": "Poster ready",
-                "output": output_file,
-                "output_url": output_url,
-                "thumb_url": thumb_url,
-            },
-        )
-    except Exception as exc:
-        push_event(
-            job_id,
-            {
-                "status": "error",
-                "stage": "error",
-                "percent": 100,
-                "message": "Generation failed",
-                "error": str(exc),
-            },
-        )
+
+def push_event(job_id, payload):
+    JOB_STORE.update(job_id, payload)
+    # Renders in this process reach subscribers without waiting for the next poll
+    topic = EVENT_BUS.get(f"job:{job_id}")
+    if topic is not None:
+        job = JOB_STORE.get(job_id)
+        if job is not None:
+            topic.publish(job_event(job))
+
+
+def job_stream_producer():
+    """Publish state changes of watched jobs, whichever process made them, with one query per tick."""
+    while True:
+        names = EVENT_BUS.names("job:")
+        if names:
+            jobs = JOB_STORE.get_many(name[4:] for name in names)
+            for name in names:
+                topic = EVENT_BUS.get(name)
+                if topic is None:
+                    continue
+                job = jobs.get(name[4:])
+                if job is not None:
+                    topic.publish(job_event(job))
+                finished = job is None or job["status"] in job_store.FINISHED_STATUSES
+                if finished and topic.subscribers == 0:
+                    EVENT_BUS.remove(name)
+        time.sleep(JOB_STREAM_INTERVAL)
+
+
+def posters_stream_producer():
+    """
+    Tell subscribers whenever the poster index changes. Only the index's etag is
+    sent; clients refetch the pages they show from /api/posters.
+    """
+    topic = EVENT_BUS.topic("posters")
+    while True:
+        if topic.subscribers:
+            # publish() drops a snapshot identical to the last one
+            topic.publish({"etag": POSTER_INDEX.etag()})
+        time.sleep(POSTERS_STREAM_INTERVAL)
+
+
+def counted_stream(stream, name):
+    """Wrap an SSE body so open connections show up in /metrics."""
+    metrics.SSE_CONNECTIONS.inc(stream=name)
+    try:
+        yield from stream
+    finally:
+        metrics.SSE_CONNECTIONS.dec(stream=name)
+
+
+def ensure_streams():
+    global STREAMS_STARTED
+    with STREAMS_LOCK:
+        if STREAMS_STARTED:
+            return
+        for producer in (job_stream_producer, posters_stream_producer):
+            threading.Thread(target=producer, daemon=True).start()
+        STREAMS_STARTED = True
 
 
 def job_worker():
+    worker_id = job_store.worker_identity()
     while True:
-        job_id = JOB_QUEUE.get()
-        try:
-            with JOBS_LOCK:
-                job = JOBS.get(job_id)
-            if not job:
-                continue
-            if job["status"] != "queued":
-                continue
-            run_job(
-                job_id,
-                job["city"],
-                job["country"],
-                job["theme"],
-                job["distance"],
-                job["dpi"],
-                job["format"],
-                lat=job.get("lat"),
-                lng=job.get("lng"),
-                font=job.get("font"),
-                tagline=job.get("tagline"),
-                pin=job.get("pin"),
-                pin_color=job.get("pin_color"),
-                aspect_ratio=job.get("aspect_ratio", "2:3"),
-                collection=job.get("collection"),
+        job = JOB_STORE.claim_next(worker_id)
+        if job is None:
+            JOB_STORE.prune()
+            JOB_AVAILABLE.wait(WORKER_POLL_INTERVAL)
+            JOB_AVAILABLE.clear()
+            continue
+        job_id = job["id"]
+        if job["started_at"] and job["created_at"]:
+            metrics.JOB_QUEUE_WAIT.observe(job["started_at"] - job["created_at"], priority=job["priority"])
+        RUNNER.run(
+            job_id,
+            job_runner.job_params(job),
+            push_event,
+            is_cancelled=lambda: JOB_STORE.is_cancel_requested(job_id),
+        )
+        finished = JOB_STORE.get(job_id)
+        if finished is not None:
+            # A request attached while this job was running may have asked for another collection
+            if finished["status"] == "done" and finished.get("collection"):
+                if job_runner.file_poster(finished["output"], finished["collection"]):
+                    POSTER_INDEX.invalidate()
+            metrics.JOBS_FINISHED.inc(status=finished["status"])
+            metrics.JOB_DURATION.observe(
+                time.time() - (job["started_at"] or time.time()),
+                format=job.get("format") or "png",
+                status=finished["status"],
             )
-        finally:
-            JOB_QUEUE.task_done()
 
 
-def ensure_worker():
+def start_workers():
+    """Start MAX_CONCURRENT_JOBS dispatcher threads claiming jobs from the shared store."""
     global WORKER_STARTED
-    if WORKER_STARTED:
-        return
-    worker = threading.Thread(target=job_worker, daemon=True)
-    worker.start()
-    WORKER_STARTED = True
+    with WORKER_LOCK:
+        if WORKER_STARTED:
+            return []
+        JOB_STORE.recover_orphans()
+        JOB_STORE.prune(force=True)
+        threads = []
+        for _ in range(MAX_CONCURRENT_JOBS):
+            worker = threading.Thread(target=job_worker, daemon=True)
+            worker.start()
+            threads.append(worker)
+        WORKER_STARTED = True
+        return threads
+
+
+def ensure_worker():
+    if EMBEDDED_WORKER:
+        start_workers()
 
 
 @app.route("/")
@@ -230,7 +320,11 @@ def theme_samples():
 
 @app.route("/api/themes")
 def api_themes():
-    return jsonify(load_theme_catalog())
+    themes, etag = load_theme_catalog()
+    response = jsonify(themes)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 
 @app.route("/api/themes/categories")
@@ -246,18 +340,13 @@ def api_theme_categories():
 def api_theme_get(theme_id):
     """Get a single theme by ID."""
     safe_id = os.path.basename(theme_id)
-    theme_path = os.path.join(poster.THEMES_DIR, f"{safe_id}.json")
+    theme_data = poster.THEME_STORE.raw(safe_id)
 
-    if not os.path.exists(theme_path):
+    if theme_data is None:
         return jsonify({"error": "Theme not found"}), 404
 
-    try:
-        with open(theme_path, "r", encoding="utf-8") as f:
-            theme_data = json.load(f)
-        theme_data["id"] = safe_id
-        return jsonify(theme_data)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    theme_data["id"] = safe_id
+    return jsonify(theme_data)
 
 
 @app.route("/api/themes", methods=["POST"])
@@ -304,6 +393,7 @@ def api_theme_create():
     try:
         with open(theme_path, "w", encoding="utf-8") as f:
             json.dump(theme_data, f, indent=2)
+        poster.THEME_STORE.invalidate(theme_id)
         return jsonify({"ok": True, "id": theme_id, "name": name})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -348,6 +438,7 @@ def api_theme_update(theme_id):
     try:
         with open(theme_path, "w", encoding="utf-8") as f:
             json.dump(theme_data, f, indent=2)
+        poster.THEME_STORE.invalidate(safe_id)
         return jsonify({"ok": True, "id": safe_id})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -364,6 +455,7 @@ def api_theme_delete(theme_id):
 
     try:
         os.remove(theme_path)
+        poster.THEME_STORE.invalidate(safe_id)
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -406,6 +498,7 @@ def api_theme_duplicate(theme_id):
 
         with open(new_path, "w", encoding="utf-8") as f:
             json.dump(theme_data, f, indent=2)
+        poster.THEME_STORE.invalidate(new_id)
 
         return jsonify({"ok": True, "id": new_id, "name": new_name})
     except Exception as e:
@@ -421,138 +514,42 @@ def theme_editor():
 @app.route("/api/editor-preview-svg")
 def api_editor_preview_svg():
     """
-    Generate a real map SVG preview from cached geometry.
-    Uses a sample cached map for the preview.
+    Vector preview of a cached map for the theme editor, built once per map
+    and restyled client-side. ?map= picks a file from /api/cached-maps;
+    otherwise a medium-sized map is used.
     """
-    import pickle
-    import io
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    from matplotlib.patches import Rectangle, Polygon as MplPolygon
-    import osmnx as ox
-
-    # Find a good sample cached map
-    cache_dir = os.path.join(os.path.dirname(__file__), "cache", "map_data")
-    cache_files = glob.glob(os.path.join(cache_dir, "*.pkl"))
-
+    cache_files = sorted(glob.glob(os.path.join(poster.MAP_CACHE_DIR, "*.pkl")))
     if not cache_files:
         return jsonify({"error": "No cached maps available"}), 404
 
-    # Prefer a medium-sized map (around 5000m)
-    sample_file = None
-    for f in cache_files:
-        if "_5000_" in f or "_4000_" in f or "_6000_" in f:
-            sample_file = f
-            break
-    if not sample_file:
-        sample_file = cache_files[0]
+    requested = os.path.basename(request.args.get("map") or "")
+    if requested:
+        sample_file = os.path.join(poster.MAP_CACHE_DIR, requested)
+        if sample_file not in cache_files:
+            return jsonify({"error": "Cached map not found"}), 404
+    else:
+        # Prefer a medium-sized map (around 5000m)
+        sample_file = None
+        for f in cache_files:
+            if "_5000_" in f or "_4000_" in f or "_6000_" in f:
+                sample_file = f
+                break
+        if not sample_file:
+            sample_file = cache_files[0]
 
-    # Load cached geometry
+    # Filenames are map_lat_lon_dist_hash.pkl (see poster.get_cache_key)
+    cache_key = os.path.basename(sample_file)[:-len(".pkl")]
     try:
-        with open(sample_file, "rb") as f:
-            data = pickle.load(f)
-        graph = data["graph"]
-        water = data.get("water")
-        parks = data.get("parks")
-    except Exception as e:
-        return jsonify({"error": f"Failed to load cache: {e}"}), 500
-
-    # Create figure
-    fig, ax = plt.subplots(figsize=(6, 8))
-    ax.set_aspect('equal')
-    ax.axis('off')
-
-    # Get bounds from graph
-    nodes = ox.graph_to_gdfs(graph, edges=False)
-    minx, miny, maxx, maxy = nodes.total_bounds
-    padding = (maxx - minx) * 0.02
-    ax.set_xlim(minx - padding, maxx + padding)
-    ax.set_ylim(miny - padding, maxy + padding)
-
-    # Draw background with gid
-    bg = Rectangle((minx - padding, miny - padding),
-                   (maxx - minx) + 2*padding, (maxy - miny) + 2*padding,
-                   facecolor='#FFFFFF', edgecolor='none', zorder=0)
-    bg.set_gid('preview-bg')
-    ax.add_patch(bg)
-
-    # Draw water
-    if water is not None and len(water) > 0:
-        for idx, (_, row) in enumerate(water.iterrows()):
-            geom = row.geometry
-            if geom.geom_type == 'Polygon':
-                patch = MplPolygon(list(geom.exterior.coords), closed=True,
-                                  facecolor='#C0C0C0', edgecolor='none', zorder=1)
-                patch.set_gid(f'preview-water-{idx}')
-                ax.add_patch(patch)
-            elif geom.geom_type == 'MultiPolygon':
-                for j, poly in enumerate(geom.geoms):
-                    patch = MplPolygon(list(poly.exterior.coords), closed=True,
-                                      facecolor='#C0C0C0', edgecolor='none', zorder=1)
-                    patch.set_gid(f'preview-water-{idx}-{j}')
-                    ax.add_patch(patch)
-
-    # Draw parks
-    if parks is not None and len(parks) > 0:
-        for idx, (_, row) in enumerate(parks.iterrows()):
-            geom = row.geometry
-            if geom.geom_type == 'Polygon':
-                patch = MplPolygon(list(geom.exterior.coords), closed=True,
-                                  facecolor='#F0F0F0', edgecolor='none', zorder=2)
-                patch.set_gid(f'preview-parks-{idx}')
-                ax.add_patch(patch)
-            elif geom.geom_type == 'MultiPolygon':
-                for j, poly in enumerate(geom.geoms):
-                    patch = MplPolygon(list(poly.exterior.coords), closed=True,
-                                      facecolor='#F0F0F0', edgecolor='none', zorder=2)
-                    patch.set_gid(f'preview-parks-{idx}-{j}')
-                    ax.add_patch(patch)
-
-    # Draw roads by type with different gids
-    road_types = {
-        'motorway': (['motorway', 'motorway_link'], 2.5, '#0A0A0A'),
-        'primary': (['trunk', 'trunk_link', 'primary', 'primary_link'], 1.8, '#1A1A1A'),
-        'secondary': (['secondary', 'secondary_link'], 1.2, '#2A2A2A'),
-        'tertiary': (['tertiary', 'tertiary_link'], 0.8, '#3A3A3A'),
-        'residential': (['residential', 'living_street', 'unclassified'], 0.5, '#4A4A4A'),
-    }
-
-    edges = ox.graph_to_gdfs(graph, nodes=False)
-
-    for road_name, (types, width, color) in road_types.items():
-        road_edges = edges[edges['highway'].apply(
-            lambda x: any(t in (x if isinstance(x, list) else [x]) for t in types)
-        )]
-        if len(road_edges) > 0:
-            for idx, (_, edge) in enumerate(road_edges.iterrows()):
-                xs, ys = edge.geometry.xy
-                line, = ax.plot(xs, ys, color=color, linewidth=width, solid_capstyle='round', zorder=3)
-                line.set_gid(f'preview-road-{road_name}-{idx}')
-
-    # Draw default roads (anything not matched above)
-    matched_types = [t for types, _, _ in road_types.values() for t in types]
-    default_edges = edges[~edges['highway'].apply(
-        lambda x: any(t in (x if isinstance(x, list) else [x]) for t in matched_types)
-    )]
-    if len(default_edges) > 0:
-        for idx, (_, edge) in enumerate(default_edges.iterrows()):
-            xs, ys = edge.geometry.xy
-            line, = ax.plot(xs, ys, color='#3A3A3A', linewidth=0.4, solid_capstyle='round', zorder=3)
-            line.set_gid(f'preview-road-default-{idx}')
-
-    plt.tight_layout(pad=0)
-
-    # Save to SVG
-    svg_buffer = io.BytesIO()
-    fig.savefig(svg_buffer, format='svg', bbox_inches='tight', pad_inches=0,
-                transparent=True, dpi=100)
-    plt.close(fig)
+        dist = int(cache_key.split("_")[3])
+        svg_content = preview.default_cache().svg(cache_key, dist)
+    except (IndexError, ValueError):
+        return jsonify({"error": "Unrecognized cache file name"}), 400
+    except preview.PreviewNotCached:
+        return jsonify({"error": "Failed to load cache"}), 500
 
-    svg_buffer.seek(0)
-    svg_content = svg_buffer.read().decode('utf-8')
-
-    return Response(svg_content, mimetype='image/svg+xml')
+    response = Response(svg_content, mimetype='image/svg+xml')
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 @app.route("/api/cached-maps")
@@ -815,7 +812,10 @@ def api_collections_modify(coll_id):
 
         # Unlink all posters from this collection
         unlinked_count = 0
-        for config_file in glob.glob(os.path.join(poster.POSTERS_DIR, "*_config.json")):
+        linked, _ = POSTER_INDEX.query(collection=coll_id)
+        for item in linked:
+            base_name = item["filename"].rsplit(".", 1)[0]
+            config_file = os.path.join(poster.POSTERS_DIR, f"{base_name}_config.json")
             try:
                 with open(config_file, "r") as f:
                     config = json.load(f)
@@ -826,6 +826,7 @@ def api_collections_modify(coll_id):
                     unlinked_count += 1
             except Exception:
                 continue
+        POSTER_INDEX.invalidate()
 
         return jsonify({"ok": True, "unlinked": unlinked_count})
 
@@ -872,6 +873,7 @@ def api_poster_collection(filename):
 
         with open(config_path, "w") as f:
             json.dump(config, f, indent=2)
+        POSTER_INDEX.invalidate()
 
         return jsonify({"ok": True, "collection": collection})
     except Exception as e:
@@ -1399,6 +1401,11 @@ def api_jobs():
     # Collection assignment
     collection = (payload.get("collection") or "").strip() or None
 
+    # Scheduling lane: "interactive" for a user waiting on the result, "single" for queued jobs
+    priority = (payload.get("priority") or job_store.DEFAULT_PRIORITY).strip()
+    if priority not in job_store.PRIORITIES:
+        return jsonify({"error": f"Priority must be one of: {', '.join(job_store.PRIORITIES)}"}), 400
+
     if not city or not country:
         return jsonify({"error": "City and country are required."}), 400
 
@@ -1412,7 +1419,6 @@ def api_jobs():
         "output": None,
         "output_url": None,
         "error": None,
-        "queue": queue.Queue(),
         "city": city,
         "country": country,
         "theme": theme,
@@ -1427,31 +1433,126 @@ def api_jobs():
         "pin_color": pin_color,
         "aspect_ratio": aspect_ratio,
         "collection": collection,
-        "created_at": uuid.uuid1().time,
+        "priority": priority,
+        "owner": client_id(),
     }
 
-    with JOBS_LOCK:
-        # Count queued jobs for position calculation
-        queued_count = sum(1 for j in JOBS.values() if j["status"] == "queued")
+    return jsonify(submit_jobs([job])[0])
 
-        # Calculate queue position
-        job["queue_position"] = queued_count + 1
-        JOBS[job_id] = job
 
-    JOB_QUEUE.put(job_id)
+@app.route("/api/preview", methods=["POST"])
+def api_preview():
+    """
+    Render a small PNG preview of a poster from already-cached map data and
+    return it directly. Takes the same fields as /api/jobs plus an optional
+    width in pixels; nothing is written to posters/.
+    """
+    started = time.perf_counter()
+    payload = request.get_json(silent=True) or {}
+    city = (payload.get("city") or "").strip()
+    country = (payload.get("country") or "").strip()
+    theme_name = (payload.get("theme") or "feature_based").strip()
 
-    return jsonify({"job_id": job_id, "queue_position": job["queue_position"]})
+    try:
+        distance = int(payload.get("distance") or 29000)
+        width = int(payload.get("width") or preview.PREVIEW_DEFAULT_WIDTH)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Distance and width must be numbers."}), 400
+
+    lat = payload.get("lat")
+    lng = payload.get("lng")
+    if lat is not None and lng is not None:
+        try:
+            lat = float(lat)
+            lng = float(lng)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Latitude and longitude must be numbers."}), 400
+        # Normalize longitude to -180 to 180 range (Leaflet can send wrapped values)
+        lng = (lng + 180) % 360 - 180
+    elif city and country:
+        try:
+            result = geocoder.default_geocoder().coordinates(city, country)
+        except geocoder.GeocoderRateLimited:
+            return jsonify({"error": "Geocoder is busy, try again shortly."}), 429
+        if not result:
+            return jsonify({"error": f"Could not find coordinates for {city}, {country}."}), 404
+        lat, lng, _ = result
+    else:
+        return jsonify({"error": "Coordinates, or city and country, are required."}), 400
+
+    # An unsaved theme from the editor can be previewed inline
+    if isinstance(payload.get("theme_data"), dict):
+        theme, _ = poster.normalize_theme(payload["theme_data"])
+    else:
+        theme = poster.THEME_STORE.get(theme_name)
+        if theme is None:
+            return jsonify({"error": f"Theme '{theme_name}' not found."}), 400
+
+    font = (payload.get("font") or "").strip() or None
+    if font and font not in poster.list_available_fonts():
+        font = None
+    pin = (payload.get("pin") or "").strip() or None
+    if pin not in (None, "marker", "heart", "star", "home", "circle"):
+        pin = None
+    aspect_ratio = (payload.get("aspect_ratio") or "").strip() or "2:3"
+    if aspect_ratio not in poster.ASPECT_RATIOS:
+        aspect_ratio = "2:3"
+
+    remaining = preview.PREVIEW_BUDGET_SECONDS - (time.perf_counter() - started)
+    try:
+        geometry = preview.default_cache().get(lat, lng, distance, wait=max(remaining, 0))
+    except preview.PreviewNotCached:
+        return jsonify({"error": "Map data for this area is not cached yet.", "cached": False}), 409
+    except preview.PreviewPending:
+        response = jsonify({"pending": True})
+        response.status_code = 202
+        response.headers["Retry-After"] = "1"
+        return response
+
+    image = preview.render_preview(
+        geometry, theme, city or "", country or "", (lat, lng), width=width, font_family=font,
+        tagline=(payload.get("tagline") or "").strip() or None, pin=pin,
+        pin_color=(payload.get("pin_color") or "").strip() or None, aspect_ratio=aspect_ratio,
+    )
+    response = Response(image, mimetype="image/png")
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Render-Seconds"] = f"{time.perf_counter() - started:.3f}"
+    return response
+
+
+@app.route("/api/tiles/<theme_name>/<int:z>/<int:x>/<int:y>.png")
+def api_tile(theme_name, z, x, y):
+    """XYZ tile of the cached maps styled with a theme (transparent where nothing is cached)."""
+    if z > tiles.MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "Tile out of range."}), 404
+    theme = poster.THEME_STORE.get(theme_name)
+    if theme is None:
+        return jsonify({"error": f"Theme '{theme_name}' not found."}), 404
+
+    image, complete = tiles.default_renderer().render(theme_name, theme, z, x, y)
+    response = Response(image, mimetype="image/png")
+    # A tile drawn while one of its maps was still being indexed is redrawn on the next request
+    response.headers["Cache-Control"] = "public, max-age=300" if complete else "no-store"
+    return response
 
 
 @app.route("/api/jobs/<job_id>")
 def api_job_status(job_id):
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return jsonify({"error": "Job not found."}), 404
-        return jsonify(
+    job = JOB_STORE.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    payload = job_event(job)
+    payload["id"] = job_id
+    return jsonify(payload)
+
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs_list():
+    payload = []
+    for job in JOB_STORE.list():
+        payload.append(
             {
-                "id": job_id,
+                "id": job["id"],
                 "status": job["status"],
                 "stage": job["stage"],
                 "percent": job["progress"],
@@ -1459,92 +1560,156 @@ def api_job_status(job_id):
                 "output": job["output"],
                 "output_url": job["output_url"],
                 "error": job["error"],
+                "city": job["city"],
+                "country": job["country"],
+                "theme": job["theme"],
+                "distance": job["distance"],
             }
         )
-
-
-@app.route("/api/jobs", methods=["GET"])
-def api_jobs_list():
-    with JOBS_LOCK:
-        jobs = sorted(JOBS.values(), key=lambda item: item.get("created_at", 0))
-        payload = []
-        for job in jobs:
-            payload.append(
-                {
-                    "id": job["id"],
-                    "status": job["status"],
-                    "stage": job["stage"],
-                    "percent": job["progress"],
-                    "message": job["message"],
-                    "output": job["output"],
-                    "output_url": job["output_url"],
-                    "error": job["error"],
-                    "city": job["city"],
-                    "country": job["country"],
-                    "theme": job["theme"],
-                    "distance": job["distance"],
-                }
-            )
-        return jsonify(payload)
+    return jsonify(payload)
 
 
 @app.route("/api/queue")
 def api_queue_status():
     """Get current queue status."""
-    with JOBS_LOCK:
-        queued = [j for j in JOBS.values() if j["status"] == "queued"]
-        running = [j for j in JOBS.values() if j["status"] == "running"]
+    queued = JOB_STORE.queued()
+    running = JOB_STORE.list(statuses=("running",))
+
+    # Simulate the workers draining the queue to get a start/finish estimate per job
+    remaining = [job_remaining(j) or 0 for j in running]
+    etas = job_timing.schedule_eta(
+        remaining,
+        [j["estimate"] or job_timing.DEFAULT_SECONDS_PER_COST for j in queued],
+        max(MAX_CONCURRENT_JOBS, len(running)),
+    )
 
-        # Sort by creation time
-        queued.sort(key=lambda x: x.get("created_at", 0))
-        running.sort(key=lambda x: x.get("created_at", 0))
+    return jsonify({
+        "queued": [{
+            "id": j["id"],
+            "city": j["city"],
+            "country": j["country"],
+            "theme": j["theme"],
+            "position": i + 1,
+            "priority": j["priority"],
+            "estimate_seconds": j["estimate"],
+            "starts_in_seconds": etas[i][0],
+            "eta_seconds": etas[i][1],
+        } for i, j in enumerate(queued)],
+        "running": [{
+            "id": j["id"],
+            "city": j["city"],
+            "country": j["country"],
+            "theme": j["theme"],
+            "percent": j["progress"],
+            "eta_seconds": remaining[i],
+        } for i, j in enumerate(running)],
+        "queued_count": len(queued),
+        "running_count": len(running),
+        "queue_eta_seconds": max([finish for _, finish in etas] + remaining + [0]),
+    })
 
-        return jsonify({
-            "queued": [{
-                "id": j["id"],
-                "city": j["city"],
-                "country": j["country"],
-                "theme": j["theme"],
-                "position": i + 1,
-            } for i, j in enumerate(queued)],
-            "running": [{
-                "id": j["id"],
-                "city": j["city"],
-                "country": j["country"],
-                "theme": j["theme"],
-                "percent": j["progress"],
-            } for j in running],
-            "queued_count": len(queued),
-            "running_count": len(running),
-        })
 
+@app.route("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus text exposition: counters and histograms merged from every web
+    and render process, plus queue gauges read from the shared job store.
+    """
+    active = JOB_STORE.list(["queued", "running"])
+    now = time.time()
+    queued = {name: 0 for name in job_store.PRIORITIES}
+    oldest = 0.0
+    running = 0
+    for job in active:
+        if job["status"] == "queued":
+            queued[job["priority"]] += 1
+            oldest = max(oldest, now - job["created_at"])
+        else:
+            running += 1
+    extra = [
+        metrics.gauge_family(
+            "maptoposter_jobs_queued", "Jobs waiting in the queue, per priority lane.",
+            [((name,), count) for name, count in queued.items()], labels=("priority",),
+        ),
+        metrics.gauge_family("maptoposter_jobs_running", "Jobs being rendered.", [((), running)]),
+        metrics.gauge_family(
+            "maptoposter_queue_oldest_seconds", "Age of the oldest queued job.", [((), round(oldest, 3))]
+        ),
+    ]
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
 
-@app.route("/api/queue/<job_id>", methods=["DELETE"])
-def api_queue_remove(job_id):
-    """Remove a job from the queue (only if still queued)."""
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return jsonify({"error": "Job not found."}), 404
-        if job["status"] != "queued":
-            return jsonify({"error": "Can only remove queued jobs."}), 400
 
-        job["status"] = "cancelled"
-        push_event(job_id, {"status": "cancelled", "message": "Removed from queue"})
+@app.route("/api/timings")
+def api_timings():
+    """Run-time model and recent per-stage job timings, for capacity planning."""
+    limit = min(1000, max(1, request.args.get("limit", 100, type=int)))
+    return jsonify({"model": TIMING.summary(), "history": TIMING.history(limit)})
 
-    return jsonify({"ok": True})
+
+@app.route("/api/profiles")
+def api_profiles():
+    """
+    Per-stage render profiles of the most recent posters plus the median and
+    worst wall time, CPU time and RSS growth of each stage, to spot hot spots
+    and regressions.
+    """
+    limit = min(1000, max(1, request.args.get("limit", 100, type=int)))
+    profiles = []
+    for item in POSTER_INDEX.items():
+        profile = (item["config"] or {}).get("profile")
+        if profile:
+            profiles.append({"filename": item["filename"], "mtime": item["mtime"], "profile": profile})
+            if len(profiles) >= limit:
+                break
+
+    stages = {}
+    for entry in profiles:
+        for stage, values in entry["profile"]["stages"].items():
+            for key in ("wall_s", "cpu_s", "rss_growth_mb"):
+                if values.get(key) is not None:
+                    stages.setdefault(stage, {}).setdefault(key, []).append(values[key])
+    summary = {
+        stage: {
+            key: {"median": round(statistics.median(samples), 4), "max": max(samples), "samples": len(samples)}
+            for key, samples in measurements.items()
+        }
+        for stage, measurements in stages.items()
+    }
+    return jsonify({"stages": summary, "items": profiles})
+
+
+@app.route("/api/posters/<path:filename>/profile")
+def api_poster_profile(filename):
+    """Stage timings, memory and data sizes recorded when this poster was rendered."""
+    safe_name = os.path.basename(filename)
+    if safe_name != filename:
+        return jsonify({"error": "Invalid filename."}), 400
+    for item in POSTER_INDEX.items():
+        if item["filename"] == safe_name:
+            profile = (item["config"] or {}).get("profile")
+            if not profile:
+                return jsonify({"error": "No profile recorded for this poster."}), 404
+            return jsonify({"filename": safe_name, "profile": profile})
+    return jsonify({"error": "File not found."}), 404
+
+
+@app.route("/api/queue/<job_id>", methods=["DELETE"])
+@app.route("/api/jobs/<job_id>/cancel", methods=["POST"])
+def api_queue_remove(job_id):
+    """Cancel a job: queued jobs are removed, running jobs stop at their next checkpoint."""
+    if JOB_STORE.cancel(job_id, message="Removed from queue"):
+        return jsonify({"ok": True, "status": "cancelled"})
+    if JOB_STORE.request_cancel(job_id) == "cancelling":
+        return jsonify({"ok": True, "status": "cancelling"})
+    if not JOB_STORE.get(job_id):
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify({"error": "Job has already finished."}), 400
 
 
 @app.route("/api/queue/clear", methods=["POST"])
 def api_queue_clear():
     """Clear all queued jobs."""
-    with JOBS_LOCK:
-        cancelled_count = 0
-        for job_id, job in JOBS.items():
-            if job["status"] == "queued":
-                job["status"] = "cancelled"
-                push_event(job_id, {"status": "cancelled", "message": "Queue cleared"})
-                cancelled_count += 1
+    cancelled_count = JOB_STORE.cancel_all_queued(message="Queue cleared")
 
     return jsonify({"ok": True, "cancelled": cancelled_count})
 
@@ -1579,47 +1744,31 @@ def api_variations():
     collection = (payload.get("collection") or "").strip() or None
 
     batch_id = uuid.uuid4().hex
-    job_ids = []
-
-    with JOBS_LOCK:
-        # Count queued jobs for position calculation
-        queued_count = sum(1 for j in JOBS.values() if j["status"] == "queued")
-
-        for i, theme in enumerate(themes):
-            job_id = uuid.uuid4().hex
-            job = {
-                "id": job_id,
-                "batch_id": batch_id,
-                "batch_position": i + 1,
-                "batch_total": len(themes),
-                "status": "queued",
-                "stage": "queued",
-                "progress": 0,
-                "message": "Queued",
-                "output": None,
-                "output_url": None,
-                "error": None,
-                "queue": queue.Queue(),
-                "city": city,
-                "country": country,
-                "theme": theme,
-                "distance": distance,
-                "dpi": dpi,
-                "format": output_format,
-                "font": font,
-                "lat": lat,
-                "lng": lng,
-                "tagline": tagline,
-                "pin": pin,
-                "pin_color": pin_color,
-                "aspect_ratio": aspect_ratio,
-                "collection": collection,
-                "queue_position": queued_count + i + 1,
-                "created_at": uuid.uuid1().time,
-            }
-            JOBS[job_id] = job
-            JOB_QUEUE.put(job_id)
-            job_ids.append(job_id)
+    jobs = []
+    for i, theme in enumerate(themes):
+        jobs.append({
+            "id": uuid.uuid4().hex,
+            "batch_id": batch_id,
+            "batch_position": i + 1,
+            "batch_total": len(themes),
+            "city": city,
+            "country": country,
+            "theme": theme,
+            "distance": distance,
+            "dpi": dpi,
+            "format": output_format,
+            "font": font,
+            "lat": lat,
+            "lng": lng,
+            "tagline": tagline,
+            "pin": pin,
+            "pin_color": pin_color,
+            "aspect_ratio": aspect_ratio,
+            "collection": collection,
+            "priority": "batch",
+        })
+
+    job_ids = [result["job_id"] for result in submit_jobs(jobs)]
 
     return jsonify({
         "batch_id": batch_id,
@@ -1996,27 +2145,25 @@ def api_mockups_generate():
 
 @app.route("/api/jobs/<job_id>/stream")
 def api_job_stream(job_id):
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return Response("event: error\ndata: {}\n\n", mimetype="text/event-stream")
-        job_queue = job["queue"]
-
-    def event_stream():
-        while True:
-            try:
-                event = job_queue.get(timeout=1)
-            except queue.Empty:
-                with JOBS_LOCK:
-                    status = JOBS.get(job_id, {}).get("status")
-                if status in {"done", "error", "cancelled"}:
-                    break
-                continue
-            yield f"data: {json.dumps(event)}\n\n"
-            if event.get("status") in {"done", "error", "cancelled"}:
-                break
+    job = JOB_STORE.get(job_id)
+    if not job:
+        return Response("event: error\ndata: {}\n\n", mimetype="text/event-stream")
+
+    ensure_streams()
+    topic = EVENT_BUS.topic(f"job:{job_id}")
+    topic.publish(job_event(job))
+    last_event_id = request.headers.get("Last-Event-ID")
+    finished = job["status"] in job_store.FINISHED_STATUSES
+    if finished and last_event_id == topic.latest().id:
+        # Client already saw the final event; nothing left to send
+        return Response("", mimetype="text/event-stream")
 
-    return Response(event_stream(), mimetype="text/event-stream")
+    return Response(
+        counted_stream(event_bus.sse_stream(
+            topic, last_event_id, until=lambda event: event["status"] in job_store.FINISHED_STATUSES
+        ), "job"),
+        mimetype="text/event-stream",
+    )
 
 
 @app.route("/posters/<path:filename>")
@@ -2025,76 +2172,125 @@ def poster_file(filename):
 
 
 def build_posters_payload():
-    posters_dir = poster.POSTERS_DIR
-    abs_dir = os.path.abspath(posters_dir)
-    if not os.path.exists(posters_dir):
-        return {"path": abs_dir, "items": []}
-    items = []
-    valid_extensions = (".png", ".svg", ".pdf")
-    for filename in os.listdir(posters_dir):
-        # Skip thumbnails and config files
-        if "_thumb.png" in filename or "_config.json" in filename:
-            continue
-        if not filename.lower().endswith(valid_extensions):
-            continue
-        path = os.path.join(posters_dir, filename)
-        try:
-            mtime = os.path.getmtime(path)
-        except OSError:
-            mtime = 0
+    abs_dir = os.path.abspath(poster.POSTERS_DIR)
+    return {"path": abs_dir, "items": POSTER_INDEX.items()}
 
-        # Check for thumbnail
-        base_name = filename.rsplit('.', 1)[0]
-        thumb_filename = f"{base_name}_thumb.png"
-        thumb_path = os.path.join(posters_dir, thumb_filename)
-        has_thumb = os.path.exists(thumb_path)
 
-        # Check for config
-        config_filename = f"{base_name}_config.json"
-        config_path = os.path.join(posters_dir, config_filename)
-        config_data = None
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r') as f:
-                    config_data = json.load(f)
-            except:
-                pass
+# Query parameters that switch /api/posters from the full list to a filtered page
+POSTER_QUERY_PARAMS = (
+    "offset", "limit", "cursor", "theme", "city", "collection", "since", "until", "sort", "order", "thumbs",
+)
+POSTER_PAGE_MAX = 500
+# Config fields the gallery shows; the rest of a poster's config is fetched from its _config.json
+POSTER_COMPACT_CONFIG = ("city", "country", "theme", "collection", "aspect_ratio", "font", "format", "dpi")
+
+
+def parse_poster_time(value, end_of_day=False):
+    """Unix timestamp or ISO date/datetime -> Unix timestamp."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value).timestamp()
+    if end_of_day and len(value) == 10:
+        parsed += 86400 - 0.001
+    return parsed
+
+
+def compact_poster(item):
+    compact = {key: item[key] for key in ("filename", "url", "thumb_url", "mtime", "has_thumb")}
+    config = item["config"]
+    compact["config"] = {key: config.get(key) for key in POSTER_COMPACT_CONFIG} if config else None
+    return compact
+
+
+def encode_poster_cursor(item):
+    raw = json.dumps([item["filename"], item["mtime"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
 
-        items.append(
-            {
-                "filename": filename,
-                "url": f"/posters/{filename}",
-                "thumb_url": f"/posters/{thumb_filename}" if has_thumb else None,
-                "config": config_data,
-                "path": os.path.abspath(path),
-                "mtime": mtime,
-                "has_thumb": has_thumb,
-            }
-        )
-    items.sort(key=lambda item: item["mtime"], reverse=True)
-    return {"path": abs_dir, "items": items}
+
+def decode_poster_cursor(cursor):
+    filename, mtime = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return filename, float(mtime)
 
 
 @app.route("/api/posters")
 def api_posters():
-    return jsonify(build_posters_payload())
+    """
+    Without query parameters: every poster, as before.
+    With offset/limit or cursor, filters (theme, city, collection, since, until,
+    thumbs) or sort/order: one page plus total, next_cursor and the number of
+    posters in each collection.
+    fields=compact trims each item's config to the fields the gallery grid needs.
+    """
+    args = request.args
+    compact = args.get("fields") == "compact"
+    etag = hashlib.md5(
+        f"{POSTER_INDEX.etag()}?{request.query_string.decode()}".encode()
+    ).hexdigest()
+
+    if not any(key in args for key in POSTER_QUERY_PARAMS):
+        payload = build_posters_payload()
+        if compact:
+            payload["items"] = [compact_poster(item) for item in payload["items"]]
+    else:
+        try:
+            offset = max(0, int(args.get("offset", 0)))
+            limit = min(POSTER_PAGE_MAX, max(1, int(args.get("limit", 50))))
+            since = parse_poster_time(args["since"]) if args.get("since") else None
+            until = parse_poster_time(args["until"], end_of_day=True) if args.get("until") else None
+            after = decode_poster_cursor(args["cursor"]) if args.get("cursor") else None
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid offset, limit, cursor or date range."}), 400
+        sort = args.get("sort", "mtime")
+        if sort not in poster_index.SORT_KEYS:
+            return jsonify({"error": f"Sort must be one of: {', '.join(poster_index.SORT_KEYS)}"}), 400
+        order = "asc" if args.get("order") == "asc" else "desc"
+        thumbs = args.get("thumbs") in ("1", "true")
+
+        items, total = POSTER_INDEX.query(
+            offset=offset,
+            limit=limit,
+            sort=sort,
+            order=order,
+            theme=args.get("theme") or None,
+            city=args.get("city") or None,
+            collection=args.get("collection") or None,
+            since=since,
+            until=until,
+            after=after,
+            thumbs=thumbs,
+        )
+        next_cursor = None
+        if items and (after is not None or offset + len(items) < total):
+            next_cursor = encode_poster_cursor(items[-1])
+        payload = {
+            "path": os.path.abspath(poster.POSTERS_DIR),
+            "items": [compact_poster(item) for item in items] if compact else items,
+            "total": total,
+            "offset": offset if after is None else None,
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "collections": POSTER_INDEX.collection_counts(thumbs=thumbs),
+        }
+
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 
 @app.route("/api/posters/stream")
 def api_posters_stream():
-    def event_stream():
-        last_signature = None
-        while True:
-            payload = build_posters_payload()
-            signature = "|".join(
-                f"{item['filename']}:{item['mtime']}" for item in payload["items"]
-            )
-            if signature != last_signature:
-                last_signature = signature
-                yield f"data: {json.dumps(payload)}\n\n"
-            time.sleep(2)
-
-    return Response(event_stream(), mimetype="text/event-stream")
+    ensure_streams()
+    topic = EVENT_BUS.topic("posters")
+    if not topic.subscribers:
+        # The producer idles without subscribers, so bring the snapshot up to date
+        topic.publish({"etag": POSTER_INDEX.etag()})
+    return Response(
+        counted_stream(event_bus.sse_stream(topic, request.headers.get("Last-Event-ID")), "posters"),
+        mimetype="text/event-stream",
+    )
 
 
 @app.route("/api/posters/open", methods=["POST"])
@@ -2122,11 +2318,25 @@ def api_examples():
     return Response(content, mimetype="text/plain")
 
 
+# Latest search-as-you-type query number per browser session, so older ones can give up
+SEARCH_SESSIONS = collections.OrderedDict()
+SEARCH_SESSIONS_LOCK = threading.Lock()
+SEARCH_SESSIONS_MAX = 10000
+
+
+def supersede_searches(session):
+    """Register a new query for session; returns cancelled() for it, true once a newer query arrives."""
+    with SEARCH_SESSIONS_LOCK:
+        generation = SEARCH_SESSIONS.pop(session, 0) + 1
+        SEARCH_SESSIONS[session] = generation
+        while len(SEARCH_SESSIONS) > SEARCH_SESSIONS_MAX:
+            SEARCH_SESSIONS.popitem(last=False)
+    return lambda: SEARCH_SESSIONS.get(session) != generation
+
+
 @app.route("/api/geocode/reverse")
 def api_geocode_reverse():
     """Reverse geocode lat/lng to city/country names."""
-    from geopy.geocoders import Nominatim
-
     lat = request.args.get("lat", type=float)
     lng = request.args.get("lng", type=float)
 
@@ -2134,11 +2344,10 @@ def api_geocode_reverse():
         return jsonify({"error": "lat and lng parameters are required"}), 400
 
     try:
-        geolocator = Nominatim(user_agent="maptoposter_web")
-        location = geolocator.reverse((lat, lng), language="en", timeout=10)
+        location = geocoder.default_geocoder().reverse(lat, lng, language="en", max_wait=geocoder.INTERACTIVE_WAIT)
 
         if location:
-            addr = location.raw.get("address", {})
+            addr = location["raw"].get("address", {})
             # Try multiple address fields for city name
             city = (
                 addr.get("city")
@@ -2152,7 +2361,7 @@ def api_geocode_reverse():
             return jsonify({
                 "city": city,
                 "country": country,
-                "display": location.address,
+                "display": location["display"],
                 "lat": lat,
                 "lng": lng
             })
@@ -2163,6 +2372,8 @@ def api_geocode_reverse():
             "lat": lat,
             "lng": lng
         })
+    except geocoder.GeocoderRateLimited as exc:
+        return jsonify({"error": str(exc)}), 429
     except Exception as exc:
         return jsonify({"error": str(exc)}), 500
 
@@ -2170,27 +2381,28 @@ def api_geocode_reverse():
 @app.route("/api/geocode/search")
 def api_geocode_search():
     """Forward geocode search - find locations by name for map panning."""
-    from geopy.geocoders import Nominatim
-
     query = request.args.get("q", "").strip()
     limit = request.args.get("limit", 5, type=int)
 
     if not query or len(query) < 2:
         return jsonify({"results": []})
 
+    # The page sends a per-tab session id; fall back to the client address
+    cancelled = supersede_searches(request.args.get("session") or client_id())
+
     try:
-        geolocator = Nominatim(user_agent="maptoposter_web")
-        locations = geolocator.geocode(
+        locations = geocoder.default_geocoder().search(
             query,
-            exactly_one=False,
-            limit=min(limit, 10),
+            limit=max(1, min(limit, 10)),
             language="en",
-            timeout=10
+            max_wait=geocoder.INTERACTIVE_WAIT,
+            cancelled=cancelled,
+            autocomplete=True,
         )
 
         results = []
-        for loc in (locations or []):
-            addr = loc.raw.get("address", {})
+        for loc in locations:
+            addr = loc["raw"].get("address", {})
             city = (
                 addr.get("city")
                 or addr.get("town")
@@ -2199,15 +2411,19 @@ def api_geocode_search():
                 or ""
             )
             results.append({
-                "display": loc.address,
-                "lat": loc.latitude,
-                "lng": loc.longitude,
+                "display": loc["display"],
+                "lat": loc["lat"],
+                "lng": loc["lng"],
                 "city": city,
                 "country": addr.get("country", ""),
-                "type": loc.raw.get("type", ""),
+                "type": loc["raw"].get("type", ""),
             })
 
         return jsonify({"results": results})
+    except geocoder.Superseded:
+        return jsonify({"results": [], "superseded": True}), 409
+    except geocoder.GeocoderRateLimited as exc:
+        return jsonify({"error": str(exc), "results": []}), 429
     except Exception as exc:
         return jsonify({"error": str(exc), "results": []}), 500
 
@@ -2361,5 +2577,15 @@ def create_composite():
 
 
 if __name__ == "__main__":
-    ensure_worker()
-    app.run(debug=True, use_reloader=False)
+    if "--worker" in sys.argv:
+        # Dedicated render worker: claim jobs from the shared store, no web server
+        if hasattr(os, "fork"):
+            # Warm daemon that forks a process per job (see render_worker.py)
+            import render_worker
+
+            sys.exit(render_worker.serve(MAX_CONCURRENT_JOBS))
+        for worker in start_workers():
+            worker.join()
+    else:
+        ensure_worker()
+        app.run(debug=True, use_reloader=False)
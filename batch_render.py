@@ -0,0 +1,377 @@
+"""
+Batch Renderer for MapToPoster
+Renders every poster in a CSV or JSON manifest from one long-lived process.
+
+Running create_map_poster.py once per city pays for importing osmnx,
+geopandas, matplotlib and shapely, discovering fonts and opening the caches
+on every poster. A batch pays for that once: posters are rendered by a fixed
+set of workers (threads in this process, or long-lived worker processes from
+job_runner) that keep the themes, fonts, map cache and geocode cache warm
+between posters.
+
+A CSV manifest has a header row; themes, formats and DPIs may list several
+values separated by ";" or "|", and every combination is rendered:
+
+    city,country,themes,formats,dpi,distance
+    Paris,France,noir;blueprint,png;svg,300,10000
+    Venice,Italy,ocean,png,150,4000
+
+A JSON manifest is a list of objects with the same keys (lists allowed), or
+{"defaults": {...}, "posters": [...]}. Optional keys: lat, lng, font,
+tagline, aspect_ratio. Missing values fall back to the command-line options.
+
+At the end a summary is printed and a JSON report with per-poster timings,
+outputs and errors is written (posters/batch_report_<timestamp>.json).
+"""
+
+import csv
+import json
+import os
+import queue
+import re
+import statistics
+import threading
+import time
+from datetime import datetime
+
+import create_map_poster as poster
+import geocoder
+import job_runner
+
+FORMATS = ("png", "svg", "pdf", "svg-laser")
+
+# Keys that may hold several values; every combination becomes one poster
+LIST_KEYS = {"theme": "themes", "format": "formats", "dpi": "dpis"}
+
+# Stages reported in the summary, slowest median first
+SUMMARY_STAGES = 5
+
+_SEPARATORS = re.compile(r"[;|]")
+
+
+class ManifestError(ValueError):
+    """The manifest can't be read or describes an invalid poster."""
+
+
+def _values(entry, key):
+    """The values of a single/plural key pair ("theme"/"themes") as a list."""
+    value = entry.get(LIST_KEYS[key])
+    if value in (None, ""):
+        value = entry.get(key)
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in _SEPARATORS.split(value) if part.strip()]
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _number(value, kind, name, where):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ManifestError(f"{where}: {name} must be a number, got {value!r}")
+
+
+def read_manifest(path):
+    """Raw manifest entries (dicts) and the manifest's own defaults."""
+    try:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            if path.lower().endswith(".json"):
+                data = json.load(f)
+            else:
+                return [dict(row) for row in csv.DictReader(f)], {}
+    except OSError as e:
+        raise ManifestError(f"Could not read manifest {path}: {e}")
+    except json.JSONDecodeError as e:
+        raise ManifestError(f"Invalid JSON in {path}: {e}")
+    if isinstance(data, dict):
+        return data.get("posters") or [], data.get("defaults") or {}
+    if isinstance(data, list):
+        return data, {}
+    raise ManifestError(f"{path}: expected a list of posters or an object with 'posters'")
+
+
+def expand(entries, defaults):
+    """
+    One poster dict (the keyword arguments of job_runner.run_job) per
+    city × theme × format × DPI combination, validated up front so a typo
+    fails the batch before hours of rendering rather than halfway through.
+    """
+    available_themes = set(poster.get_available_themes())
+    posters = []
+    seen = set()
+    for number, entry in enumerate(entries, start=1):
+        where = f"Entry {number}"
+        if not isinstance(entry, dict):
+            raise ManifestError(f"{where}: expected an object, got {entry!r}")
+        entry = {key.strip().lower(): value for key, value in entry.items() if key}
+        merged = dict(defaults)
+        merged.update({key: value for key, value in entry.items() if value not in (None, "")})
+        for key in LIST_KEYS:
+            if _values(entry, key):
+                # A manifest's theme list replaces the default theme rather than adding to it
+                merged.pop(LIST_KEYS[key], None)
+                merged[key] = _values(entry, key)
+
+        city = str(merged.get("city") or "").strip()
+        country = str(merged.get("country") or "").strip()
+        if not city or not country:
+            raise ManifestError(f"{where}: city and country are required")
+        where = f"{where} ({city}, {country})"
+
+        themes = _values(merged, "theme")
+        unknown = [theme for theme in themes if theme not in available_themes]
+        if unknown:
+            raise ManifestError(f"{where}: unknown theme(s) {', '.join(unknown)}")
+        formats = [str(fmt).lower() for fmt in _values(merged, "format")]
+        invalid = [fmt for fmt in formats if fmt not in FORMATS]
+        if invalid:
+            raise ManifestError(f"{where}: unknown format(s) {', '.join(invalid)}; use {', '.join(FORMATS)}")
+        dpis = [_number(dpi, int, "dpi", where) for dpi in _values(merged, "dpi")]
+        if any(dpi < 72 or dpi > 600 for dpi in dpis):
+            raise ManifestError(f"{where}: dpi must be between 72 and 600")
+        distance = _number(merged.get("distance"), int, "distance", where)
+        if distance <= 0:
+            raise ManifestError(f"{where}: distance must be positive")
+        aspect_ratio = str(merged.get("aspect_ratio") or "2:3")
+        if aspect_ratio not in poster.ASPECT_RATIOS:
+            raise ManifestError(f"{where}: unknown aspect ratio {aspect_ratio}")
+        lat, lng = merged.get("lat"), merged.get("lng")
+        if (lat is None) != (lng is None):
+            raise ManifestError(f"{where}: give both lat and lng, or neither")
+        if lat is not None:
+            lat, lng = _number(lat, float, "lat", where), _number(lng, float, "lng", where)
+
+        for theme in themes:
+            for output_format in formats:
+                for dpi in dpis:
+                    job = {
+                        "city": city,
+                        "country": country,
+                        "theme": theme,
+                        "distance": distance,
+                        "dpi": dpi,
+                        "output_format": output_format,
+                        "lat": lat,
+                        "lng": lng,
+                        "font": merged.get("font") or None,
+                        "tagline": merged.get("tagline") or None,
+                        "aspect_ratio": aspect_ratio,
+                    }
+                    key = json.dumps(job, sort_keys=True)
+                    if key not in seen:
+                        seen.add(key)
+                        posters.append(job)
+    return posters
+
+
+def load_manifest(path, defaults):
+    """Validated poster list for a manifest file, with defaults for missing values."""
+    entries, manifest_defaults = read_manifest(path)
+    merged = dict(defaults)
+    merged.update({key.lower(): value for key, value in manifest_defaults.items()})
+    return expand(entries, merged)
+
+
+def geocode(posters):
+    """
+    Fill in lat/lng for posters without coordinates, looking each city up
+    once. Returns {(city, country): error} for places that couldn't be found.
+    """
+    places = {(job["city"], job["country"]) for job in posters if job["lat"] is None}
+    found, errors = {}, {}
+    lookup = geocoder.default_geocoder()
+    for city, country in sorted(places):
+        try:
+            result = lookup.coordinates(city, country)
+        except Exception as e:
+            errors[(city, country)] = f"Geocoding failed: {e}"
+            continue
+        if result is None:
+            errors[(city, country)] = f"Could not find coordinates for {city}, {country}"
+        else:
+            found[(city, country)] = result[:2]
+    for job in posters:
+        if job["lat"] is None and (job["city"], job["country"]) in found:
+            job["lat"], job["lng"] = found[(job["city"], job["country"])]
+    return errors
+
+
+def _profile(output_file):
+    """The stage profile run_job saved next to an output, or None."""
+    try:
+        with open(output_file.rsplit(".", 1)[0] + "_config.json", "r") as f:
+            return json.load(f).get("profile")
+    except (OSError, ValueError):
+        return None
+
+
+def render(runner, job_id, job, cancel):
+    """Render one poster through runner and describe the outcome."""
+    outcome = {"status": "error", "error": "Worker exited without a result"}
+
+    def emit(_job_id, payload):
+        if payload.get("status") in ("done", "error", "cancelled"):
+            outcome.clear()
+            outcome.update(status=payload["status"], output=payload.get("output"), error=payload.get("error"))
+
+    started = time.perf_counter()
+    try:
+        runner.run(job_id, job, emit, is_cancelled=cancel.is_set)
+    except Exception as e:
+        outcome = {"status": "error", "error": str(e)}
+    result = {
+        "status": outcome["status"],
+        "seconds": round(time.perf_counter() - started, 3),
+        "output": outcome.get("output"),
+        "error": outcome.get("error"),
+    }
+    if result["status"] == "done" and result["output"]:
+        profile = _profile(result["output"])
+        if profile:
+            result["render_seconds"] = profile.get("total_wall_s")
+            result["max_rss_mb"] = profile.get("max_rss_mb")
+            result["stages"] = {stage: values["wall_s"] for stage, values in profile.get("stages", {}).items()}
+    return result
+
+
+def _label(job):
+    return f"{job['city']}, {job['country']} [{job['theme']} {job['output_format']} {job['dpi']}dpi]"
+
+
+def run_batch(posters, workers=1, executor=None, report_path=None):
+    """
+    Render posters with `workers` workers and write the report. executor is
+    "thread" (renders share this process) or "process" (one long-lived
+    job_runner worker process per worker); the default is threads for a
+    single worker and processes otherwise, since renders are CPU bound.
+    Returns the report dict.
+    """
+    workers = max(1, min(workers, len(posters) or 1))
+    executor = executor or ("thread" if workers == 1 else "process")
+    started_at = datetime.now()
+    started = time.perf_counter()
+
+    poster.log(f"Geocoding {len({(job['city'], job['country']) for job in posters})} place(s)...")
+    errors = geocode(posters)
+    results = [None] * len(posters)
+    for index, job in enumerate(posters):
+        error = errors.get((job["city"], job["country"]))
+        if error and job["lat"] is None:
+            results[index] = {"status": "error", "seconds": 0.0, "output": None, "error": error}
+
+    pending = queue.Queue()
+    for index, result in enumerate(results):
+        if result is None:
+            pending.put(index)
+    total = pending.qsize()
+    # stop: take no more posters; cancel: also abandon the ones in progress
+    stop = threading.Event()
+    cancel = threading.Event()
+    print_lock = threading.Lock()
+    finished = [0]
+
+    # Worker output would interleave with the progress lines, so renders run quietly
+    os.environ["MAPTOPOSTER_QUIET"] = "1"
+    poster.set_quiet(True)
+    runner = job_runner.ProcessRunner() if executor == "process" else job_runner.ThreadRunner()
+    print(f"Rendering {total} poster(s) with {workers} {executor} worker(s)", flush=True)
+
+    def dispatch(worker):
+        while not stop.is_set():
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            job = posters[index]
+            result = render(runner, f"batch-{worker}-{index}", job, cancel)
+            results[index] = result
+            with print_lock:
+                finished[0] += 1
+                mark = "✓" if result["status"] == "done" else "✗"
+                detail = f"{result['seconds']:.1f}s" if result["status"] == "done" else result["error"]
+                print(f"[{finished[0]}/{total}] {mark} {_label(job)} {detail}", flush=True)
+
+    threads = [threading.Thread(target=dispatch, args=(worker,), daemon=True) for worker in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        print("\nInterrupted: stopping after the posters in progress (Ctrl-C again to cancel them)...", flush=True)
+        stop.set()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            print("\nCancelling the posters in progress...", flush=True)
+            cancel.set()
+            for thread in threads:
+                thread.join()
+    finally:
+        runner.shutdown()
+        poster.set_quiet(False)
+
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {"status": "skipped", "seconds": 0.0, "output": None, "error": None}
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "workers": workers,
+        "executor": executor,
+        "total": len(posters),
+        "rendered": sum(result["status"] == "done" for result in results),
+        "failed": sum(result["status"] == "error" for result in results),
+        "skipped": sum(result["status"] in ("skipped", "cancelled") for result in results),
+        "posters": [dict(job, **result) for job, result in zip(posters, results)],
+    }
+    if report_path is None:
+        os.makedirs(poster.POSTERS_DIR, exist_ok=True)
+        report_path = os.path.join(poster.POSTERS_DIR, f"batch_report_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    report["path"] = report_path
+    return report
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def print_summary(report):
+    """Human-readable summary of a batch report."""
+    minutes, seconds = divmod(report["wall_seconds"], 60)
+    print("\n" + "=" * 50)
+    print(f"Batch finished in {int(minutes)}m {seconds:.0f}s: {report['rendered']} rendered, "
+          f"{report['failed']} failed, {report['skipped']} skipped "
+          f"({report['workers']} {report['executor']} worker(s))")
+    done = [item for item in report["posters"] if item["status"] == "done"]
+    if done:
+        times = [item["seconds"] for item in done]
+        rate = len(done) / report["wall_seconds"] * 60 if report["wall_seconds"] else 0.0
+        print(f"Per poster: median {statistics.median(times):.1f}s, p95 {_percentile(times, 0.95):.1f}s, "
+              f"max {max(times):.1f}s ({rate:.1f} posters/min)")
+        stages = {}
+        for item in done:
+            for stage, value in (item.get("stages") or {}).items():
+                stages.setdefault(stage, []).append(value)
+        medians = sorted(((statistics.median(values), stage) for stage, values in stages.items()), reverse=True)
+        if medians:
+            print("Slowest stages (median): " + ", ".join(f"{stage} {value:.2f}s" for value, stage in medians[:SUMMARY_STAGES]))
+        slowest = max(done, key=lambda item: item["seconds"])
+        print(f"Slowest poster: {_label(slowest)} {slowest['seconds']:.1f}s")
+    failed = [item for item in report["posters"] if item["status"] == "error"]
+    if failed:
+        print("Failures:")
+        for item in failed:
+            print(f"  ✗ {_label(item)}: {item['error']}")
+    print(f"Report: {report['path']}")
+    print("=" * 50)
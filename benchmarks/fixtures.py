@@ -0,0 +1,265 @@
+"""
+Benchmark fixtures for MapToPoster
+Map datasets in the map cache format ({"graph", "water", "parks", "coastlines"}),
+so create_poster renders them without touching the network.
+
+Synthetic datasets are generated from a fixed seed and scale with --size:
+  grid     dense street grid with a road hierarchy, parks and a lake
+  coastal  grid cut by a winding coastline, with sea to the south
+  sprawl   sparse tree-like network of curved roads between small towns
+
+Recorded datasets are real map cache entries copied into benchmarks/data/ with
+`run.py --record` (see README.md).
+"""
+
+import json
+import math
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+from scipy.spatial import Delaunay
+from shapely.geometry import LineString, Point, box
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MANIFEST = os.path.join(DATA_DIR, "recorded.json")
+
+SEED = 1234
+
+# Half-width of the dataset in meters; node density stays constant across sizes
+SIZES = {"small": 1500, "medium": 3000, "large": 6000}
+
+METERS_PER_DEGREE = 111320.0
+
+
+def _projector(lat, lon):
+    """Convert local (east, north) meter offsets around lat/lon to (lon, lat)."""
+    meters_per_lon = METERS_PER_DEGREE * math.cos(math.radians(lat))
+
+    def to_lonlat(x, y):
+        return lon + x / meters_per_lon, lat + y / METERS_PER_DEGREE
+
+    return to_lonlat
+
+
+def _graph(lonlat, positions, edges):
+    """
+    osmnx-style MultiDiGraph: nodes with x/y, every road in both directions.
+    edges is a list of (u, v, highway, [intermediate (x, y) meter points]).
+    """
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    for node, (x, y) in enumerate(positions):
+        lon, lat = lonlat(x, y)
+        G.add_node(node, x=lon, y=lat)
+    for osmid, (u, v, highway, bends) in enumerate(edges, start=1):
+        points = [positions[u]] + list(bends) + [positions[v]]
+        length = sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+        attrs = {"osmid": osmid, "highway": highway, "length": round(length, 1), "oneway": False}
+        geometry = LineString([lonlat(x, y) for x, y in points]) if bends else None
+        for a, b, reverse in ((u, v, False), (v, u, True)):
+            edge = dict(attrs, reversed=reverse)
+            if geometry is not None:
+                edge["geometry"] = LineString(geometry.coords[::-1]) if reverse else geometry
+            G.add_edge(a, b, **edge)
+    return G
+
+
+def _frame(lonlat, geometries):
+    if not geometries:
+        return None
+    shapes = []
+    for geom in geometries:
+        if geom.geom_type == "LineString":
+            shapes.append(LineString([lonlat(x, y) for x, y in geom.coords]))
+        else:
+            shapes.append(type(geom)([lonlat(x, y) for x, y in geom.exterior.coords]))
+    return gpd.GeoDataFrame(geometry=shapes, crs="EPSG:4326")
+
+
+def _grid_highway(index):
+    if index % 12 == 0:
+        return "primary"
+    if index % 6 == 0:
+        return "secondary"
+    if index % 3 == 0:
+        return "tertiary"
+    return "residential"
+
+
+def _grid(half, spacing, keep=lambda x, y: True):
+    """Street grid positions and edges, skipping nodes where keep(x, y) is false."""
+    steps = int(2 * half / spacing) + 1
+    index = {}
+    positions = []
+    for row in range(steps):
+        for col in range(steps):
+            x, y = -half + col * spacing, -half + row * spacing
+            if keep(x, y):
+                index[(row, col)] = len(positions)
+                positions.append((x, y))
+    edges = []
+    for (row, col), node in index.items():
+        if (row, col + 1) in index:
+            edges.append((node, index[(row, col + 1)], _grid_highway(row), ()))
+        if (row + 1, col) in index:
+            edges.append((node, index[(row + 1, col)], _grid_highway(col), ()))
+    return positions, edges
+
+
+def make_grid(half, rng):
+    lat, lon = 40.7580, -73.9855
+    lonlat = _projector(lat, lon)
+    spacing = 80
+    positions, edges = _grid(half, spacing)
+    # A motorway across the grid on its own alignment
+    start = len(positions)
+    motorway = [(-half + i * 400, -half * 0.6 + i * 400 * 0.4) for i in range(int(2 * half / 400) + 1)]
+    positions.extend(motorway)
+    edges.extend((start + i, start + i + 1, "motorway", ()) for i in range(len(motorway) - 1))
+
+    parks = []
+    for _ in range(max(4, int(half / 300))):
+        x, y = rng.uniform(-half, half, 2)
+        parks.append(box(x, y, x + spacing * rng.integers(1, 4), y + spacing * rng.integers(1, 3)))
+    water = [Point(half * 0.4, half * 0.3).buffer(half * 0.08, quad_segs=32)]
+    return {
+        "lat": lat, "lon": lon,
+        "graph": _graph(lonlat, positions, edges),
+        "water": _frame(lonlat, water),
+        "parks": _frame(lonlat, parks),
+        "coastlines": None,
+    }
+
+
+def make_coastal(half, rng):
+    lat, lon = 38.7223, -9.1393
+    lonlat = _projector(lat, lon)
+
+    def coast_y(x):
+        return -half * 0.2 + half * 0.15 * math.sin(x / half * 3)
+
+    positions, edges = _grid(half, 90, keep=lambda x, y: y > coast_y(x) + 40)
+    # Coastlines run with the sea on their right: west to east keeps the sea south
+    xs = np.linspace(-half * 1.2, half * 1.2, 400)
+    coastline = LineString([(x, coast_y(x)) for x in xs])
+    river = LineString([(-half * 0.1, coast_y(-half * 0.1)), (half * 0.1, half * 1.1)]).buffer(60)
+    parks = [Point(x, y).buffer(150, quad_segs=16) for x, y in rng.uniform(-half * 0.2, half, (6, 2))]
+    return {
+        "lat": lat, "lon": lon,
+        "graph": _graph(lonlat, positions, edges),
+        "water": _frame(lonlat, [river]),
+        "parks": _frame(lonlat, parks),
+        "coastlines": _frame(lonlat, [coastline]),
+    }
+
+
+def make_sprawl(half, rng):
+    lat, lon = 29.7604, -95.3698
+    lonlat = _projector(lat, lon)
+    towns = rng.uniform(-half * 0.8, half * 0.8, (max(3, int(half / 600)), 2))
+    count = int((2 * half / 1000) ** 2 * 120)
+    centers = towns[rng.integers(0, len(towns), count)]
+    points = centers + rng.normal(0, half * 0.15, (count, 2))
+    points = np.clip(points, -half, half)
+
+    # Roads: a spanning tree over the Delaunay triangulation plus a few loops
+    triangles = Delaunay(points).simplices
+    pairs = {tuple(sorted((a, b))) for tri in triangles for a, b in ((tri[0], tri[1]), (tri[1], tri[2]), (tri[0], tri[2]))}
+    pairs = np.array(sorted(pairs))
+    lengths = np.linalg.norm(points[pairs[:, 0]] - points[pairs[:, 1]], axis=1)
+    weights = coo_matrix((lengths, (pairs[:, 0], pairs[:, 1])), shape=(count, count))
+    tree = minimum_spanning_tree(weights).tocoo()
+    chosen = set(zip(tree.row.tolist(), tree.col.tolist()))
+    extra = pairs[lengths < np.percentile(lengths, 20)]
+    chosen.update(tuple(pair) for pair in extra[rng.random(len(extra)) < 0.25].tolist())
+
+    edges = []
+    for u, v in sorted(chosen):
+        a, b = points[u], points[v]
+        length = float(np.linalg.norm(b - a))
+        highway = "secondary" if length > 900 else "tertiary" if length > 500 else "residential"
+        normal = np.array([a[1] - b[1], b[0] - a[0]]) / max(length, 1.0)
+        bends = [tuple(a + (b - a) * t + normal * length * 0.08 * math.sin(math.pi * t) * rng.uniform(0.5, 1.5))
+                 for t in (0.2, 0.4, 0.6, 0.8)]
+        edges.append((u, v, highway, bends))
+
+    parks = [Point(x, y).buffer(rng.uniform(100, 300), quad_segs=16) for x, y in rng.uniform(-half, half, (8, 2))]
+    water = [Point(x, y).buffer(rng.uniform(150, 400), quad_segs=32) for x, y in rng.uniform(-half, half, (3, 2))]
+    return {
+        "lat": lat, "lon": lon,
+        "graph": _graph(lonlat, [tuple(p) for p in points], edges),
+        "water": _frame(lonlat, water),
+        "parks": _frame(lonlat, parks),
+        "coastlines": None,
+    }
+
+
+SYNTHETIC = {
+    "grid": (make_grid, "Dense street grid with parks and a lake"),
+    "coastal": (make_coastal, "Grid cut by a winding coastline"),
+    "sprawl": (make_sprawl, "Sparse curved roads between small towns"),
+}
+
+
+def recorded():
+    """Manifest of recorded datasets: {name: {lat, lon, distance, description, file}}."""
+    try:
+        with open(MANIFEST, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def available():
+    """Names of every dataset that can be loaded: synthetic first, then recorded."""
+    return list(SYNTHETIC) + sorted(recorded())
+
+
+def load(name, size="medium"):
+    """
+    Dataset dict: name, lat, lon, distance, description and data (a map cache
+    entry ready to be written where create_poster looks for it).
+    """
+    if name in SYNTHETIC:
+        make, description = SYNTHETIC[name]
+        half = SIZES[size]
+        generated = make(half, np.random.default_rng(SEED))
+        return {
+            "name": name,
+            "lat": generated.pop("lat"),
+            "lon": generated.pop("lon"),
+            "distance": half,
+            "description": f"{description} ({size})",
+            "data": dict(generated, cached_at="synthetic"),
+        }
+    entry = recorded().get(name)
+    if entry is None:
+        raise KeyError(f"Unknown dataset '{name}'. Available: {', '.join(available())}")
+    with open(os.path.join(DATA_DIR, entry["file"]), "rb") as f:
+        data = pickle.load(f)
+    return dict(entry, name=name, data=data)
+
+
+def record(name, source_file, lat, lon, distance, description=""):
+    """Copy a map cache entry into benchmarks/data/ and add it to the manifest."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filename = f"{name}.pkl"
+    shutil.copyfile(source_file, os.path.join(DATA_DIR, filename))
+    manifest = recorded()
+    manifest[name] = {
+        "lat": lat,
+        "lon": lon,
+        "distance": distance,
+        "description": description,
+        "file": filename,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest[name]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+MapToPoster import-time budget check
+
+Imports each entry-point module in a fresh interpreter and fails if it takes
+longer than its budget, or if it loads one of the heavy rendering dependencies
+that are meant to be imported only when a render or download needs them.
+That keeps --list-themes, --clear-cache and the web app's startup fast.
+
+Examples:
+  python benchmarks/imports.py                  # check every module
+  python benchmarks/imports.py --scale 2        # double every budget (slow CI machines)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Seconds each module may take to import, measured inside the interpreter (startup excluded)
+BUDGETS = {
+    "create_map_poster": 0.5,
+    "job_runner": 0.5,
+    "geocoder": 0.3,
+    "app": 0.8,
+}
+
+# Loaded on first render or download, never at import
+LAZY_MODULES = ("osmnx", "geopandas", "pandas", "networkx", "matplotlib", "scipy", "geopy")
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+loaded = sorted({{name.split(".")[0] for name in sys.modules}} & set({lazy!r}))
+print(json.dumps({{"seconds": seconds, "loaded": loaded}}))
+"""
+
+
+def probe(module):
+    """Import time and the lazy modules that module loaded, in a fresh interpreter."""
+    env = dict(os.environ, MPLBACKEND="Agg", MAPTOPOSTER_EMBEDDED_WORKER="0")
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(repo=REPO_DIR, module=module, lazy=LAZY_MODULES)],
+        capture_output=True, text=True, env=env, cwd=REPO_DIR,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check MapToPoster's import-time budgets.")
+    parser.add_argument("--modules", nargs="+", choices=sorted(BUDGETS), default=list(BUDGETS),
+                        help="Modules to check (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per module; times are medians (default: 3)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget by this factor")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        runs = [probe(module) for _ in range(args.repeat)]
+        seconds = statistics.median(run["seconds"] for run in runs)
+        budget = BUDGETS[module] * args.scale
+        loaded = runs[0]["loaded"]
+        status = "ok"
+        if seconds > budget:
+            status = "OVER BUDGET"
+            failures.append(f"{module} took {seconds:.3f}s (budget {budget:.3f}s)")
+        if loaded:
+            status = "EAGER IMPORTS"
+            failures.append(f"{module} imported {', '.join(loaded)}")
+        print(f"{module:<20} {seconds:>7.3f}s  budget {budget:.3f}s  {status}")
+
+    if failures:
+        print(f"\n{len(failures)} failure(s):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+MapToPoster benchmark runner
+
+Renders fixed datasets (see fixtures.py) through create_poster, export_laser_svg,
+create_ocean_polygon and generate_mockup, reports time and memory per stage and
+compares the results with a stored baseline. No network access is needed or
+allowed: each case runs in its own process with sockets disabled, which also
+keeps peak-RSS readings from one case out of the next.
+
+Examples:
+  python benchmarks/run.py                          # everything, compared with baseline.json
+  python benchmarks/run.py --datasets grid --cases poster --size small
+  python benchmarks/run.py --save-baseline          # store this run as the new baseline
+  python benchmarks/run.py --record manhattan --lat 40.758 --lon -73.9855 --distance 4000
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+CASES = ("poster", "laser", "ocean", "mockup")
+
+# Prefix of the result line a case process prints after the render's own output
+RESULT_MARKER = "BENCH_RESULT "
+
+# Differences below these are treated as noise regardless of the ratio
+MIN_SECONDS_DELTA = 0.05
+MIN_RSS_DELTA_MB = 20.0
+
+
+def block_network():
+    """Make any connection attempt fail loudly instead of silently downloading."""
+    def refuse(*args, **kwargs):
+        raise RuntimeError("Benchmarks run offline, but a network connection was attempted")
+
+    socket.socket.connect = refuse
+    socket.create_connection = refuse
+
+
+# --- Case process ---
+
+def summarize(profiles):
+    """Median time and worst memory over repeated RenderProfile dicts."""
+    stages = {}
+    for name in profiles[0]["stages"]:
+        runs = [profile["stages"][name] for profile in profiles if name in profile["stages"]]
+        stage = {
+            "wall_s": round(statistics.median(run["wall_s"] for run in runs), 4),
+            "cpu_s": round(statistics.median(run["cpu_s"] for run in runs), 4),
+        }
+        for key in ("rss_growth_mb", "py_peak_mb"):
+            values = [run[key] for run in runs if run.get(key) is not None]
+            if values:
+                stage[key] = max(values)
+        stages[name] = stage
+    rss = [profile["max_rss_mb"] for profile in profiles if profile.get("max_rss_mb") is not None]
+    return {
+        "total_wall_s": round(statistics.median(profile["total_wall_s"] for profile in profiles), 4),
+        "total_cpu_s": round(statistics.median(profile["total_cpu_s"] for profile in profiles), 4),
+        "max_rss_mb": max(rss) if rss else None,
+        "stages": stages,
+        "sizes": profiles[0]["sizes"],
+    }
+
+
+def run_case(case, dataset_name, size, dpi, theme, repeat):
+    """Run one benchmark case in this process and return its summary."""
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+    block_network()
+
+    import create_map_poster as poster
+    import fixtures
+    from instrumentation import RenderProfile
+
+    workdir = tempfile.mkdtemp(prefix="maptoposter-bench-")
+    # Serve the dataset from a private map cache so create_poster never downloads
+    poster.MAP_CACHE_DIR = workdir
+    dataset = fixtures.load(dataset_name, size)
+    data = dataset["data"]
+    poster.save_map_cache(
+        poster.get_cache_key(dataset["lat"], dataset["lon"], dataset["distance"]),
+        data["graph"], data["water"], data["parks"], data.get("coastlines"),
+    )
+    point = (dataset["lat"], dataset["lon"])
+    theme_data = poster.load_theme(theme)
+
+    def render(output_format, run_dpi, profile=None):
+        output_file = os.path.join(workdir, f"poster.{'svg' if output_format == 'svg-laser' else output_format}")
+        stats = poster.create_poster(
+            "Benchmark", dataset_name, point, dataset["distance"], output_file, output_format,
+            dpi=run_dpi, theme=theme_data, profile=profile,
+        )
+        return output_file, stats
+
+    profiles = []
+    if case in ("poster", "laser"):
+        output_format = "png" if case == "poster" else "svg-laser"
+        for _ in range(repeat):
+            profiles.append(render(output_format, dpi)[1]["profile"])
+
+    elif case == "ocean":
+        import osmnx as ox
+        from shapely.geometry import box
+
+        if data.get("coastlines") is None:
+            return None
+        for _ in range(repeat):
+            profile = RenderProfile()
+            profile.mark("project")
+            G_proj = ox.project_graph(data["graph"])
+            coastlines_proj = ox.projection.project_gdf(data["coastlines"])
+            xs = [x for _, x in G_proj.nodes(data="x")]
+            ys = [y for _, y in G_proj.nodes(data="y")]
+            clip_box = box(min(xs), min(ys), max(xs), max(ys))
+            profile.mark("create_ocean_polygon")
+            ocean = poster.create_ocean_polygon(coastlines_proj, clip_box, G_proj.graph.get("crs"))
+            profile.count("ocean_vertices", 0 if ocean is None else poster.shapely.get_num_coordinates(ocean))
+            profile.finish()
+            profiles.append(profile.as_dict())
+
+    elif case == "mockup":
+        import mockup_generator
+
+        mockups = sorted(item["id"] for item in mockup_generator.list_mockups())
+        if not mockups:
+            return None
+        poster_file, _ = render("png", dpi)
+        for _ in range(repeat):
+            profile = RenderProfile()
+            profile.mark("generate_mockup")
+            result = mockup_generator.generate_mockup(poster_file, mockups[0], os.path.join(workdir, "mockup.png"))
+            if not result.get("success"):
+                raise RuntimeError(f"Mockup failed: {result.get('error')}")
+            profile.finish()
+            profiles.append(profile.as_dict())
+
+    return summarize(profiles)
+
+
+# --- Orchestration ---
+
+def case_key(dataset, case, size):
+    return f"{dataset}/{case}/{size}"
+
+
+def spawn_case(case, dataset, args):
+    """Run a case in a fresh interpreter and return its summary (or None if skipped)."""
+    env = dict(os.environ)
+    env["MPLBACKEND"] = "Agg"
+    env["MAPTOPOSTER_METRICS_DIR"] = tempfile.mkdtemp(prefix="maptoposter-bench-metrics-")
+    if args.trace_memory:
+        env["MAPTOPOSTER_TRACEMALLOC"] = "1"
+    command = [
+        sys.executable, os.path.abspath(__file__), "--run-case", case, dataset,
+        "--size", args.size, "--dpi", str(args.dpi), "--theme", args.theme, "--repeat", str(args.repeat),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True, env=env, cwd=BENCH_DIR)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"{case_key(dataset, case, args.size)} failed:\n{completed.stderr[-2000:]}")
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=REPO_DIR
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def print_result(key, result):
+    rss = f"{result['max_rss_mb']:.0f} MB" if result.get("max_rss_mb") is not None else "n/a"
+    print(f"\n{key}: {result['total_wall_s']:.3f}s wall, {result['total_cpu_s']:.3f}s cpu, peak RSS {rss}")
+    for stage, values in result["stages"].items():
+        growth = f"  {values['rss_growth_mb']:+.1f} MB" if values.get("rss_growth_mb") else ""
+        print(f"  {stage:<22} {values['wall_s']:>8.3f}s  cpu {values['cpu_s']:>8.3f}s{growth}")
+    if result["sizes"]:
+        print("  " + ", ".join(f"{name}={value}" for name, value in result["sizes"].items()))
+
+
+def compare(results, baseline, threshold):
+    """Print the change against the baseline. Returns the list of regressions."""
+    regressions = []
+    print(f"\nCompared with baseline from {baseline['environment'].get('created_at')} "
+          f"(commit {baseline['environment'].get('commit')}), threshold {threshold:.0%}:")
+    for key, result in results.items():
+        before = baseline["results"].get(key)
+        if before is None:
+            print(f"  {key}: no baseline")
+            continue
+        checks = [("total", before["total_wall_s"], result["total_wall_s"], MIN_SECONDS_DELTA, "s")]
+        for stage, values in result["stages"].items():
+            if stage in before["stages"]:
+                checks.append((stage, before["stages"][stage]["wall_s"], values["wall_s"], MIN_SECONDS_DELTA, "s"))
+        if before.get("max_rss_mb") and result.get("max_rss_mb"):
+            checks.append(("peak RSS", before["max_rss_mb"], result["max_rss_mb"], MIN_RSS_DELTA_MB, " MB"))
+        for name, old, new, min_delta, unit in checks:
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if change > threshold and new - old > min_delta:
+                flag = "  REGRESSION"
+                regressions.append(f"{key} {name}")
+            elif change < -threshold and old - new > min_delta:
+                flag = "  faster" if unit == "s" else "  smaller"
+            if name == "total" or flag:
+                print(f"  {key} {name}: {old:.3f}{unit} -> {new:.3f}{unit} ({change:+.1%}){flag}")
+    return regressions
+
+
+def record_dataset(args):
+    sys.path.insert(0, REPO_DIR)
+    import create_map_poster as poster
+    import fixtures
+
+    source = os.path.join(poster.MAP_CACHE_DIR, f"{poster.get_cache_key(args.lat, args.lon, args.distance)}.pkl")
+    if not os.path.exists(source):
+        print(f"No cached map data for {args.lat}, {args.lon} at {args.distance} m.")
+        print("Render it once (which fills cache/map_data/), then record it:")
+        print(f"  python create_map_poster.py --city <city> --country <country> --distance {args.distance}")
+        return 1
+    entry = fixtures.record(args.record, source, args.lat, args.lon, args.distance, args.description or "")
+    print(f"Recorded dataset '{args.record}' -> benchmarks/data/{entry['file']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MapToPoster rendering on fixed offline datasets.")
+    parser.add_argument("--datasets", nargs="+", help="Datasets to run (default: all synthetic and recorded)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES), help="Cases to run (default: all)")
+    parser.add_argument("--size", choices=("small", "medium", "large"), default="medium",
+                        help="Size of synthetic datasets (default: medium)")
+    parser.add_argument("--dpi", type=int, default=150, help="Render resolution (default: 150)")
+    parser.add_argument("--theme", default="feature_based", help="Theme to render with (default: feature_based)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; times are medians (default: 3)")
+    parser.add_argument("--trace-memory", action="store_true", help="Also record Python allocation peaks (slower)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file to compare with and save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown reported as a regression (default: 0.15)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--record", metavar="NAME", help="Record a cached map as a benchmark dataset")
+    parser.add_argument("--lat", type=float, help="Latitude of the map to record")
+    parser.add_argument("--lon", type=float, help="Longitude of the map to record")
+    parser.add_argument("--distance", type=int, help="Distance of the map to record")
+    parser.add_argument("--description", help="Description of the recorded dataset")
+    parser.add_argument("--run-case", nargs=2, metavar=("CASE", "DATASET"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        result = run_case(args.run_case[0], args.run_case[1], args.size, args.dpi, args.theme, args.repeat)
+        print(RESULT_MARKER + json.dumps(result))
+        return 0
+
+    if args.record:
+        if args.lat is None or args.lon is None or args.distance is None:
+            parser.error("--record needs --lat, --lon and --distance")
+        return record_dataset(args)
+
+    sys.path.insert(0, BENCH_DIR)
+    import fixtures
+
+    datasets = args.datasets or fixtures.available()
+    results = {}
+    for dataset in datasets:
+        for case in args.cases:
+            if case == "mockup" and dataset != datasets[0]:
+                continue  # Independent of the map, so run once
+            key = case_key(dataset, case, args.size)
+            print(f"Running {key}...", flush=True)
+            result = spawn_case(case, dataset, args)
+            if result is None:
+                print("  skipped (not applicable to this dataset)")
+                continue
+            results[key] = result
+            print_result(key, result)
+
+    report = {"environment": environment(), "settings": {
+        "size": args.size, "dpi": args.dpi, "theme": args.theme, "repeat": args.repeat,
+    }, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.save_baseline:
+        baseline = {"environment": report["environment"], "settings": report["settings"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline["results"] = json.load(f).get("results", {})
+        baseline["results"].update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,37 +1,66 @@
-from matplotlib.figure import Figure
-from networkx import MultiDiGraph
-import osmnx as ox
-import matplotlib.pyplot as plt
-from matplotlib.font_manager import FontProperties
-import matplotlib.colors as mcolors
 import numpy as np
-from geopy.geocoders import Nominatim
 import time
-import json
 import os
 import sys
 from datetime import datetime
 import argparse
-import asyncio
 import threading
 import pickle
 import hashlib
-from shapely.geometry import LineString, Polygon, MultiPolygon, box
+import uuid
+from shapely.geometry import LineString, Polygon, box
 from shapely.ops import unary_union, polygonize
-import geopandas as gpd
+import shapely
+from instrumentation import RenderProfile
+import geocoder
+import metrics
+from theme_store import ThemeStore, normalize_theme, DEFAULT_THEME
+# Road classes are re-exported for preview.py and tiles.py
+from render_data import RenderData, ROAD_CLASSES, ROAD_CLASS_COLORS, ROAD_CLASS_WIDTHS, road_class  # noqa: F401
+
+# osmnx, geopandas, networkx and matplotlib take seconds to import, so they are
+# imported where a render or download first needs them (see get_osmnx)
 
-# Enable osmnx caching - downloaded data is saved locally for faster repeat requests
 # Use absolute path so cache works regardless of working directory
 CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
 MAP_CACHE_DIR = os.path.join(CACHE_DIR, "map_data")
 os.makedirs(CACHE_DIR, exist_ok=True)
 os.makedirs(MAP_CACHE_DIR, exist_ok=True)
-ox.settings.use_cache = True
-ox.settings.cache_folder = CACHE_DIR
-ox.settings.log_console = True  # Show cache hits/misses in console
-# Use alternative Overpass endpoint (German mirror)
-ox.settings.overpass_url = "https://gall.openstreetmap.de/api/"
-ox.settings.timeout = 180  # 3 minute timeout for slower servers
+# Batch renders set MAPTOPOSTER_QUIET=1 to keep per-poster progress out of their summary output
+QUIET = os.environ.get("MAPTOPOSTER_QUIET") == "1"
+
+_osmnx = None
+_osmnx_lock = threading.Lock()
+
+
+def get_osmnx():
+    """
+    The osmnx module, imported and configured on first use. Importing it pulls
+    in geopandas, pandas, networkx and scipy, which --list-themes, --clear-cache
+    and the web app's startup never need.
+    """
+    global _osmnx
+    with _osmnx_lock:
+        if _osmnx is None:
+            import osmnx as ox
+
+            # Enable osmnx caching - downloaded data is saved locally for faster repeat requests
+            ox.settings.use_cache = True
+            ox.settings.cache_folder = CACHE_DIR
+            ox.settings.log_console = not QUIET  # Show cache hits/misses in console
+            # Use alternative Overpass endpoint (German mirror)
+            ox.settings.overpass_url = "https://gall.openstreetmap.de/api/"
+            ox.settings.timeout = 180  # 3 minute timeout for slower servers
+            _osmnx = ox
+        return _osmnx
+
+
+def set_quiet(quiet):
+    """Silence (or restore) progress output, including osmnx's console log if it is loaded."""
+    global QUIET
+    QUIET = quiet
+    if _osmnx is not None:
+        _osmnx.settings.log_console = not quiet
 
 # Aspect ratio presets for different print sizes
 # Values are (width, height) ratios - will be scaled to base width of 12 inches
@@ -105,17 +134,58 @@ def save_map_cache(cache_key, graph, water, parks, coastlines=None):
     log(f"  [Cache] Saved map data to {cache_key}.pkl")
 
 
+def is_map_cached(lat, lon, dist):
+    """True if map data for this point and distance is already in the cache."""
+    return os.path.exists(os.path.join(MAP_CACHE_DIR, f"{get_cache_key(lat, lon, dist)}.pkl"))
+
+
+# Map cache entries unpickled ahead of time by a warm render worker (see render_worker.py);
+# processes it forks start with them in memory
+_PRELOADED_MAP_DATA = {}
+
+
+def preload_map_cache(cache_keys, max_mb=None):
+    """
+    Unpickle map cache entries into memory, stopping once their files add up
+    to max_mb. Returns the keys that were loaded.
+    """
+    loaded = []
+    total_bytes = 0
+    for cache_key in cache_keys:
+        cache_file = os.path.join(MAP_CACHE_DIR, f"{cache_key}.pkl")
+        try:
+            size = os.path.getsize(cache_file)
+            if max_mb is not None and total_bytes + size > max_mb * 1024 * 1024:
+                break
+            with open(cache_file, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            log(f"  [Cache] Could not preload {cache_key}.pkl: {e}")
+            continue
+        _PRELOADED_MAP_DATA[cache_key] = (data["graph"], data["water"], data["parks"], data.get("coastlines", None))
+        total_bytes += size
+        loaded.append(cache_key)
+    return loaded
+
+
 def load_map_cache(cache_key):
     """
     Load map data from cache if available.
     Returns (graph, water, parks, coastlines) tuple or None if not cached.
     """
+    preloaded = _PRELOADED_MAP_DATA.get(cache_key)
+    if preloaded is not None:
+        metrics.MAP_CACHE_LOOKUPS.inc(result="hit")
+        log(f"  [Cache] Using preloaded map data for {cache_key}")
+        return preloaded
     cache_file = os.path.join(MAP_CACHE_DIR, f"{cache_key}.pkl")
     if not os.path.exists(cache_file):
+        metrics.MAP_CACHE_LOOKUPS.inc(result="miss")
         return None
     try:
         with open(cache_file, "rb") as f:
             data = pickle.load(f)
+        metrics.MAP_CACHE_LOOKUPS.inc(result="hit")
         log(f"  [Cache] Loaded map data from {cache_key}.pkl")
         if "cached_at" in data:
             log(f"  [Cache] Data cached at: {data['cached_at']}")
@@ -123,12 +193,14 @@ def load_map_cache(cache_key):
         coastlines = data.get("coastlines", None)
         return data["graph"], data["water"], data["parks"], coastlines
     except Exception as e:
+        metrics.MAP_CACHE_LOOKUPS.inc(result="error")
         log(f"  [Cache] Failed to load cache: {e}")
         return None
 
 
 def clear_map_cache():
     """Clear all cached map data."""
+    _PRELOADED_MAP_DATA.clear()
     count = 0
     for f in os.listdir(MAP_CACHE_DIR):
         if f.endswith(".pkl"):
@@ -138,7 +210,8 @@ def clear_map_cache():
 
 def log(message, end='\n'):
     """Print with immediate flush for better Windows terminal compatibility."""
-    print(message, end=end, flush=True)
+    if not QUIET:
+        print(message, end=end, flush=True)
 
 class Spinner:
     """Animated spinner to show activity during long operations."""
@@ -152,7 +225,7 @@ class Spinner:
         self.current = 0
 
     def _spin(self):
-        while self.running:
+        while self.running and not QUIET:
             frame = self.frames[self.current % len(self.frames)]
             # \r moves cursor to start of line, allowing overwrite
             print(f"\r{self.message} {frame} ", end='', flush=True)
@@ -171,7 +244,26 @@ class Spinner:
         if self.thread:
             self.thread.join(timeout=0.5)
         # Clear the spinner line and print final message
-        print(f"\r{self.message} {final_message}    ", flush=True)
+        if not QUIET:
+            print(f"\r{self.message} {final_message}    ", flush=True)
+
+class JobCancelled(Exception):
+    """Raised at a render checkpoint when the caller asked for the render to stop."""
+
+
+def check_cancelled(cancel_check, ctx=None, spinner=None):
+    """
+    Cancellation checkpoint between render stages. If cancel_check() is true,
+    stop the active spinner, release the figure and raise JobCancelled.
+    """
+    if cancel_check is None or not cancel_check():
+        return
+    if spinner is not None:
+        spinner.stop("✗ cancelled")
+    if ctx is not None:
+        ctx.close()
+    raise JobCancelled()
+
 
 def run_with_spinner(message, func, *args, **kwargs):
     """Run a function while showing an animated spinner."""
@@ -189,6 +281,9 @@ THEMES_DIR = "themes"
 FONTS_DIR = "fonts"
 POSTERS_DIR = "posters"
 
+# Compiled themes, re-read only when a theme file changes
+THEME_STORE = ThemeStore(THEMES_DIR)
+
 def discover_font_families():
     """
     Discover available font families from the fonts directory.
@@ -262,12 +357,28 @@ def list_available_fonts():
     families = discover_font_families()
     return sorted(families.keys())
 
-# Default font (Roboto or first available)
-FONTS = get_font_family('Roboto')
+_default_fonts = None
+
+
+def get_default_fonts():
+    """Default font (Roboto or first available), discovered on first use."""
+    global _default_fonts
+    if _default_fonts is None:
+        _default_fonts = get_font_family('Roboto')
+    return _default_fonts
+
+
+def __getattr__(name):
+    # FONTS is resolved lazily so importing this module doesn't scan fonts/
+    if name == "FONTS":
+        return get_default_fonts()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def generate_output_filename(city, theme_name, output_format):
     """
-    Generate unique output filename with city, theme, and datetime.
+    Generate unique output filename with city, theme, datetime and a short
+    random token, so renders started in the same second (batch combinations
+    that differ only in DPI or distance, concurrent jobs) never share a name.
     """
     if not os.path.exists(POSTERS_DIR):
         os.makedirs(POSTERS_DIR)
@@ -282,62 +393,103 @@ def generate_output_filename(city, theme_name, output_format):
     else:
         ext = fmt
         suffix = ''
-    filename = f"{city_slug}_{theme_name}{suffix}_{timestamp}.{ext}"
-    return os.path.join(POSTERS_DIR, filename)
+    while True:
+        filename = f"{city_slug}_{theme_name}{suffix}_{timestamp}_{uuid.uuid4().hex[:6]}.{ext}"
+        path = os.path.join(POSTERS_DIR, filename)
+        if not os.path.exists(path):
+            return path
 
 def get_available_themes():
     """
-    Scans the themes directory and returns a list of available theme names.
+    Returns a sorted list of available theme names from the themes directory.
     """
     if not os.path.exists(THEMES_DIR):
         os.makedirs(THEMES_DIR)
         return []
-    
-    themes = []
-    for file in sorted(os.listdir(THEMES_DIR)):
-        if file.endswith('.json'):
-            theme_name = file[:-5]  # Remove .json extension
-            themes.append(theme_name)
-    return themes
+    return THEME_STORE.names()
 
 def load_theme(theme_name="feature_based"):
     """
-    Load theme from JSON file in themes directory.
+    Load a compiled theme (defaults filled in, colors validated) from the theme store.
     """
-    theme_file = os.path.join(THEMES_DIR, f"{theme_name}.json")
-    
-    if not os.path.exists(theme_file):
-        log(f"⚠ Theme file '{theme_file}' not found. Using default feature_based theme.")
+    theme = THEME_STORE.get(theme_name)
+
+    if theme is None:
+        log(f"⚠ Theme file '{os.path.join(THEMES_DIR, f'{theme_name}.json')}' not found. Using default feature_based theme.")
         # Fallback to embedded default theme
-        return {
-            "name": "Feature-Based Shading",
-            "bg": "#FFFFFF",
-            "text": "#000000",
-            "gradient_color": "#FFFFFF",
-            "water": "#C0C0C0",
-            "parks": "#F0F0F0",
-            "road_motorway": "#0A0A0A",
-            "road_primary": "#1A1A1A",
-            "road_secondary": "#2A2A2A",
-            "road_tertiary": "#3A3A3A",
-            "road_residential": "#4A4A4A",
-            "road_default": "#3A3A3A"
-        }
-    
-    with open(theme_file, 'r') as f:
-        theme = json.load(f)
-        log(f"✓ Loaded theme: {theme.get('name', theme_name)}")
-        if 'description' in theme:
-            log(f"  {theme['description']}")
+        theme, _ = normalize_theme(DEFAULT_THEME)
         return theme
 
-# Load theme (can be changed via command line or input)
-THEME = dict[str, str]()  # Will be loaded later
+    log(f"✓ Loaded theme: {theme.get('name', theme_name)}")
+    if theme.get('description'):
+        log(f"  {theme['description']}")
+    for warning in THEME_STORE.warnings(theme_name):
+        log(f"  ⚠ {warning}")
+    return theme
+
+
+class RenderContext:
+    """
+    Per-render state for a single poster.
+
+    Carries the theme, the resolved font family and the matplotlib figure/axes
+    so that nothing mutable is shared between concurrent renders.
+    """
+
+    def __init__(self, theme, font_family=None, aspect_ratio="2:3"):
+        self.theme = theme
+        self.font_family = font_family
+        self.fonts = get_font_family(font_family) if font_family else get_default_fonts()
+        self.aspect_ratio = aspect_ratio
+        self.fig = None
+        self.ax = None
+
+    def create_figure(self):
+        """
+        Create the poster figure without going through pyplot's global figure manager.
+        """
+        from matplotlib.figure import Figure
+
+        bg = self.theme['bg']
+        self.fig = Figure(figsize=get_figure_size(self.aspect_ratio), facecolor=bg)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_facecolor(bg)
+        self.ax.set_position((0.0, 0.0, 1.0, 1.0))
+        return self.fig, self.ax
+
+    def font(self, weight, size):
+        """
+        Return FontProperties for 'bold', 'regular' or 'light' text at the given size.
+        Missing weights fall back to the closest available one, then to monospace.
+        """
+        from matplotlib.font_manager import FontProperties
+
+        if not self.fonts:
+            return FontProperties(family='monospace', weight='bold' if weight == 'bold' else 'normal', size=size)
+        fallbacks = {
+            'bold': ('bold', 'regular'),
+            'regular': ('regular', 'bold'),
+            'light': ('light', 'regular', 'bold'),
+        }
+        for candidate in fallbacks.get(weight, ('regular', 'bold')):
+            path = self.fonts.get(candidate)
+            if path:
+                return FontProperties(fname=path, size=size)
+        return FontProperties(family='monospace', size=size)
+
+    def close(self):
+        """Drop figure references so the render can be garbage collected."""
+        if self.fig is not None:
+            self.fig.clear()
+        self.fig = None
+        self.ax = None
 
 def create_gradient_fade(ax, color, location='bottom', zorder=10):
     """
     Creates a fade effect at the top or bottom of the map.
     """
+    import matplotlib.colors as mcolors
+
     vals = np.linspace(0, 1, 256).reshape(-1, 1)
     gradient = np.hstack((vals, vals))
     
@@ -375,9 +527,7 @@ def draw_center_pin(ax, crop_xlim, crop_ylim, pin_type, theme, pin_color=None):
     pin_type: 'marker', 'heart', 'star', 'home', 'circle'
     pin_color: hex color string, or None to use theme text color
     """
-    from matplotlib.patches import Circle, Polygon, FancyBboxPatch, PathPatch
-    from matplotlib.path import Path
-    import matplotlib.transforms as transforms
+    from matplotlib.patches import Circle, Polygon
 
     # Calculate center of map
     center_x = (crop_xlim[0] + crop_xlim[1]) / 2
@@ -502,69 +652,6 @@ def draw_center_pin(ax, crop_xlim, crop_ylim, pin_type, theme, pin_color=None):
                         zorder=15)
         ax.add_patch(circle)
 
-def get_edge_colors_by_type(G):
-    """
-    Assigns colors to edges based on road type hierarchy.
-    Returns a list of colors corresponding to each edge in the graph.
-    """
-    edge_colors = []
-    
-    for u, v, data in G.edges(data=True):
-        # Get the highway type (can be a list or string)
-        highway = data.get('highway', 'unclassified')
-        
-        # Handle list of highway types (take the first one)
-        if isinstance(highway, list):
-            highway = highway[0] if highway else 'unclassified'
-        
-        # Assign color based on road type
-        if highway in ['motorway', 'motorway_link']:
-            color = THEME['road_motorway']
-        elif highway in ['trunk', 'trunk_link', 'primary', 'primary_link']:
-            color = THEME['road_primary']
-        elif highway in ['secondary', 'secondary_link']:
-            color = THEME['road_secondary']
-        elif highway in ['tertiary', 'tertiary_link']:
-            color = THEME['road_tertiary']
-        elif highway in ['residential', 'living_street', 'unclassified']:
-            color = THEME['road_residential']
-        else:
-            color = THEME['road_default']
-        
-        edge_colors.append(color)
-    
-    return edge_colors
-
-def get_edge_widths_by_type(G):
-    """
-    Assigns line widths to edges based on road type.
-    Major roads get thicker lines.
-    """
-    edge_widths = []
-    
-    for u, v, data in G.edges(data=True):
-        highway = data.get('highway', 'unclassified')
-        
-        if isinstance(highway, list):
-            highway = highway[0] if highway else 'unclassified'
-        
-        # Assign width based on road importance
-        if highway in ['motorway', 'motorway_link']:
-            width = 1.2
-        elif highway in ['trunk', 'trunk_link', 'primary', 'primary_link']:
-            width = 1.0
-        elif highway in ['secondary', 'secondary_link']:
-            width = 0.8
-        elif highway in ['tertiary', 'tertiary_link']:
-            width = 0.6
-        else:
-            width = 0.4
-        
-        edge_widths.append(width)
-    
-    return edge_widths
-
-
 def get_road_buffer_width(highway_type):
     """
     Returns buffer width in meters for converting road lines to polygons.
@@ -584,6 +671,17 @@ def get_road_buffer_width(highway_type):
         return 2.5   # ~5m total width for minor roads
 
 
+def fetch_osm(layer, func, *args, **kwargs):
+    """Run an osmnx download, recording its latency per layer for /metrics."""
+    ox = get_osmnx()
+    with metrics.OVERPASS_DURATION.time(layer=layer) as timer:
+        try:
+            return func(*args, **kwargs)
+        except ox._errors.InsufficientResponseError:
+            timer.outcome = "empty"
+            raise
+
+
 def fetch_coastline_data(point, dist, progress=None):
     """
     Fetch coastline data from OSM for ocean polygon creation.
@@ -597,7 +695,7 @@ def fetch_coastline_data(point, dist, progress=None):
 
     try:
         # Query for coastlines - these are lines where water is on the right side
-        coastlines = ox.features_from_point(point, tags={'natural': 'coastline'}, dist=dist)
+        coastlines = fetch_osm("coastline", get_osmnx().features_from_point, point, tags={'natural': 'coastline'}, dist=dist)
         spinner.stop("✓ done")
         return coastlines
     except Exception as e:
@@ -763,7 +861,7 @@ def geometry_to_svg_path(geom, transform_func=None):
     return ""
 
 
-def export_laser_svg(output_file, G_proj, water, parks, coastlines, crop_xlim, crop_ylim, city, country, theme, point):
+def export_laser_svg(output_file, data, water, parks, coastlines, crop_xlim, crop_ylim, city, country, theme, point):
     """
     Export map as layered SVG optimized for laser cutting.
 
@@ -819,31 +917,15 @@ def export_laser_svg(output_file, G_proj, water, parks, coastlines, crop_xlim, c
     }
 
     log("  Processing roads into polygons...")
-    for u, v, data in G_proj.edges(data=True):
-        highway = data.get('highway', 'unclassified')
-        if isinstance(highway, list):
-            highway = highway[0] if highway else 'unclassified'
-
-        # Get geometry
-        if 'geometry' in data:
-            line = data['geometry']
-        else:
-            # Create line from node coordinates
-            u_data = G_proj.nodes[u]
-            v_data = G_proj.nodes[v]
-            line = LineString([(u_data['x'], u_data['y']), (v_data['x'], v_data['y'])])
-
-        # Buffer the line to create a polygon
-        buffer_width = get_road_buffer_width(highway)
-        road_poly = line.buffer(buffer_width, cap_style=2, join_style=2)  # flat caps, mitre joins
-
-        # Clip to bounds
-        try:
-            road_poly = road_poly.intersection(clip_box)
-        except:
-            continue
+    # Buffer every edge to a polygon (flat caps, mitre joins) and clip it to the bounds
+    highways = [data.highway_names[code] for code in data.edge_highway]
+    widths = np.array([get_road_buffer_width(highway) for highway in data.highway_names])[data.edge_highway]
+    road_polys = shapely.intersection(
+        shapely.buffer(data.lines(), widths, cap_style='flat', join_style='mitre'), clip_box
+    )
 
-        if road_poly.is_empty:
+    for highway, road_poly in zip(highways, road_polys):
+        if road_poly is None or road_poly.is_empty:
             continue
 
         # Categorize
@@ -907,14 +989,14 @@ def export_laser_svg(output_file, G_proj, water, parks, coastlines, crop_xlim, c
         log("  Processing coastline for ocean polygon...")
         # Project coastlines to same CRS as graph
         try:
-            coastlines_proj = ox.projection.project_gdf(coastlines)
+            coastlines_proj = get_osmnx().projection.project_gdf(coastlines)
         except Exception:
             try:
-                coastlines_proj = coastlines.to_crs(G_proj.graph['crs'])
+                coastlines_proj = coastlines.to_crs(data.crs)
             except:
                 coastlines_proj = coastlines
 
-        ocean_geom = create_ocean_polygon(coastlines_proj, clip_box, G_proj.graph.get('crs'))
+        ocean_geom = create_ocean_polygon(coastlines_proj, clip_box, data.crs)
         if ocean_geom:
             log("    ✓ Ocean polygon created")
         else:
@@ -1041,72 +1123,44 @@ def export_laser_svg(output_file, G_proj, water, parks, coastlines, crop_xlim, c
 
 def get_coordinates(city, country, progress=None):
     """
-    Fetches coordinates for a given city and country using geopy.
-    Includes rate limiting to be respectful to the geocoding service.
+    Fetches coordinates for a given city and country.
+    Lookups go through the shared geocode cache; only uncached cities reach
+    Nominatim, rate limited to respect its usage policy.
     """
     if progress:
         progress({"stage": "geocode", "percent": 5, "message": "Looking up coordinates"})
 
-    geolocator = Nominatim(user_agent="city_map_poster")
-
-    # Add a small delay to respect Nominatim's usage policy
-    time.sleep(1)
-
     spinner = Spinner("Looking up coordinates...")
     spinner.start()
 
-    location = geolocator.geocode(f"{city}, {country}")
+    try:
+        result = geocoder.default_geocoder().coordinates(city, country)
+    except Exception:
+        spinner.stop("✗ failed")
+        raise
 
-    # If geocode returned a coroutine in some environments, run it to get the result.
-    if asyncio.iscoroutine(location):
-        try:
-            location = asyncio.run(location)
-        except RuntimeError:
-            # If an event loop is already running, try using it to complete the coroutine.
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                spinner.stop("✗ failed")
-                raise RuntimeError("Geocoder returned a coroutine while an event loop is already running.")
-            location = loop.run_until_complete(location)
-
-    if location:
+    if result:
+        lat, lng, addr = result
         spinner.stop("✓ found")
-        # Use getattr to safely access address (helps static analyzers)
-        addr = getattr(location, "address", None)
         if addr:
             log(f"  Address: {addr}")
-        log(f"  Coordinates: {location.latitude}, {location.longitude}")
+        log(f"  Coordinates: {lat}, {lng}")
         if progress:
             progress({"stage": "geocode", "percent": 12, "message": "Coordinates found"})
-        return (location.latitude, location.longitude)
+        return (lat, lng)
     else:
         spinner.stop("✗ not found")
         raise ValueError(f"Could not find coordinates for {city}, {country}")
     
-def get_crop_limits(G: MultiDiGraph, fig: Figure) -> tuple[tuple[float, float], tuple[float, float]]:
-    """
-    Determine cropping limits to maintain aspect ratio of the figure.
 
-    This function calculates the extents of the graph's nodes and adjusts
-    the x and y limits to match the aspect ratio of the provided figure.
-
-    :param G: The graph to be plotted
-    :type G: MultiDiGraph
-    :param fig: The matplotlib figure object
-    :type fig: Figure
-    :return: Tuple of x and y limits for cropping
-    :rtype: tuple[tuple[float, float], tuple[float, float]]
+def crop_limits(bounds, desired_aspect):
+    """
+    x and y limits that center-crop bounds (minx, miny, maxx, maxy) to the
+    desired width/height aspect ratio.
     """
-    # Compute node extents in projected coordinates
-    xs = [data['x'] for _, data in G.nodes(data=True)]
-    ys = [data['y'] for _, data in G.nodes(data=True)]
-    minx, maxx = min(xs), max(xs)
-    miny, maxy = min(ys), max(ys)
+    minx, miny, maxx, maxy = bounds
     x_range = maxx - minx
     y_range = maxy - miny
-
-    fig_width, fig_height = fig.get_size_inches()
-    desired_aspect = fig_width / fig_height
     current_aspect = x_range / y_range
 
     center_x = (minx + maxx) / 2
@@ -1135,12 +1189,104 @@ def get_crop_limits(G: MultiDiGraph, fig: Figure) -> tuple[tuple[float, float],
     
     return crop_xlim, crop_ylim
 
-def create_poster(city, country, point, dist, output_file, output_format='png', dpi=300, progress=None, use_cache=True, font_family=None, tagline=None, pin=None, pin_color=None, aspect_ratio="2:3"):
+
+def draw_overlays(ctx, crop_xlim, crop_ylim, city, country, point, tagline=None, pin=None, pin_color=None):
+    """
+    Draw everything above the map layers: the top and bottom gradient fades,
+    the city/country/coordinates typography and the optional center pin.
+    The axes limits must already be set to crop_xlim/crop_ylim.
+    """
+    ax = ctx.ax
+    theme = ctx.theme
+    font_family = ctx.font_family
+
+    # Layer 3: Gradients (Top and Bottom)
+    create_gradient_fade(ax, theme['gradient_color'], location='bottom', zorder=10)
+    create_gradient_fade(ax, theme['gradient_color'], location='top', zorder=10)
+    
+    # 4. Typography - use selected font family or default
+    log(f"Font family requested: {font_family}, resolved fonts: {ctx.fonts}")
+    if not ctx.fonts:
+        log("WARNING: No custom fonts available, falling back to monospace")
+
+    font_sub = ctx.font('light', 22)
+    font_coords = ctx.font('regular', 14)
+
+    spaced_city = "  ".join(list(city.upper()))
+
+    # Dynamically adjust font size based on city name length to prevent truncation
+    base_font_size = 60
+    city_char_count = len(city)
+    if city_char_count > 10:
+        # Scale down font size for longer names
+        scale_factor = 10 / city_char_count
+        adjusted_font_size = max(base_font_size * scale_factor, 24)  # Minimum size of 24
+    else:
+        adjusted_font_size = base_font_size
+
+    font_main_adjusted = ctx.font('bold', adjusted_font_size)
+
+    # --- BOTTOM TEXT ---
+    ax.text(0.5, 0.14, spaced_city, transform=ax.transAxes,
+            color=theme['text'], ha='center', fontproperties=font_main_adjusted, zorder=11)
+    
+    ax.text(0.5, 0.10, country.upper(), transform=ax.transAxes,
+            color=theme['text'], ha='center', fontproperties=font_sub, zorder=11)
+    
+    # Third line: custom tagline or coordinates
+    if tagline:
+        third_line = tagline
+    else:
+        lat, lon = point
+        coords = f"{lat:.4f}° N / {lon:.4f}° E" if lat >= 0 else f"{abs(lat):.4f}° S / {lon:.4f}° E"
+        if lon < 0:
+            coords = coords.replace("E", "W")
+        third_line = coords
+
+    ax.text(0.5, 0.07, third_line, transform=ax.transAxes,
+            color=theme['text'], alpha=0.7, ha='center', fontproperties=font_coords, zorder=11)
+    
+    ax.plot([0.4, 0.6], [0.125, 0.125], transform=ax.transAxes,
+            color=theme['text'], linewidth=1, zorder=11)
+
+    # 5. Center Pin Icon (if selected)
+    if pin:
+        draw_center_pin(ax, crop_xlim, crop_ylim, pin, theme, pin_color=pin_color)
+
+
+def create_poster(city, country, point, dist, output_file, output_format='png', dpi=300, progress=None, use_cache=True, font_family=None, tagline=None, pin=None, pin_color=None, aspect_ratio="2:3", theme=None, cancel_check=None, profile=None):
+    """
+    Render a poster for the given point.
+
+    All render state lives in a RenderContext local to this call, so several
+    posters can be rendered concurrently from different threads.
+
+    cancel_check, if given, is polled between stages; when it returns True the
+    render stops with JobCancelled. The output file may already exist if the
+    render is cancelled while saving, so callers should clean it up.
+
+    profile, an instrumentation.RenderProfile, receives per-stage timings and
+    data sizes; one is created if not given.
+
+    Returns a dict of render statistics: cache_hit, nodes, edges and profile
+    (the RenderProfile as a dict).
+    """
+    ox = get_osmnx()
+    import geopandas as gpd
+    from matplotlib.collections import LineCollection
+
+    if theme is None:
+        theme = load_theme()
+    if profile is None:
+        profile = RenderProfile()
+    ctx = RenderContext(theme, font_family=font_family, aspect_ratio=aspect_ratio)
+
     log(f"\nGenerating map for {city}, {country}...")
     log("")
 
     # Check for cached map data first
     cache_key = get_cache_key(point[0], point[1], dist)
+    profile.mark("cache_load")
     cached_data = load_map_cache(cache_key) if use_cache else None
 
     if cached_data:
@@ -1157,56 +1303,77 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
         log("No cache found, downloading from OpenStreetMap...\n")
 
         # 1. Fetch Street Network
+        profile.mark("fetch_network")
         if progress:
             progress({"stage": "network", "percent": 20, "message": "Downloading street network"})
         G = run_with_spinner(
             "[1/3] Downloading street network...",
-            ox.graph_from_point,
-            point, dist=dist, dist_type='bbox', network_type='all'
+            fetch_osm,
+            "network", ox.graph_from_point, point, dist=dist, dist_type='bbox', network_type='all'
         )
         if progress:
             progress({"stage": "network", "percent": 30, "message": "Street network downloaded"})
+        check_cancelled(cancel_check)
         time.sleep(0.5)  # Rate limit between requests
 
         # 2. Fetch Water Features
+        profile.mark("fetch_water")
         if progress:
             progress({"stage": "water", "percent": 38, "message": "Downloading water features"})
         water = None
         spinner = Spinner("[2/3] Downloading water features...")
         spinner.start()
         try:
-            water = ox.features_from_point(point, tags={'natural': 'water', 'waterway': 'riverbank'}, dist=dist)
+            water = fetch_osm("water", ox.features_from_point, point, tags={'natural': 'water', 'waterway': 'riverbank'}, dist=dist)
             spinner.stop("✓ done")
         except Exception as e:
             spinner.stop(f"⚠ skipped (no data)")
         if progress:
             progress({"stage": "water", "percent": 45, "message": "Water features downloaded"})
+        check_cancelled(cancel_check)
         time.sleep(0.3)
 
         # 3. Fetch Parks
+        profile.mark("fetch_parks")
         if progress:
             progress({"stage": "parks", "percent": 45, "message": "Downloading parks/green spaces"})
         parks = None
         spinner = Spinner("[3/4] Downloading parks/green spaces...")
         spinner.start()
         try:
-            parks = ox.features_from_point(point, tags={'leisure': 'park', 'landuse': 'grass'}, dist=dist)
+            parks = fetch_osm("parks", ox.features_from_point, point, tags={'leisure': 'park', 'landuse': 'grass'}, dist=dist)
             spinner.stop("✓ done")
         except Exception as e:
             spinner.stop(f"⚠ skipped (no data)")
         if progress:
             progress({"stage": "parks", "percent": 52, "message": "Parks downloaded"})
+        check_cancelled(cancel_check)
         time.sleep(0.3)
 
         # 4. Fetch Coastlines (for ocean polygons in coastal cities)
+        profile.mark("fetch_coastline")
         coastlines = fetch_coastline_data(point, dist, progress=progress)
         if progress:
             progress({"stage": "coastline", "percent": 60, "message": "Coastline data processed"})
 
         # Save to cache for next time
+        profile.mark("cache_save")
         save_map_cache(cache_key, G, water, parks, coastlines)
         log("\n✓ All data downloaded and cached!\n")
 
+    check_cancelled(cancel_check)
+
+    # Everything below draws from compact arrays, so the graph can be released
+    profile.mark("render_data")
+    cache_hit = cached_data is not None
+    data = RenderData.from_graph(G)
+    del G, cached_data
+    profile.count("nodes", data.num_nodes)
+    profile.count("edges", data.num_edges)
+    profile.count("render_data_mb", round(data.nbytes / 1024 / 1024, 1))
+    for name, layer in (("water_features", water), ("park_features", parks), ("coastline_features", coastlines)):
+        profile.count(name, 0 if layer is None else len(layer))
+
     # 2. Setup Plot
     if progress:
         progress({"stage": "render", "percent": 70, "message": "Rendering map"})
@@ -1214,19 +1381,21 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
     spinner = Spinner("Rendering map...")
     spinner.start()
 
-    fig_size = get_figure_size(aspect_ratio)
-    fig, ax = plt.subplots(figsize=fig_size, facecolor=THEME['bg'])
-    ax.set_facecolor(THEME['bg'])
-    ax.set_position((0.0, 0.0, 1.0, 1.0))
+    profile.mark("projection")
+    fig, ax = ctx.create_figure()
 
-    # Project graph to a metric CRS so distances and aspect are linear (meters)
-    G_proj = ox.project_graph(G)
+    # Project to a metric CRS so distances and aspect are linear (meters)
+    data = data.project()
+    crs = data.crs
 
     # Pre-calculate crop limits for ocean polygon
-    crop_xlim, crop_ylim = get_crop_limits(G_proj, fig)
+    fig_width, fig_height = fig.get_size_inches()
+    crop_xlim, crop_ylim = crop_limits(data.bounds, fig_width / fig_height)
+    check_cancelled(cancel_check, ctx, spinner)
 
     # 3. Plot Layers
     # Layer 0: Ocean (from coastlines - creates land/water boundary)
+    profile.mark("ocean")
     if coastlines is not None and not coastlines.empty:
         try:
             # Project coastlines to same CRS as graph
@@ -1234,7 +1403,7 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
                 coastlines_proj = ox.projection.project_gdf(coastlines)
             except Exception:
                 try:
-                    coastlines_proj = coastlines.to_crs(G_proj.graph['crs'])
+                    coastlines_proj = coastlines.to_crs(crs)
                 except Exception:
                     coastlines_proj = coastlines
 
@@ -1242,16 +1411,19 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
             clip_box = box(crop_xlim[0], crop_ylim[0], crop_xlim[1], crop_ylim[1])
 
             # Create ocean polygon
-            ocean_geom = create_ocean_polygon(coastlines_proj, clip_box, G_proj.graph.get('crs'))
+            ocean_geom = create_ocean_polygon(coastlines_proj, clip_box, crs)
 
             if ocean_geom is not None and not ocean_geom.is_empty:
+                profile.count("ocean_vertices", shapely.get_num_coordinates(ocean_geom))
                 # Create a GeoDataFrame for plotting
-                ocean_gdf = gpd.GeoDataFrame(geometry=[ocean_geom], crs=G_proj.graph.get('crs'))
-                ocean_gdf.plot(ax=ax, facecolor=THEME['water'], edgecolor='none', zorder=0)
+                ocean_gdf = gpd.GeoDataFrame(geometry=[ocean_geom], crs=crs)
+                ocean_gdf.plot(ax=ax, facecolor=theme['water'], edgecolor='none', zorder=0)
         except Exception as e:
             log(f"  Note: Could not render ocean polygon: {e}")
 
     # Layer 1: Polygons (filter out Point geometries to avoid orange dot artifacts)
+    profile.mark("polygons")
+    polygon_vertices = 0
     if water is not None and not water.empty:
         # Filter to only Polygon/MultiPolygon geometries
         water = water[water.geometry.type.isin(['Polygon', 'MultiPolygon'])]
@@ -1259,8 +1431,9 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
             try:
                 water = ox.projection.project_gdf(water)
             except Exception:
-                water = water.to_crs(G_proj.graph['crs'])
-            water.plot(ax=ax, facecolor=THEME['water'], edgecolor='none', zorder=1)
+                water = water.to_crs(crs)
+            polygon_vertices += int(shapely.get_num_coordinates(water.geometry.values).sum())
+            water.plot(ax=ax, facecolor=theme['water'], edgecolor='none', zorder=1)
     if parks is not None and not parks.empty:
         # Filter to only Polygon/MultiPolygon geometries
         parks = parks[parks.geometry.type.isin(['Polygon', 'MultiPolygon'])]
@@ -1268,99 +1441,33 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
             try:
                 parks = ox.projection.project_gdf(parks)
             except Exception:
-                parks = parks.to_crs(G_proj.graph['crs'])
-            parks.plot(ax=ax, facecolor=THEME['parks'], edgecolor='none', zorder=2)
+                parks = parks.to_crs(crs)
+            polygon_vertices += int(shapely.get_num_coordinates(parks.geometry.values).sum())
+            parks.plot(ax=ax, facecolor=theme['parks'], edgecolor='none', zorder=2)
+    profile.count("polygon_vertices", polygon_vertices)
+
+    check_cancelled(cancel_check, ctx, spinner)
 
     # Layer 2: Roads with hierarchy coloring
-    edge_colors = get_edge_colors_by_type(G_proj)
-    edge_widths = get_edge_widths_by_type(G_proj)
-
-    # Plot the projected graph and then apply the cropped limits
-    ox.plot_graph(
-        G_proj, ax=ax, bgcolor=THEME['bg'],
-        node_size=0,
-        node_color=THEME['bg'],  # Hide any node artifacts by matching background
-        edge_color=edge_colors,
-        edge_linewidth=edge_widths,
-        show=False, close=False
-    )
+    profile.mark("classification")
+    edge_colors = data.edge_colors(theme)
+    edge_widths = data.edge_widths()
+
+    # Draw every edge as one LineCollection of views into the coordinate array, then apply the cropped limits
+    profile.mark("draw")
+    ax.add_collection(LineCollection(data.segments(), colors=edge_colors, linewidths=edge_widths, zorder=1))
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.get_xaxis().set_visible(False)
+    ax.get_yaxis().set_visible(False)
     ax.set_aspect('equal', adjustable='box')
     ax.set_xlim(crop_xlim)
     ax.set_ylim(crop_ylim)
     
-    # Layer 3: Gradients (Top and Bottom)
-    create_gradient_fade(ax, THEME['gradient_color'], location='bottom', zorder=10)
-    create_gradient_fade(ax, THEME['gradient_color'], location='top', zorder=10)
-    
-    # 4. Typography - use selected font family or default
-    selected_fonts = get_font_family(font_family) if font_family else FONTS
-    log(f"Font family requested: {font_family}, resolved fonts: {selected_fonts}")
-
-    if selected_fonts:
-        # Get font paths, with fallbacks for missing weights
-        bold_font = selected_fonts.get('bold') or selected_fonts.get('regular')
-        regular_font = selected_fonts.get('regular') or selected_fonts.get('bold')
-        light_font = selected_fonts.get('light') or selected_fonts.get('regular') or selected_fonts.get('bold')
-
-        font_main = FontProperties(fname=bold_font, size=60)
-        font_top = FontProperties(fname=bold_font, size=40)
-        font_sub = FontProperties(fname=light_font, size=22)
-        font_coords = FontProperties(fname=regular_font, size=14)
-        log(f"Using font_coords with regular_font: {regular_font}")
-    else:
-        # Fallback to system fonts
-        log("WARNING: No custom fonts available, falling back to monospace")
-        font_main = FontProperties(family='monospace', weight='bold', size=60)
-        font_top = FontProperties(family='monospace', weight='bold', size=40)
-        font_sub = FontProperties(family='monospace', weight='normal', size=22)
-        font_coords = FontProperties(family='monospace', size=14)
-
-    spaced_city = "  ".join(list(city.upper()))
-
-    # Dynamically adjust font size based on city name length to prevent truncation
-    base_font_size = 60
-    city_char_count = len(city)
-    if city_char_count > 10:
-        # Scale down font size for longer names
-        scale_factor = 10 / city_char_count
-        adjusted_font_size = max(base_font_size * scale_factor, 24)  # Minimum size of 24
-    else:
-        adjusted_font_size = base_font_size
-
-    if selected_fonts:
-        bold_font = selected_fonts.get('bold') or selected_fonts.get('regular')
-        font_main_adjusted = FontProperties(fname=bold_font, size=adjusted_font_size)
-    else:
-        font_main_adjusted = FontProperties(family='monospace', weight='bold', size=adjusted_font_size)
-
-    # --- BOTTOM TEXT ---
-    ax.text(0.5, 0.14, spaced_city, transform=ax.transAxes,
-            color=THEME['text'], ha='center', fontproperties=font_main_adjusted, zorder=11)
-    
-    ax.text(0.5, 0.10, country.upper(), transform=ax.transAxes,
-            color=THEME['text'], ha='center', fontproperties=font_sub, zorder=11)
-    
-    # Third line: custom tagline or coordinates
-    if tagline:
-        third_line = tagline
-    else:
-        lat, lon = point
-        coords = f"{lat:.4f}° N / {lon:.4f}° E" if lat >= 0 else f"{abs(lat):.4f}° S / {lon:.4f}° E"
-        if lon < 0:
-            coords = coords.replace("E", "W")
-        third_line = coords
-
-    ax.text(0.5, 0.07, third_line, transform=ax.transAxes,
-            color=THEME['text'], alpha=0.7, ha='center', fontproperties=font_coords, zorder=11)
-    
-    ax.plot([0.4, 0.6], [0.125, 0.125], transform=ax.transAxes,
-            color=THEME['text'], linewidth=1, zorder=11)
-
-    # 5. Center Pin Icon (if selected)
-    if pin:
-        draw_center_pin(ax, crop_xlim, crop_ylim, pin, THEME, pin_color=pin_color)
+    draw_overlays(ctx, crop_xlim, crop_ylim, city, country, point, tagline=tagline, pin=pin, pin_color=pin_color)
 
     spinner.stop("✓ done")
+    check_cancelled(cancel_check, ctx)
 
     # 6. Save
     if progress:
@@ -1370,11 +1477,12 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
 
     # Handle laser-cut SVG format separately
     if fmt == "svg-laser":
-        plt.close()  # Don't need the matplotlib figure for laser export
+        profile.mark("laser_export")
+        ctx.close()  # Don't need the matplotlib figure for laser export
         spinner = Spinner(f"Generating laser-cut SVG: {output_file}...")
         spinner.start()
         try:
-            export_laser_svg(output_file, G_proj, water, parks, coastlines, crop_xlim, crop_ylim, city, country, THEME, point)
+            export_laser_svg(output_file, data, water, parks, coastlines, crop_xlim, crop_ylim, city, country, theme, point)
             spinner.stop("✓ done")
         except Exception as e:
             spinner.stop(f"✗ failed: {e}")
@@ -1384,7 +1492,7 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
         spinner = Spinner(f"Saving to {output_file} ({fmt.upper()}, {dpi} DPI)...")
         spinner.start()
 
-        save_kwargs = dict(facecolor=THEME["bg"], bbox_inches="tight", pad_inches=0.05)
+        save_kwargs = dict(facecolor=theme["bg"], bbox_inches="tight", pad_inches=0.05)
 
         # DPI matters for raster formats (PNG) and PDF (affects rasterized elements and file size)
         if fmt in ("png", "pdf"):
@@ -1392,17 +1500,27 @@ def create_poster(city, country, point, dist, output_file, output_format='png',
             # Also set figure DPI to ensure rasterized elements use correct resolution
             fig.set_dpi(dpi)
 
-        plt.savefig(output_file, format=fmt if fmt != "svg-laser" else "svg", **save_kwargs)
+        profile.mark("savefig")
+        fig.savefig(output_file, format=fmt if fmt != "svg-laser" else "svg", **save_kwargs)
+        check_cancelled(cancel_check, ctx, spinner)
+        profile.mark("thumbnail")
 
         # Generate thumbnail for gallery (low DPI PNG)
         thumb_file = output_file.rsplit('.', 1)[0] + '_thumb.png'
-        thumb_kwargs = dict(facecolor=THEME["bg"], bbox_inches="tight", pad_inches=0.02, dpi=72)
-        plt.savefig(thumb_file, format='png', **thumb_kwargs)
+        thumb_kwargs = dict(facecolor=theme["bg"], bbox_inches="tight", pad_inches=0.02, dpi=72)
+        fig.savefig(thumb_file, format='png', **thumb_kwargs)
 
-        plt.close()
+        ctx.close()
         spinner.stop("✓ done")
 
     log(f"\n✓ Poster saved as {output_file}")
+    profile.finish()
+    return {
+        "cache_hit": cache_hit,
+        "nodes": data.num_nodes,
+        "edges": data.num_edges,
+        "profile": profile.as_dict(),
+    }
 
 
 def print_examples():
@@ -1471,15 +1589,9 @@ def list_themes():
     print("\nAvailable Themes:")
     print("-" * 60)
     for theme_name in available_themes:
-        theme_path = os.path.join(THEMES_DIR, f"{theme_name}.json")
-        try:
-            with open(theme_path, 'r') as f:
-                theme_data = json.load(f)
-                display_name = theme_data.get('name', theme_name)
-                description = theme_data.get('description', '')
-        except:
-            display_name = theme_name
-            description = ''
+        theme_data = THEME_STORE.raw(theme_name) or {}
+        display_name = theme_data.get('name', theme_name)
+        description = theme_data.get('description', '')
         print(f"  {theme_name}")
         print(f"    {display_name}")
         if description:
@@ -1496,6 +1608,7 @@ Examples:
   python create_map_poster.py --city Tokyo --country Japan --theme midnight_blue
   python create_map_poster.py --city Paris --country France --theme noir --distance 15000
   python create_map_poster.py --list-themes
+  python create_map_poster.py --batch catalog.csv --workers 4
         """
     )
     
@@ -1509,6 +1622,11 @@ Examples:
                         help='Output format: png, svg, pdf, or svg-laser (layered SVG for laser cutting)')
     parser.add_argument('--clear-cache', action='store_true', help='Clear all cached map data')
     parser.add_argument('--no-cache', action='store_true', help='Skip cache and always download fresh data')
+    parser.add_argument('--batch', metavar='MANIFEST', help='Render every poster in a CSV or JSON manifest (see batch_render.py)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Posters rendered in parallel in batch mode (default: 1)')
+    parser.add_argument('--executor', choices=['thread', 'process'],
+                        help='Batch workers: threads in this process or worker processes (default: process when --workers > 1)')
+    parser.add_argument('--report', metavar='FILE', help='Batch report path (default: posters/batch_report_<timestamp>.json)')
 
     args = parser.parse_args()
 
@@ -1526,6 +1644,20 @@ Examples:
     if args.list_themes:
         list_themes()
         sys.exit(0)
+
+    if args.batch:
+        import batch_render
+
+        try:
+            posters = batch_render.load_manifest(args.batch, {
+                "theme": args.theme, "format": args.format, "dpi": args.dpi, "distance": args.distance,
+            })
+        except batch_render.ManifestError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        report = batch_render.run_batch(posters, workers=args.workers, executor=args.executor, report_path=args.report)
+        batch_render.print_summary(report)
+        sys.exit(1 if report["failed"] or report["skipped"] else 0)
     
     # Validate required arguments
     if not args.city or not args.country:
@@ -1545,13 +1677,13 @@ Examples:
     print("=" * 50)
     
     # Load theme
-    THEME = load_theme(args.theme)
+    theme = load_theme(args.theme)
     
     # Get coordinates and generate poster
     try:
         coords = get_coordinates(args.city, args.country)
         output_file = generate_output_filename(args.city, args.theme, args.format)
-        create_poster(args.city, args.country, coords, args.distance, output_file, args.format, dpi=args.dpi, use_cache=not args.no_cache)
+        create_poster(args.city, args.country, coords, args.distance, output_file, args.format, dpi=args.dpi, use_cache=not args.no_cache, theme=theme)
         
         print("\n" + "=" * 50)
         print("✓ Poster generation complete!")
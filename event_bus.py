@@ -0,0 +1,136 @@
+"""
+Event Bus for MapToPoster
+In-process publish/subscribe used to fan SSE updates out to many clients.
+
+Each topic (one per job, one for the posters gallery) has a single producer
+that publishes full-state snapshots. Every event is serialized once and kept
+in a small ring buffer; subscribers only hold a cursor into that buffer, so a
+slow client never grows memory and simply skips ahead to the newest snapshot.
+Event ids carry a per-topic epoch so a client reconnecting with Last-Event-ID
+(possibly to a different server process) gets exactly what it missed, or the
+latest snapshot when its id is unknown.
+"""
+
+import collections
+import json
+import threading
+import uuid
+
+# Events kept per topic for Last-Event-ID replay
+TOPIC_HISTORY = 32
+
+# Seconds a subscriber waits for an event before yielding a keep-alive
+KEEPALIVE_INTERVAL = 15
+
+
+class Event:
+    """One published snapshot: id, original data and its pre-encoded SSE frame."""
+
+    __slots__ = ("id", "data", "frame")
+
+    def __init__(self, event_id, data):
+        self.id = event_id
+        self.data = data
+        self.frame = f"id: {event_id}\ndata: {json.dumps(data)}\n\n"
+
+
+class Topic:
+    def __init__(self, name, history=TOPIC_HISTORY):
+        self.name = name
+        self.subscribers = 0
+        self._epoch = uuid.uuid4().hex[:8]
+        self._counter = 0
+        self._events = collections.deque(maxlen=history)
+        self._cond = threading.Condition()
+
+    def latest(self):
+        with self._cond:
+            return self._events[-1] if self._events else None
+
+    def publish(self, data):
+        """Publish a snapshot unless it is identical to the previous one. Returns True if published."""
+        with self._cond:
+            if self._events and self._events[-1].data == data:
+                return False
+            self._counter += 1
+            self._events.append(Event(f"{self._epoch}-{self._counter}", data))
+            self._cond.notify_all()
+            return True
+
+    def _events_after(self, event_id):
+        """Events newer than event_id; the latest snapshot if event_id is unknown."""
+        if not self._events:
+            return []
+        if event_id is None:
+            return [self._events[-1]]
+        ids = [event.id for event in self._events]
+        if event_id in ids:
+            return list(self._events)[ids.index(event_id) + 1:]
+        return [self._events[-1]]
+
+    def subscribe(self, last_event_id=None, keepalive=KEEPALIVE_INTERVAL):
+        """
+        Generator of Event objects for one client, starting after last_event_id.
+        Yields None after `keepalive` seconds without events so the caller can
+        send an SSE comment (which also detects disconnected clients).
+        """
+        with self._cond:
+            self.subscribers += 1
+        try:
+            cursor = last_event_id
+            while True:
+                with self._cond:
+                    pending = self._events_after(cursor)
+                    if not pending:
+                        self._cond.wait(keepalive)
+                        pending = self._events_after(cursor)
+                if not pending:
+                    yield None
+                    continue
+                for event in pending:
+                    cursor = event.id
+                    yield event
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+class EventBus:
+    """Registry of topics by name."""
+
+    def __init__(self):
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def topic(self, name):
+        with self._lock:
+            topic = self._topics.get(name)
+            if topic is None:
+                topic = self._topics[name] = Topic(name)
+            return topic
+
+    def get(self, name):
+        with self._lock:
+            return self._topics.get(name)
+
+    def names(self, prefix=""):
+        with self._lock:
+            return [name for name in self._topics if name.startswith(prefix)]
+
+    def remove(self, name):
+        with self._lock:
+            self._topics.pop(name, None)
+
+
+def sse_stream(topic, last_event_id=None, until=None):
+    """
+    SSE response body for a topic subscription.
+    Stops after sending an event for which until(event.data) is true.
+    """
+    for event in topic.subscribe(last_event_id):
+        if event is None:
+            yield ": keepalive\n\n"
+            continue
+        yield event.frame
+        if until is not None and until(event.data):
+            break
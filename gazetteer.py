@@ -0,0 +1,323 @@
+"""
+Gazetteer for MapToPoster
+Offline city lookup from a GeoNames dump: forward search with prefix and
+fuzzy matching, exact city/country lookup and nearest-city reverse lookup.
+
+The geocoder consults the gazetteer first and only falls back to Nominatim
+when it has no answer. Data comes from https://download.geonames.org/export/dump/
+(citiesNNNN.txt plus countryInfo.txt for country names); fetch it with
+
+    python gazetteer.py download [cities15000|cities5000|cities1000|cities500]
+
+Parsing a dump takes a few seconds, so the compiled index is pickled next to
+it and reused until the dump changes.
+"""
+
+import argparse
+import bisect
+import io
+import os
+import pickle
+import sys
+import threading
+import unicodedata
+import zipfile
+
+import numpy as np
+
+GAZETTEER_DIR = os.environ.get(
+    "MAPTOPOSTER_GAZETTEER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "gazetteer"),
+)
+GAZETTEER_DATASET = os.environ.get("MAPTOPOSTER_GAZETTEER", "cities15000")
+DOWNLOAD_URL = "https://download.geonames.org/export/dump/"
+
+# Alternate names (translations, old names) are indexed for cities at least this big
+ALT_NAME_MIN_POPULATION = 50000
+
+# Prefixes up to this length have precomputed most-populous matches
+SHORT_PREFIX = 3
+SHORT_PREFIX_RESULTS = 20
+
+# Longest reverse lookup answered from the gazetteer; further away falls back to Nominatim
+REVERSE_MAX_KM = 25.0
+
+EARTH_RADIUS_KM = 6371.0
+INDEX_VERSION = 1
+
+
+def fold(text):
+    """Lowercase, accent-free, single-spaced form used for every index key."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.replace("-", " ").replace("'", "").split())
+
+
+def _deletes(key):
+    """key with each single character removed (symmetric-delete fuzzy matching)."""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def _unit_vectors(lat, lng):
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+
+def read_countries(path):
+    """ISO code -> country name from GeoNames countryInfo.txt."""
+    countries = {}
+    if not os.path.exists(path):
+        return countries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) > 4:
+                countries[fields[0]] = fields[4]
+    return countries
+
+
+def read_cities(path):
+    """Rows of a GeoNames cities dump as (name, ascii name, alternate names, lat, lng, country code, population)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15:
+                continue
+            yield (
+                fields[1],
+                fields[2],
+                [name for name in fields[3].split(",") if name],
+                float(fields[4]),
+                float(fields[5]),
+                fields[8],
+                int(fields[14] or 0),
+            )
+
+
+class Gazetteer:
+    """In-memory city index. Build with from_rows() or load()."""
+
+    def __init__(self, state):
+        # Imported here so that importing the geocoder (and the web app) doesn't load scipy
+        from scipy.spatial import cKDTree
+
+        self.__dict__.update(state)
+        self._tree = cKDTree(_unit_vectors(self.lat, self.lng)) if len(self.lat) else None
+
+    @classmethod
+    def from_rows(cls, rows, countries=None):
+        countries = countries or {}
+        names, codes, lat, lng, population = [], [], [], [], []
+        keyed = []
+        for name, ascii_name, alternates, row_lat, row_lng, code, row_population in rows:
+            index = len(names)
+            names.append(name)
+            codes.append(code)
+            lat.append(row_lat)
+            lng.append(row_lng)
+            population.append(row_population)
+            variants = {fold(name), fold(ascii_name)}
+            if row_population >= ALT_NAME_MIN_POPULATION:
+                variants.update(fold(alt) for alt in alternates)
+            keyed.extend((key, index) for key in variants if key)
+
+        keyed.sort()
+        population_array = np.array(population, dtype=np.int64)
+        # Most populous cities first for every short prefix, so "s" doesn't scan every S-city
+        short = {}
+        for key, index in keyed:
+            for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+                short.setdefault(key[:length], set()).add(index)
+        short = {
+            prefix: sorted(ids, key=lambda i: -population[i])[:SHORT_PREFIX_RESULTS]
+            for prefix, ids in short.items()
+        }
+        fuzzy = {}
+        for key, index in keyed:
+            if len(key) >= 4:
+                for variant in _deletes(key) | {key}:
+                    fuzzy.setdefault(variant, set()).add(index)
+
+        return cls({
+            "names": names,
+            "codes": codes,
+            "countries": {code: countries.get(code, code) for code in set(codes)},
+            "lat": np.array(lat),
+            "lng": np.array(lng),
+            "population": population_array,
+            "keys": [key for key, _ in keyed],
+            "key_ids": np.array([index for _, index in keyed], dtype=np.int32),
+            "short": short,
+            "fuzzy": {variant: tuple(ids) for variant, ids in fuzzy.items()},
+        })
+
+    @classmethod
+    def load(cls, directory=GAZETTEER_DIR, dataset=GAZETTEER_DATASET):
+        """Load the gazetteer for a downloaded dump, or None if it hasn't been downloaded."""
+        source = os.path.join(directory, f"{dataset}.txt")
+        if not os.path.exists(source):
+            return None
+        stat = os.stat(source)
+        signature = (INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+        index_path = os.path.join(directory, f"{dataset}.index.pkl")
+        try:
+            with open(index_path, "rb") as f:
+                saved_signature, state = pickle.load(f)
+            if saved_signature == signature:
+                return cls(state)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+        countries = read_countries(os.path.join(directory, "countryInfo.txt"))
+        gazetteer = cls.from_rows(read_cities(source), countries)
+        state = {key: value for key, value in gazetteer.__dict__.items() if not key.startswith("_")}
+        tmp = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((signature, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, index_path)
+        return gazetteer
+
+    def __len__(self):
+        return len(self.names)
+
+    def entry(self, index, distance_km=None):
+        code = self.codes[index]
+        result = {
+            "name": self.names[index],
+            "country": self.countries.get(code, code),
+            "country_code": code,
+            "lat": float(self.lat[index]),
+            "lng": float(self.lng[index]),
+            "population": int(self.population[index]),
+        }
+        if distance_km is not None:
+            result["distance_km"] = round(float(distance_km), 2)
+        return result
+
+    def _country_matches(self, index, country, prefix=False):
+        """
+        Whether a city is in `country` (folded): its ISO code or full name, or
+        with prefix, the start of its name (for search-as-you-type only).
+        """
+        if not country:
+            return True
+        code = self.codes[index]
+        if code.casefold() == country:
+            return True
+        name = fold(self.countries.get(code, code))
+        return name.startswith(country) if prefix else name == country
+
+    def _prefix_ids(self, prefix, country=""):
+        if len(prefix) <= SHORT_PREFIX and not country:
+            return self.short.get(prefix, [])
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", lo=start)
+        return set(self.key_ids[start:end].tolist())
+
+    def search(self, query, limit=5, fuzzy=True):
+        """
+        Cities whose name (or, for large cities, an alternate name) starts with
+        the query, most populous first. "city, country" narrows by country name
+        or ISO code. With no prefix match, names one edit away are tried.
+        """
+        city, _, country = query.partition(",")
+        city, country = fold(city), fold(country)
+        if not city:
+            return []
+        ids = [i for i in self._prefix_ids(city, country) if self._country_matches(i, country, prefix=True)]
+        if not ids and fuzzy and len(city) >= 4:
+            candidates = set()
+            for variant in _deletes(city) | {city}:
+                candidates.update(self.fuzzy.get(variant, ()))
+            ids = [i for i in candidates if self._country_matches(i, country, prefix=True)]
+        ids = sorted(set(ids), key=lambda i: -self.population[i])[:limit]
+        return [self.entry(i) for i in ids]
+
+    def lookup(self, city, country=""):
+        """
+        The most populous city named exactly `city` (any indexed name) in
+        `country`, given as its full name or ISO code, or None.
+        """
+        key, country = fold(city), fold(country or "")
+        start = bisect.bisect_left(self.keys, key)
+        best = None
+        for position in range(start, len(self.keys)):
+            if self.keys[position] != key:
+                break
+            index = int(self.key_ids[position])
+            if self._country_matches(index, country) and (best is None or self.population[index] > self.population[best]):
+                best = index
+        return None if best is None else self.entry(best)
+
+    def nearest(self, lat, lng, max_km=REVERSE_MAX_KM):
+        """The city closest to lat/lng within max_km, with its distance_km, or None."""
+        if self._tree is None:
+            return None
+        chord, index = self._tree.query(_unit_vectors([lat], [lng])[0])
+        distance_km = 2 * EARTH_RADIUS_KM * np.arcsin(min(1.0, chord / 2))
+        if distance_km > max_km:
+            return None
+        return self.entry(int(index), distance_km)
+
+
+_default = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+def default_gazetteer():
+    """Per-process gazetteer, loaded on first use; None if no dump has been downloaded."""
+    global _default, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            _default = Gazetteer.load()
+            _default_loaded = True
+        return _default
+
+
+def download(dataset=GAZETTEER_DATASET, directory=GAZETTEER_DIR):
+    """Fetch a GeoNames cities dump and countryInfo.txt into directory."""
+    import requests
+
+    os.makedirs(directory, exist_ok=True)
+    response = requests.get(f"{DOWNLOAD_URL}{dataset}.zip", timeout=300)
+    response.raise_for_status()
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        archive.extract(f"{dataset}.txt", directory)
+    response = requests.get(f"{DOWNLOAD_URL}countryInfo.txt", timeout=60)
+    response.raise_for_status()
+    with open(os.path.join(directory, "countryInfo.txt"), "wb") as f:
+        f.write(response.content)
+    gazetteer = Gazetteer.load(directory, dataset)
+    print(f"Indexed {len(gazetteer)} cities from {dataset} into {directory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the offline city gazetteer.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    fetch = subparsers.add_parser("download", help="Download and index a GeoNames cities dump")
+    fetch.add_argument("dataset", nargs="?", default=GAZETTEER_DATASET,
+                       choices=["cities15000", "cities5000", "cities1000", "cities500"])
+    search = subparsers.add_parser("search", help="Search the gazetteer")
+    search.add_argument("query")
+    reverse = subparsers.add_parser("reverse", help="Nearest city to a point")
+    reverse.add_argument("lat", type=float)
+    reverse.add_argument("lng", type=float)
+    args = parser.parse_args()
+
+    if args.command == "download":
+        download(args.dataset)
+        return 0
+    gazetteer = default_gazetteer()
+    if gazetteer is None:
+        print(f"No gazetteer data in {GAZETTEER_DIR}; run: python gazetteer.py download")
+        return 1
+    results = gazetteer.search(args.query) if args.command == "search" else [gazetteer.nearest(args.lat, args.lng)]
+    for result in results:
+        print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
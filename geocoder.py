@@ -0,0 +1,379 @@
+"""
+Geocoder for MapToPoster
+Nominatim lookups behind a persistent cache and a shared rate limiter.
+
+Cities are answered from the offline gazetteer (gazetteer.py) when its data
+has been downloaded; everything else goes to Nominatim. Nominatim results are
+cached in SQLite (cache/geocode.sqlite3) keyed by the normalized query, so the
+CLI, render jobs and the web app's search and reverse lookups all reuse each
+other's answers across restarts. Only real upstream calls go through the token
+bucket, whose state also lives in SQLite so every process together stays
+within Nominatim's usage policy of one request per second.
+
+Search-as-you-type is cheap on the server too: identical lookups already in
+flight in this process are coalesced into one upstream call, a lookup whose
+client has moved on to a newer query gives up while waiting for its turn, and
+a prefix is answered from the cached results of a longer query when possible.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import gazetteer
+import metrics
+
+GEOCODE_DB = os.environ.get(
+    "MAPTOPOSTER_GEOCODE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "geocode.sqlite3"),
+)
+
+# How long a found result is reused before asking Nominatim again
+GEOCODE_TTL_DAYS = float(os.environ.get("MAPTOPOSTER_GEOCODE_TTL_DAYS", "30"))
+# Places that weren't found are retried sooner, in case of a typo fixed upstream
+NOT_FOUND_TTL_SECONDS = 24 * 3600
+
+# Upstream requests per second across all processes, and how many may be sent back to back
+NOMINATIM_RATE = float(os.environ.get("MAPTOPOSTER_NOMINATIM_RATE", "1"))
+NOMINATIM_BURST = 1
+
+# Longest an interactive lookup waits for a rate-limit token before giving up
+INTERACTIVE_WAIT = 2.0
+
+# Shortest search answered from the cached results of a longer query ("par" from "paris")
+PREFIX_REUSE_MIN_LENGTH = 3
+
+# Seconds between cancellation checks while waiting for a rate-limit token or another request
+CANCEL_CHECK_INTERVAL = 0.05
+
+# Reverse lookups are cached per ~11 m cell
+REVERSE_PRECISION = 4
+
+# Seconds between deletions of expired cache rows
+PRUNE_INTERVAL = 3600
+
+USER_AGENT = "maptoposter"
+REQUEST_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocode_cache (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rate_limit (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class GeocoderRateLimited(Exception):
+    """No upstream request could be made within the allowed wait."""
+
+
+class Superseded(Exception):
+    """The caller's client sent a newer query, so this one was dropped."""
+
+
+class _Flight:
+    """An upstream lookup in progress that identical lookups wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def normalize_query(query):
+    """Case-, accent-width- and whitespace-insensitive form of a search query."""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = re.sub(r"\s*,\s*", ", ", query)
+    return re.sub(r"\s+", " ", query).strip(" ,")
+
+
+def place(location):
+    """Plain, JSON-serializable form of a geopy Location."""
+    return {
+        "display": location.address,
+        "lat": location.latitude,
+        "lng": location.longitude,
+        "raw": location.raw,
+    }
+
+
+def gazetteer_place(entry):
+    """A gazetteer entry in the same shape as place(), with a Nominatim-like address."""
+    return {
+        "display": f"{entry['name']}, {entry['country']}",
+        "lat": entry["lat"],
+        "lng": entry["lng"],
+        "raw": {
+            "address": {"city": entry["name"], "country": entry["country"], "country_code": entry["country_code"].lower()},
+            "type": "city",
+            "population": entry["population"],
+            "source": "gazetteer",
+        },
+    }
+
+
+class Geocoder:
+    """Cached, rate-limited Nominatim client shared by the CLI and the web app."""
+
+    def __init__(self, path=GEOCODE_DB, ttl_days=GEOCODE_TTL_DAYS, rate=NOMINATIM_RATE, burst=NOMINATIM_BURST,
+                 user_agent=USER_AGENT, use_gazetteer=True):
+        self.path = path
+        self.use_gazetteer = use_gazetteer
+        self.ttl = ttl_days * 86400
+        self.rate = rate
+        self.burst = burst
+        self.user_agent = user_agent
+        self._client = None
+        self._local = threading.local()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._pruned_at = 0.0
+        self._conn().executescript(SCHEMA)
+
+    @property
+    def client(self):
+        """The geopy Nominatim client, created (and geopy imported) on the first upstream call."""
+        if self._client is None:
+            from geopy.geocoders import Nominatim
+
+            self._client = Nominatim(user_agent=self.user_agent, timeout=REQUEST_TIMEOUT)
+        return self._client
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # --- Cache ---
+
+    def _get(self, key):
+        row = self._conn().execute(
+            "SELECT result FROM geocode_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _get_longer(self, key):
+        """Non-empty cached results of the shortest longer query that starts with key."""
+        row = self._conn().execute(
+            "SELECT result FROM geocode_cache WHERE key > ? AND key < ? AND expires_at > ? AND result != '[]' "
+            "ORDER BY length(key) LIMIT 1",
+            (key, key + "\uffff", time.time()),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _put(self, key, result):
+        now = time.time()
+        ttl = self.ttl if result else NOT_FOUND_TTL_SECONDS
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO geocode_cache (key, result, created_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(result), now, now + ttl),
+        )
+        if now - self._pruned_at >= PRUNE_INTERVAL:
+            self._pruned_at = now
+            conn.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (now,))
+
+    # --- Rate limiting ---
+
+    def acquire(self, max_wait=None, cancelled=None):
+        """
+        Take a token from the shared bucket, sleeping until one is available.
+        Raises GeocoderRateLimited if that would take longer than max_wait
+        seconds, and Superseded as soon as cancelled() returns true.
+        """
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        conn = self._conn()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated_at FROM rate_limit WHERE name = 'nominatim'").fetchone()
+                tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / self.rate
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit (name, tokens, updated_at) VALUES ('nominatim', ?, ?)",
+                    (tokens, now),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if wait == 0.0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise GeocoderRateLimited("Geocoding service is busy, try again shortly")
+            _sleep(wait, cancelled)
+
+    # --- Lookups ---
+
+    def _gazetteer(self):
+        return gazetteer.default_gazetteer() if self.use_gazetteer else None
+
+    def _offline(self, operation, result):
+        if result:
+            metrics.GEOCODE_CACHE_LOOKUPS.inc(operation=operation, result="gazetteer")
+        return result
+
+    def _lookup(self, operation, key, fetch, max_wait, cancelled=None, reuse_longer=False):
+        cached = self._get(key)
+        if cached is not None:
+            metrics.GEOCODE_CACHE_LOOKUPS.inc(operation=operation, result="hit")
+            return cached
+        if reuse_longer:
+            longer = self._get_longer(key)
+            if longer is not None:
+                metrics.GEOCODE_CACHE_LOOKUPS.inc(operation=operation, result="prefix")
+                return longer
+
+        while True:
+            with self._inflight_lock:
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _Flight()
+            if leader:
+                break
+            metrics.GEOCODE_CACHE_LOOKUPS.inc(operation=operation, result="coalesced")
+            while not flight.done.wait(CANCEL_CHECK_INTERVAL):
+                if cancelled is not None and cancelled():
+                    raise Superseded()
+            if flight.error is None:
+                return flight.result
+            if not isinstance(flight.error, (Superseded, GeocoderRateLimited)):
+                raise flight.error
+            # The leader's client moved on, or wouldn't wait as long for a token as
+            # this caller will: lead a new attempt with this caller's own max_wait
+
+        metrics.GEOCODE_CACHE_LOOKUPS.inc(operation=operation, result="miss")
+        try:
+            self.acquire(max_wait, cancelled)
+            if cancelled is not None and cancelled():
+                raise Superseded()
+            with metrics.NOMINATIM_DURATION.time(operation=operation) as timer:
+                result = fetch()
+                if not result:
+                    timer.outcome = "not_found"
+            self._put(key, result)
+            flight.result = result
+            return result
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def search(self, query, limit=1, language=None, max_wait=None, cancelled=None, autocomplete=False):
+        """
+        Places matching query (a list of place() dicts, best first).
+
+        cancelled() is polled while the lookup waits; once it returns true the
+        lookup raises Superseded. With autocomplete, a query is treated as a
+        prefix and may be answered from the cached results of a longer one.
+        """
+        cities = self._gazetteer()
+        if cities is not None:
+            found = self._offline("search", [gazetteer_place(entry) for entry in cities.search(query, limit)])
+            if found:
+                return found
+        return self._search_upstream(query, limit, language, max_wait, cancelled, autocomplete)
+
+    def _search_upstream(self, query, limit=1, language=None, max_wait=None, cancelled=None, autocomplete=False):
+        """search() against the cache and Nominatim only, never the gazetteer."""
+        key = f"search:{language or ''}:{limit}:{normalize_query(query)}"
+
+        def fetch():
+            locations = self.client.geocode(query, exactly_one=False, limit=limit, language=language or False)
+            return [place(location) for location in (locations or [])]
+
+        reuse_longer = autocomplete and len(normalize_query(query)) >= PREFIX_REUSE_MIN_LENGTH
+        return self._lookup("search", key, fetch, max_wait, cancelled, reuse_longer)
+
+    def reverse(self, lat, lng, language="en", max_wait=None, cancelled=None):
+        """The place at lat/lng as a place() dict, or None."""
+        cities = self._gazetteer()
+        if cities is not None:
+            entry = self._offline("reverse", cities.nearest(lat, lng))
+            if entry:
+                return gazetteer_place(entry)
+        lat, lng = round(float(lat), REVERSE_PRECISION), round(float(lng), REVERSE_PRECISION)
+        key = f"reverse:{language or ''}:{lat},{lng}"
+
+        def fetch():
+            location = self.client.reverse((lat, lng), language=language or False)
+            return place(location) if location else {}
+
+        return self._lookup("reverse", key, fetch, max_wait, cancelled) or None
+
+    def coordinates(self, city, country):
+        """(lat, lng, address) of the best match for a city, or None."""
+        cities = self._gazetteer()
+        if cities is not None:
+            entry = self._offline("search", cities.lookup(city, country))
+            if entry:
+                return entry["lat"], entry["lng"], gazetteer_place(entry)["display"]
+        # The gazetteer's search() prefix-matches countries ("Guinea" would find
+        # Guinea-Bissau), so a city it can't look up exactly goes upstream
+        results = self._search_upstream(f"{city}, {country}")
+        if not results:
+            return None
+        return results[0]["lat"], results[0]["lng"], results[0]["display"]
+
+
+def _sleep(seconds, cancelled=None):
+    """Sleep, waking early with Superseded if cancelled() becomes true."""
+    if cancelled is None:
+        time.sleep(seconds)
+        return
+    deadline = time.monotonic() + seconds
+    while True:
+        if cancelled():
+            raise Superseded()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(CANCEL_CHECK_INTERVAL, remaining))
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_geocoder():
+    """Per-process Geocoder, created on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Geocoder()
+        return _default
+
+
+def _reset_after_fork():
+    """A forked child gets its own Geocoder, never the parent's SQLite connections."""
+    global _default, _default_lock
+    _default = None
+    _default_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
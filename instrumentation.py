@@ -0,0 +1,111 @@
+"""
+Instrumentation for MapToPoster
+Per-stage wall time, CPU time and memory measurements for a single render.
+
+A RenderProfile is advanced with mark("stage") at each stage boundary, which
+closes the previous stage, so instrumenting a long function doesn't require
+re-indenting it. Data sizes (nodes, edges, features, vertices) are recorded
+with count(). tracemalloc adds noticeable overhead, so Python allocation
+peaks are only measured when MAPTOPOSTER_TRACEMALLOC=1.
+
+Memory per stage is the process's current resident set size, sampled at the
+stage boundaries: rss_mb when the stage ended and rss_growth_mb, the change
+over the stage (negative when memory was returned). Renders running side by
+side in one process show up in each other's figures. The process's peak RSS
+only ever grows, so it is reported once per render, as max_rss_mb.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_MEMORY = os.environ.get("MAPTOPOSTER_TRACEMALLOC", "0") == "1"
+
+
+def current_rss_mb():
+    """Current resident set size of this process in MB, from /proc (None where unsupported)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+def max_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RenderProfile:
+    """Stage-by-stage measurements of one render."""
+
+    def __init__(self, trace_memory=TRACE_MEMORY):
+        self.stages = {}
+        self.sizes = {}
+        self._order = []
+        self._current = None
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.thread_time()
+        self._totals = None
+        self._trace = trace_memory
+        self._owns_trace = False
+        if self._trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_trace = True
+
+    def mark(self, stage):
+        """End the current stage (if any) and start measuring `stage` (None to just stop)."""
+        now_wall = time.perf_counter()
+        now_cpu = time.thread_time()
+        rss = current_rss_mb()
+        if self._current is not None:
+            name, wall, cpu, rss_before = self._current
+            entry = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0})
+            entry["wall_s"] = round(entry["wall_s"] + now_wall - wall, 4)
+            entry["cpu_s"] = round(entry["cpu_s"] + now_cpu - cpu, 4)
+            if rss is not None and rss_before is not None:
+                entry["rss_mb"] = rss
+                entry["rss_growth_mb"] = round(entry.get("rss_growth_mb", 0.0) + rss - rss_before, 1)
+            if self._trace and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                entry["py_peak_mb"] = round(max(entry.get("py_peak_mb", 0.0), peak), 1)
+            if name not in self._order:
+                self._order.append(name)
+        self._current = None
+        if stage is not None:
+            if self._trace and tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            self._current = (stage, now_wall, now_cpu, rss)
+
+    def count(self, name, value):
+        """Record a data size such as nodes, edges or polygon vertices."""
+        self.sizes[name] = int(value)
+
+    def finish(self):
+        """Close the open stage and stop tracemalloc if this profile started it."""
+        self.mark(None)
+        self._totals = (time.perf_counter() - self._started_wall, time.thread_time() - self._started_cpu)
+        if self._owns_trace:
+            tracemalloc.stop()
+            self._owns_trace = False
+
+    def as_dict(self):
+        wall, cpu = self._totals or (time.perf_counter() - self._started_wall, time.thread_time() - self._started_cpu)
+        return {
+            "total_wall_s": round(wall, 4),
+            "total_cpu_s": round(cpu, 4),
+            "max_rss_mb": max_rss_mb(),
+            "stages": {name: dict(self.stages[name]) for name in self._order},
+            "sizes": dict(self.sizes),
+        }
@@ -0,0 +1,511 @@
+"""
+Job Runner for MapToPoster
+Executes poster jobs either on the calling thread or in a pool of worker processes.
+
+The process backend keeps matplotlib/GEOS state out of the web process: each
+dispatcher thread owns one worker process started with forkserver (or spawn),
+talks to it over a Pipe, and relays its progress events to the caller.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import create_map_poster as poster
+import job_timing
+import metrics
+from instrumentation import RenderProfile
+
+# "thread" runs jobs in the web process, "process" runs them in worker processes
+EXECUTION_BACKEND = os.environ.get("MAPTOPOSTER_EXECUTOR", "thread")
+WORKER_START_METHOD = os.environ.get("MAPTOPOSTER_START_METHOD", "forkserver")
+# Recycle a worker process after this many jobs to return fragmented memory to the OS
+WORKER_MAX_JOBS = int(os.environ.get("MAPTOPOSTER_WORKER_MAX_JOBS", "20"))
+# Address-space cap per worker process in MB (0 = unlimited)
+WORKER_MEMORY_LIMIT_MB = int(os.environ.get("MAPTOPOSTER_WORKER_MEMORY_MB", "0"))
+# Seconds a worker process gets to stop at a checkpoint after a cancel before it is killed
+CANCEL_GRACE_SECONDS = float(os.environ.get("MAPTOPOSTER_CANCEL_GRACE", "5"))
+# Seconds between cancellation checks while a job is running
+CANCEL_POLL_INTERVAL = 1.0
+# Have the forkserver import the rendering stack (render_worker) once, so new workers start warm
+WORKER_PRELOAD = os.environ.get("MAPTOPOSTER_WORKER_PRELOAD", "1") != "0"
+
+# Job fields forwarded to run_job
+JOB_PARAM_KEYS = (
+    "city", "country", "theme", "distance", "dpi", "format", "lat", "lng",
+    "font", "tagline", "pin", "pin_color", "aspect_ratio", "collection",
+    "render_key",
+)
+
+# Job fields that change the rendered output (collection only files the poster)
+RENDER_KEY_FIELDS = (
+    "city", "country", "theme", "distance", "dpi", "format", "lat", "lng",
+    "font", "tagline", "pin", "pin_color", "aspect_ratio",
+)
+
+
+def render_key(job):
+    """
+    Content hash of everything that affects a job's output, including the
+    theme's current colors so editing a theme never reuses a stale poster.
+    """
+    fields = {key: job.get(key) or None for key in RENDER_KEY_FIELDS}
+    fields["aspect_ratio"] = fields["aspect_ratio"] or "2:3"
+    for key in ("lat", "lng"):
+        if fields[key] is not None:
+            fields[key] = round(float(fields[key]), 6)
+    fields["theme_data"] = poster.THEME_STORE.raw(fields["theme"] or "")
+    encoded = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def file_poster(output_file, collection):
+    """Put a finished poster in a collection by updating its _config.json. Returns True if it changed."""
+    config_file = output_file.rsplit('.', 1)[0] + '_config.json'
+    try:
+        with open(config_file) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if config.get("collection") == collection:
+        return False
+    config["collection"] = collection
+    with open(config_file, 'w') as f:
+        json.dump(config, f, indent=2)
+    return True
+
+
+# Relative render cost per output format (SVG/PDF carry every path; laser SVG skips matplotlib)
+FORMAT_COST = {"png": 1.0, "pdf": 1.3, "svg": 1.6, "svg-laser": 0.5}
+
+
+def estimate_cost(job):
+    """
+    Rough relative cost of a job, 1.0 for the default 29 km / 300 DPI PNG.
+    Data volume grows with the area (distance²) and raster work with DPI².
+    """
+    distance = float(job.get("distance") or 29000)
+    dpi = float(job.get("dpi") or 300)
+    fmt = job.get("format") or "png"
+    cost = (distance / 29000) ** 2 * FORMAT_COST.get(fmt, 1.0)
+    if fmt in ("png", "pdf"):
+        cost *= (dpi / 300) ** 2
+    return round(cost, 4)
+
+
+def job_params(job):
+    """Extract picklable run_job keyword arguments from a job record."""
+    params = {key: job.get(key) for key in JOB_PARAM_KEYS}
+    params["output_format"] = params.pop("format")
+    params["aspect_ratio"] = params["aspect_ratio"] or "2:3"
+    return params
+
+
+_timing_model = None
+
+
+def timing_model():
+    """Per-process TimingModel, created on first use."""
+    global _timing_model
+    if _timing_model is None:
+        _timing_model = job_timing.TimingModel()
+    return _timing_model
+
+
+def _reset_after_fork():
+    """A forked child (render_worker) must not reuse the parent's SQLite connections."""
+    global _timing_model
+    _timing_model = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def remove_outputs(output_file):
+    """Delete a poster and its thumbnail/config, e.g. after a cancelled render."""
+    if not output_file:
+        return
+    base_name = output_file.rsplit('.', 1)[0]
+    for path in (output_file, f"{base_name}_thumb.png", f"{base_name}_config.json"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cancelled_event():
+    return {
+        "status": "cancelled",
+        "stage": "cancelled",
+        "percent": 100,
+        "message": "Cancelled",
+    }
+
+
+def run_job(job_id, emit, city, country, theme, distance, dpi, output_format, lat=None, lng=None, font=None, tagline=None, pin=None, pin_color=None, aspect_ratio="2:3", collection=None, render_key=None, is_cancelled=None):
+    """
+    Render one poster job and write its _config.json.
+
+    Progress is reported through emit(job_id, payload); errors are reported the
+    same way rather than raised, so the caller only has to deliver events.
+    is_cancelled() is polled at render checkpoints; a cancelled job removes any
+    partial output and reports status 'cancelled'. The render's stage
+    profile is written into _config.json and the timing history.
+    """
+    profile = RenderProfile()
+
+    def progress(info):
+        payload = dict(info)
+        payload["status"] = "running"
+        emit(job_id, payload)
+
+    output_file = None
+    try:
+        poster.check_cancelled(is_cancelled)
+        emit(
+            job_id,
+            {
+                "status": "running",
+                "stage": "queued",
+                "percent": 0,
+                "message": "Preparing map generation",
+            },
+        )
+
+        available_themes = poster.get_available_themes()
+        if theme not in available_themes:
+            raise ValueError(
+                f"Theme '{theme}' not found. Available themes: {', '.join(available_themes)}"
+            )
+
+        theme_data = poster.load_theme(theme)
+
+        # Use direct coordinates if provided, otherwise geocode city/country
+        profile.mark("geocode")
+        if lat is not None and lng is not None:
+            coords = (lat, lng)
+            progress({"stage": "geocode", "percent": 10, "message": "Using provided coordinates"})
+        else:
+            coords = poster.get_coordinates(city, country, progress=progress)
+
+        output_file = poster.generate_output_filename(city, theme, output_format)
+        # Lets a process runner clean up after killing the worker mid-save
+        emit(job_id, {"partial_output": output_file})
+        stats = poster.create_poster(
+            city, country, coords, distance, output_file, output_format, dpi=dpi, progress=progress, font_family=font, tagline=tagline, pin=pin, pin_color=pin_color, aspect_ratio=aspect_ratio,
+            theme=theme_data, cancel_check=is_cancelled, profile=profile,
+        )
+        profile_data = stats["profile"]
+
+        # Save config JSON for this poster
+        config = {
+            "city": city,
+            "country": country,
+            "lat": coords[0],
+            "lng": coords[1],
+            "distance": distance,
+            "theme": theme,
+            "font": font,
+            "dpi": dpi,
+            "format": output_format,
+            "tagline": tagline,
+            "pin": pin,
+            "pin_color": pin_color,
+            "aspect_ratio": aspect_ratio,
+            "collection": collection,
+            "render_key": render_key,
+            "profile": profile_data,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        config_file = output_file.rsplit('.', 1)[0] + '_config.json'
+        with open(config_file, 'w') as f:
+            json.dump(config, f, indent=2)
+
+        stages = {stage: values["wall_s"] for stage, values in profile_data["stages"].items()}
+        try:
+            timing_model().record(
+                job_id, distance, dpi, output_format, stats["cache_hit"], stats["nodes"], stats["edges"],
+                profile_data["total_wall_s"], stages,
+            )
+        except Exception as e:
+            poster.log(f"  [Timing] Could not record job timings: {e}")
+
+        output_url = f"/posters/{os.path.basename(output_file)}"
+        thumb_url = f"/posters/{os.path.basename(output_file).rsplit('.', 1)[0]}_thumb.png"
+        emit(
+            job_id,
+            {
+                "status": "done",
+                "stage": "done",
+                "percent": 100,
+                "message": "Poster ready",
+                "output": output_file,
+                "output_url": output_url,
+                "thumb_url": thumb_url,
+            },
+        )
+    except poster.JobCancelled:
+        remove_outputs(output_file)
+        emit(job_id, cancelled_event())
+    except Exception as exc:
+        emit(
+            job_id,
+            {
+                "status": "error",
+                "stage": "error",
+                "percent": 100,
+                "message": "Generation failed",
+                "error": str(exc),
+            },
+        )
+
+
+def apply_memory_limit(limit_mb):
+    """Cap the worker's address space so a runaway render fails with MemoryError."""
+    if resource is None or not limit_mb:
+        return
+    limit = int(limit_mb) * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError) as e:
+        poster.log(f"  [Worker] Could not apply memory limit: {e}")
+
+
+def _worker_main(conn, memory_limit_mb):
+    """Entry point of a render worker process: run jobs received over conn until told to stop."""
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    # Ctrl-C reaches the whole process group; the parent decides whether a job is cancelled
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    apply_memory_limit(memory_limit_mb)
+
+    def emit(job_id, payload):
+        conn.send(("event", payload))
+
+    cancelled = False
+
+    def is_cancelled():
+        # The parent sends "cancel" while a job runs; only it can arrive mid-job
+        nonlocal cancelled
+        while not cancelled and conn.poll():
+            cancelled = conn.recv() == "cancel"
+        return cancelled
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        if task == "cancel":
+            # Arrived after the job it was meant for had already finished
+            continue
+        job_id, params = task
+        cancelled = False
+        run_job(job_id, emit, is_cancelled=is_cancelled, **params)
+        # Worker processes exit without running atexit handlers
+        metrics.flush()
+        conn.send(("finished", None))
+    conn.close()
+
+
+class WorkerProcess:
+    """A single render worker process and the parent end of its Pipe."""
+
+    def __init__(self, context, max_jobs, memory_limit_mb):
+        self.context = context
+        self.max_jobs = max_jobs
+        self.memory_limit_mb = memory_limit_mb
+        self.process = None
+        self.conn = None
+        self.jobs_done = 0
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory_limit_mb),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs_done = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self, timeout=5):
+        """Ask the worker to exit, killing it if it doesn't within timeout."""
+        if self.process is None or self.conn is None:
+            # Never started, or a Ctrl-C interrupted start() before it had a connection
+            return
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def kill(self):
+        """Terminate the worker immediately (used when a cancelled job ignores the request)."""
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def run(self, job_id, params, emit, is_cancelled=None):
+        """
+        Run one job in the worker, relaying its events to emit. Blocks until done.
+
+        When is_cancelled() turns true the worker is asked to stop at its next
+        checkpoint, and killed if it hasn't stopped after CANCEL_GRACE_SECONDS.
+        """
+        try:
+            if not self.is_alive():
+                self.start()
+            self.conn.send((job_id, params))
+        except Exception as exc:
+            self.process = None
+            self.conn = None
+            emit(
+                job_id,
+                {
+                    "status": "error",
+                    "stage": "error",
+                    "percent": 100,
+                    "message": "Generation failed",
+                    "error": f"Could not start render worker: {exc}",
+                },
+            )
+            return
+
+        partial_output = None
+        cancel_sent_at = None
+        last_cancel_check = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if is_cancelled is not None and cancel_sent_at is None and now - last_cancel_check >= CANCEL_POLL_INTERVAL:
+                last_cancel_check = now
+                if is_cancelled():
+                    cancel_sent_at = now
+                    try:
+                        self.conn.send("cancel")
+                    except (OSError, ValueError):
+                        pass
+            if cancel_sent_at is not None and now - cancel_sent_at >= CANCEL_GRACE_SECONDS:
+                self.kill()
+                remove_outputs(partial_output)
+                emit(job_id, cancelled_event())
+                return
+            try:
+                if not self.conn.poll(0.5):
+                    if not self.process.is_alive():
+                        break
+                    continue
+                kind, payload = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == "event":
+                partial_output = payload.get("partial_output", partial_output)
+                if payload.get("status") == "done":
+                    # Saved in full; a worker dying from here on mustn't delete it
+                    partial_output = None
+                emit(job_id, payload)
+            elif kind == "finished":
+                self.jobs_done += 1
+                if self.max_jobs and self.jobs_done >= self.max_jobs:
+                    self.stop()
+                return
+
+        # The worker died mid-job (memory cap, segfault in a C extension, ...);
+        # drop whatever it had written so the half-saved poster isn't indexed
+        remove_outputs(partial_output)
+        self.process.join(1)
+        exitcode = self.process.exitcode
+        self.conn.close()
+        self.process = None
+        self.conn = None
+        emit(
+            job_id,
+            {
+                "status": "error",
+                "stage": "error",
+                "percent": 100,
+                "message": "Generation failed",
+                "error": f"Render worker exited unexpectedly (exit code {exitcode})",
+            },
+        )
+
+
+class ThreadRunner:
+    """Runs jobs directly on the dispatcher thread."""
+
+    def run(self, job_id, params, emit, is_cancelled=None):
+        run_job(job_id, emit, is_cancelled=is_cancelled, **params)
+
+    def shutdown(self):
+        pass
+
+
+class ProcessRunner:
+    """
+    Runs jobs in worker processes. Each dispatcher thread lazily gets its own
+    worker, so the pool size equals the number of dispatcher threads.
+    """
+
+    def __init__(self, start_method=WORKER_START_METHOD, max_jobs=WORKER_MAX_JOBS, memory_limit_mb=WORKER_MEMORY_LIMIT_MB):
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver" and WORKER_PRELOAD:
+            self.context.set_forkserver_preload(["render_worker"])
+        self.max_jobs = max_jobs
+        self.memory_limit_mb = memory_limit_mb
+        self._local = threading.local()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _worker(self):
+        worker = getattr(self._local, "worker", None)
+        if worker is None:
+            worker = WorkerProcess(self.context, self.max_jobs, self.memory_limit_mb)
+            self._local.worker = worker
+            with self._lock:
+                self._workers.append(worker)
+        return worker
+
+    def run(self, job_id, params, emit, is_cancelled=None):
+        self._worker().run(job_id, params, emit, is_cancelled=is_cancelled)
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers:
+                worker.stop()
+
+
+def make_runner(backend=EXECUTION_BACKEND):
+    """Create the job runner for the configured execution backend."""
+    if backend == "process":
+        return ProcessRunner()
+    if backend != "thread":
+        poster.log(f"⚠ Unknown executor '{backend}', using threads")
+    return ThreadRunner()
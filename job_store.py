@@ -0,0 +1,501 @@
+"""
+Job Store for MapToPoster
+SQLite-backed job records and queue shared by every web and render worker process.
+
+The database runs in WAL mode so readers (status polls, SSE streams) never block
+the writer, and render workers claim jobs with a single IMMEDIATE transaction so
+two processes can never pick up the same job.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_DB_PATH = os.environ.get(
+    "MAPTOPOSTER_JOB_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "jobs.sqlite3"),
+)
+
+# Columns that progress events may update
+STATE_FIELDS = ("status", "stage", "progress", "message", "output", "output_url", "thumb_url", "error")
+
+FINISHED_STATUSES = ("done", "error", "cancelled")
+
+# Scheduling lanes, served strictly in this order
+PRIORITIES = {"interactive": 0, "single": 1, "batch": 2}
+DEFAULT_PRIORITY = "single"
+
+# Fields stored in their own columns rather than in the params JSON
+SCHEDULE_FIELDS = ("priority", "owner", "cost", "estimate")
+
+# Claim order: lane, fair-share round, cheapest first, then submission order
+SCHEDULE_ORDER = "priority, round, cost, seq"
+
+# A job interrupted by a dead worker is re-queued this many times before it is failed
+MAX_ATTEMPTS = 2
+
+# Running jobs claimed on another host, whose worker can't be checked, are treated
+# as orphaned after this long without progress
+STALE_AFTER = 3600
+
+# Finished jobs are deleted once older than this many hours...
+JOB_RETENTION_HOURS = float(os.environ.get("MAPTOPOSTER_JOB_RETENTION_HOURS", "24"))
+# ...or once more than this many finished jobs are kept
+JOB_HISTORY_LIMIT = int(os.environ.get("MAPTOPOSTER_JOB_HISTORY", "500"))
+# Minimum seconds between retention sweeps
+PRUNE_INTERVAL = 60
+
+# Distinguishes this process from an earlier one that happened to get the same pid
+INSTANCE_ID = uuid.uuid4().hex[:8]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    output TEXT,
+    output_url TEXT,
+    thumb_url TEXT,
+    error TEXT,
+    params TEXT NOT NULL,
+    batch_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    claimed_by TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    render_key TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 1,
+    owner TEXT,
+    round INTEGER NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 1,
+    estimate REAL,
+    started_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_seq ON jobs (status, seq);
+"""
+
+# Columns added after the first release, applied to existing databases on open
+MIGRATIONS = (
+    ("render_key", "ALTER TABLE jobs ADD COLUMN render_key TEXT"),
+    ("cancel_requested", "ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0"),
+    ("priority", "ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1"),
+    ("owner", "ALTER TABLE jobs ADD COLUMN owner TEXT"),
+    ("round", "ALTER TABLE jobs ADD COLUMN round INTEGER NOT NULL DEFAULT 0"),
+    ("cost", "ALTER TABLE jobs ADD COLUMN cost REAL NOT NULL DEFAULT 1"),
+    ("estimate", "ALTER TABLE jobs ADD COLUMN estimate REAL"),
+    ("started_at", "ALTER TABLE jobs ADD COLUMN started_at REAL"),
+)
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_jobs_render_key ON jobs (render_key, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (updated_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_schedule ON jobs (status, priority, round, cost, seq);
+"""
+
+
+def _process_start(pid):
+    """Start time of a process in clock ticks since boot, or None (not running, or no /proc)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name (field 2) may contain spaces; field 3 onwards follow its closing parenthesis
+    return stat[stat.rindex(")") + 2:].split()[19]
+
+
+def worker_identity():
+    """
+    Identify the claiming thread as host:pid:instance:thread for orphan
+    detection. The instance includes the process start time where /proc has
+    it, so a later process that reuses the pid (after a container restart)
+    isn't mistaken for the claimant.
+    """
+    start = _process_start(os.getpid())
+    instance = INSTANCE_ID if start is None else f"{INSTANCE_ID}.{start}"
+    return f"{socket.gethostname()}:{os.getpid()}:{instance}:{threading.get_ident()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _claimant_alive(pid, instance):
+    """Whether the process on this host that claimed a job (pid and instance from worker_identity) still runs."""
+    instance_id, _, start = instance.partition(".")
+    if pid == os.getpid():
+        return instance_id == INSTANCE_ID
+    if not _pid_alive(pid):
+        return False
+    current = _process_start(pid) if start else None
+    return current is None or current == start
+
+
+class JobStore:
+    """Durable job queue. Each thread gets its own SQLite connection."""
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, statement in MIGRATIONS:
+            if column not in columns:
+                conn.execute(statement)
+        conn.executescript(INDEXES)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row):
+        job = json.loads(row["params"])
+        job.update(
+            {
+                "id": row["id"],
+                "seq": row["seq"],
+                "status": row["status"],
+                "stage": row["stage"],
+                "progress": row["progress"],
+                "message": row["message"],
+                "output": row["output"],
+                "output_url": row["output_url"],
+                "thumb_url": row["thumb_url"],
+                "error": row["error"],
+                "batch_id": row["batch_id"],
+                "render_key": row["render_key"],
+                "priority": next(
+                    (name for name, value in PRIORITIES.items() if value == row["priority"]), DEFAULT_PRIORITY
+                ),
+                "owner": row["owner"],
+                "cost": row["cost"],
+                "estimate": row["estimate"],
+                "started_at": row["started_at"],
+                "created_at": row["created_at"],
+                "updated_at": row["updated_at"],
+            }
+        )
+        return job
+
+    def enqueue(self, jobs):
+        """
+        Insert one or more queued jobs (dicts with an 'id' and render parameters).
+
+        Scheduling fields: 'priority' (a PRIORITIES lane), 'owner' (the client or
+        batch the job is fair-shared under) and 'cost' (estimated render cost).
+        Within a lane each owner gets one job per round, so a large batch can't
+        hold back another owner's jobs; a newcomer joins at the current round.
+
+        A job whose 'render_key' matches a queued or running job is not inserted;
+        the caller is attached to the in-flight job instead, which takes over its
+        'collection' if it has one. Returns a (job_id, queue_position) pair per
+        job, in order.
+        """
+        if isinstance(jobs, dict):
+            jobs = [jobs]
+        now = time.time()
+        conn = self._conn()
+        job_ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for job in jobs:
+                key = job.get("render_key")
+                priority = PRIORITIES.get(job.get("priority"), PRIORITIES[DEFAULT_PRIORITY])
+                if key:
+                    row = conn.execute(
+                        "SELECT id FROM jobs WHERE render_key = ? AND status IN ('queued', 'running') "
+                        "ORDER BY seq LIMIT 1",
+                        (key,),
+                    ).fetchone()
+                    if row is not None:
+                        # An interactive duplicate of a batch job shouldn't wait in the batch lane
+                        conn.execute(
+                            "UPDATE jobs SET priority = MIN(priority, ?) WHERE id = ? AND status = 'queued'",
+                            (priority, row["id"]),
+                        )
+                        if job.get("collection"):
+                            # The poster is filed where the latest request asked (see job_runner.file_poster)
+                            conn.execute(
+                                "UPDATE jobs SET params = json_set(params, '$.collection', ?) WHERE id = ?",
+                                (job["collection"], row["id"]),
+                            )
+                        job_ids.append(row["id"])
+                        continue
+                owner = job.get("owner") or job.get("batch_id") or job["id"]
+                current, last = conn.execute(
+                    "SELECT MIN(round), MAX(CASE WHEN owner = ? THEN round END) FROM jobs "
+                    "WHERE status = 'queued' AND priority = ?",
+                    (owner, priority),
+                ).fetchone()
+                current = current or 0
+                round_ = current if last is None else max(current, last + 1)
+                params = {
+                    k: v for k, v in job.items()
+                    if k not in STATE_FIELDS and k not in SCHEDULE_FIELDS and k not in ("id", "batch_id", "created_at")
+                }
+                conn.execute(
+                    "INSERT INTO jobs (id, status, stage, progress, message, params, batch_id, created_at, updated_at, "
+                    "render_key, priority, owner, round, cost, estimate) "
+                    "VALUES (?, 'queued', 'queued', 0, 'Queued', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job["id"], json.dumps(params), job.get("batch_id"), now, now,
+                        key, priority, owner, round_, float(job.get("cost") or 1.0), job.get("estimate"),
+                    ),
+                )
+                job_ids.append(job["id"])
+            # Positions are taken after the whole batch is in, since cheaper jobs may sort ahead
+            results = [(job_id, self._position(conn, job_id) or 0) for job_id in job_ids]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def add_finished(self, job, result):
+        """Record a job that is already done, e.g. one answered from an existing poster."""
+        now = time.time()
+        params = {
+            k: v for k, v in job.items()
+            if k not in STATE_FIELDS and k not in SCHEDULE_FIELDS and k not in ("id", "batch_id", "created_at")
+        }
+        self._conn().execute(
+            "INSERT INTO jobs (id, status, stage, progress, message, output, output_url, thumb_url, "
+            "params, batch_id, created_at, updated_at, render_key) "
+            "VALUES (?, 'done', 'done', 100, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job["id"], result.get("message", "Poster ready"), result.get("output"),
+                result.get("output_url"), result.get("thumb_url"), json.dumps(params),
+                job.get("batch_id"), now, now, job.get("render_key"),
+            ),
+        )
+
+    def find_done(self, render_key):
+        """Most recent finished job with this render key, or None."""
+        row = self._conn().execute(
+            "SELECT * FROM jobs WHERE render_key = ? AND status = 'done' ORDER BY seq DESC LIMIT 1",
+            (render_key,),
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get_many(self, job_ids):
+        """Map of job id -> job for the ids that exist."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        marks = ",".join("?" for _ in job_ids)
+        rows = self._conn().execute(f"SELECT * FROM jobs WHERE id IN ({marks})", job_ids).fetchall()
+        return {row["id"]: self._row_to_job(row) for row in rows}
+
+    def list(self, statuses=None):
+        """All jobs (optionally filtered by status) in submission order."""
+        if statuses:
+            marks = ",".join("?" for _ in statuses)
+            rows = self._conn().execute(
+                f"SELECT * FROM jobs WHERE status IN ({marks}) ORDER BY seq", tuple(statuses)
+            ).fetchall()
+        else:
+            rows = self._conn().execute("SELECT * FROM jobs ORDER BY seq").fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def _position(self, conn, job_id):
+        row = conn.execute(
+            "SELECT priority, round, cost, seq FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return conn.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND ({SCHEDULE_ORDER}) <= (?, ?, ?, ?)",
+            tuple(row),
+        ).fetchone()[0]
+
+    def queue_position(self, job_id):
+        """1-based position in claim order among queued jobs, or None if the job isn't queued."""
+        return self._position(self._conn(), job_id)
+
+    def queued(self):
+        """Queued jobs in the order workers will claim them."""
+        rows = self._conn().execute(
+            f"SELECT * FROM jobs WHERE status = 'queued' ORDER BY {SCHEDULE_ORDER}"
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim_next(self, worker_id=None):
+        """Atomically move the next queued job (see SCHEDULE_ORDER) to 'running' and return it, or None."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE status = 'queued' ORDER BY {SCHEDULE_ORDER} LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', claimed_by = ?, attempts = attempts + 1, "
+                "updated_at = ?, started_at = ? WHERE id = ?",
+                (worker_id or worker_identity(), time.time(), time.time(), row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def update(self, job_id, payload):
+        """Apply a progress event to a job. 'percent' maps to the progress column."""
+        fields = {}
+        for key in STATE_FIELDS:
+            if key in payload:
+                fields[key] = payload[key]
+        if "percent" in payload:
+            fields["progress"] = payload["percent"]
+        if not fields:
+            return
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        self._conn().execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    def cancel(self, job_id, message="Removed from queue"):
+        """Cancel a job only if it is still queued. Returns True if it was cancelled."""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'cancelled', message = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (message, time.time(), job_id),
+        )
+        return cursor.rowcount > 0
+
+    def request_cancel(self, job_id):
+        """
+        Cancel a queued job outright, or flag a running one so its worker stops
+        at the next checkpoint. Returns 'cancelled', 'cancelling' or None if the
+        job is missing or already finished.
+        """
+        if self.cancel(job_id, message="Cancelled"):
+            return "cancelled"
+        cursor = self._conn().execute(
+            "UPDATE jobs SET cancel_requested = 1, message = 'Cancelling', updated_at = ? "
+            "WHERE id = ? AND status = 'running'",
+            (time.time(), job_id),
+        )
+        return "cancelling" if cursor.rowcount else None
+
+    def is_cancel_requested(self, job_id):
+        row = self._conn().execute(
+            "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def cancel_all_queued(self, message="Queue cleared"):
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'cancelled', message = ?, updated_at = ? WHERE status = 'queued'",
+            (message, time.time()),
+        )
+        return cursor.rowcount
+
+    def prune(self, max_age_hours=None, max_finished=None, force=False):
+        """
+        Delete finished jobs older than max_age_hours and all but the newest
+        max_finished finished jobs. Queued and running jobs are never removed.
+        Runs at most once per PRUNE_INTERVAL unless forced; returns rows deleted.
+        """
+        now = time.time()
+        if not force and now - self._last_prune < PRUNE_INTERVAL:
+            return 0
+        self._last_prune = now
+        max_age_hours = JOB_RETENTION_HOURS if max_age_hours is None else max_age_hours
+        max_finished = JOB_HISTORY_LIMIT if max_finished is None else max_finished
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error', 'cancelled') AND updated_at < ?",
+                (now - max_age_hours * 3600,),
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'error', 'cancelled') AND seq NOT IN ("
+                "SELECT seq FROM jobs WHERE status IN ('done', 'error', 'cancelled') ORDER BY seq DESC LIMIT ?)",
+                (max_finished,),
+            ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def recover_orphans(self):
+        """
+        Re-queue jobs left 'running' by a process on this host that no longer exists
+        (server restart, crash), however recently they reported progress; a live
+        claimant keeps its job however long it runs. Jobs claimed elsewhere can't
+        be checked and are recovered once they go STALE_AFTER seconds without
+        progress. Jobs that already used MAX_ATTEMPTS are failed instead.
+        """
+        host = socket.gethostname()
+        now = time.time()
+        conn = self._conn()
+        recovered = 0
+        for row in conn.execute(
+            "SELECT id, claimed_by, attempts, updated_at, cancel_requested FROM jobs WHERE status = 'running'"
+        ).fetchall():
+            parts = (row["claimed_by"] or "").split(":")
+            try:
+                pid = int(parts[1]) if len(parts) == 4 and parts[0] == host else None
+            except ValueError:
+                pid = None
+            if pid is not None:
+                if _claimant_alive(pid, parts[2]):
+                    continue
+            elif now - row["updated_at"] <= STALE_AFTER:
+                continue
+            if row["cancel_requested"]:
+                conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', stage = 'cancelled', message = 'Cancelled', "
+                    "updated_at = ? WHERE id = ? AND status = 'running'",
+                    (now, row["id"]),
+                )
+            elif row["attempts"] >= MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET status = 'error', stage = 'error', progress = 100, "
+                    "message = 'Generation failed', error = 'Render worker was interrupted', "
+                    "updated_at = ? WHERE id = ? AND status = 'running'",
+                    (now, row["id"]),
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, "
+                    "message = 'Re-queued after restart', claimed_by = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = 'running'",
+                    (now, row["id"]),
+                )
+            recovered += 1
+        return recovered
@@ -0,0 +1,180 @@
+"""
+Job Timing for MapToPoster
+Records how long every poster job and each of its stages took (as measured by
+instrumentation.RenderProfile), and fits a run-time model from that history to
+estimate how long new jobs will take.
+
+History lives in the job database (cache/jobs.sqlite3) so every web and
+render worker process contributes to, and reads from, the same model.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from job_store import JOB_DB_PATH
+
+# Timing rows kept for fitting; older rows are discarded
+TIMING_HISTORY = 2000
+
+# Samples needed before the fitted model replaces the heuristic
+MIN_SAMPLES = 8
+
+# Seconds between model refits in a long-running process
+REFIT_INTERVAL = 60
+
+# Heuristic used until there is enough history: seconds per unit of estimated cost
+DEFAULT_SECONDS_PER_COST = float(os.environ.get("MAPTOPOSTER_SECONDS_PER_COST", "45"))
+
+# Edges per km² assumed before any job has recorded a graph size
+DEFAULT_EDGE_DENSITY = 400.0
+
+# Figure area in square inches for the default 2:3 poster (12 x 18 in)
+FIGURE_AREA_SQ_IN = 216.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_timings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT,
+    finished_at REAL NOT NULL,
+    distance INTEGER NOT NULL,
+    dpi INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    cache_hit INTEGER NOT NULL,
+    nodes INTEGER,
+    edges INTEGER,
+    total REAL NOT NULL,
+    stages TEXT NOT NULL
+);
+"""
+
+
+def area_km2(distance):
+    """Area of the downloaded bounding box (distance is half its side, in meters)."""
+    return (2 * float(distance) / 1000) ** 2
+
+
+def features(distance, dpi, fmt, cache_hit, edges):
+    """
+    Model inputs: a constant, the area downloaded on a cache miss, graph size,
+    raster megapixels, and graph size again for vector formats that write every path.
+    """
+    edges_k = (edges or 0) / 1000
+    raster_mp = (float(dpi) ** 2) * FIGURE_AREA_SQ_IN / 1e6 if fmt in ("png", "pdf") else 0.0
+    vector_edges_k = edges_k if fmt in ("svg", "pdf") else 0.0
+    return [
+        1.0,
+        0.0 if cache_hit else area_km2(distance),
+        edges_k,
+        raster_mp,
+        vector_edges_k,
+    ]
+
+
+class TimingModel:
+    """Timing history plus a least-squares run-time model fitted from it."""
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._coefficients = None
+        self._edge_density = DEFAULT_EDGE_DENSITY
+        self._samples = 0
+        self._fitted_at = 0.0
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def record(self, job_id, distance, dpi, fmt, cache_hit, nodes, edges, total, stages):
+        """Store the timings of a finished job."""
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO job_timings (job_id, finished_at, distance, dpi, format, cache_hit, nodes, edges, total, stages) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, time.time(), distance, dpi, fmt, int(bool(cache_hit)), nodes, edges, total, json.dumps(stages)),
+        )
+        conn.execute(
+            "DELETE FROM job_timings WHERE id <= (SELECT MAX(id) FROM job_timings) - ?", (TIMING_HISTORY,)
+        )
+
+    def history(self, limit=100):
+        rows = self._conn().execute(
+            "SELECT * FROM job_timings ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(row, stages=json.loads(row["stages"]), cache_hit=bool(row["cache_hit"])) for row in rows]
+
+    def fit(self):
+        """Refit from the stored history. Falls back to the heuristic with too few samples."""
+        rows = self._conn().execute(
+            "SELECT distance, dpi, format, cache_hit, edges, total FROM job_timings"
+        ).fetchall()
+        densities = [row["edges"] / area_km2(row["distance"]) for row in rows if row["edges"] and row["distance"]]
+        coefficients = None
+        if len(rows) >= MIN_SAMPLES:
+            x = np.array([features(r["distance"], r["dpi"], r["format"], r["cache_hit"], r["edges"]) for r in rows])
+            y = np.array([r["total"] for r in rows])
+            coefficients, *_ = np.linalg.lstsq(x, y, rcond=None)
+        with self._lock:
+            self._coefficients = coefficients
+            self._edge_density = float(np.median(densities)) if densities else DEFAULT_EDGE_DENSITY
+            self._samples = len(rows)
+            self._fitted_at = time.monotonic()
+
+    def _maybe_refit(self):
+        if time.monotonic() - self._fitted_at >= REFIT_INTERVAL:
+            self.fit()
+
+    def estimate(self, distance, dpi, fmt, cache_hit=False, edges=None, cost=None):
+        """Predicted run time in seconds. edges defaults to the typical density for the area."""
+        self._maybe_refit()
+        with self._lock:
+            coefficients = self._coefficients
+            density = self._edge_density
+        if coefficients is None:
+            return round(max(1.0, (cost or 1.0) * DEFAULT_SECONDS_PER_COST), 1)
+        if edges is None:
+            edges = density * area_km2(distance)
+        predicted = float(np.dot(coefficients, features(distance, dpi, fmt, cache_hit, edges)))
+        return round(max(1.0, predicted), 1)
+
+    def summary(self):
+        """Model state for capacity planning."""
+        self._maybe_refit()
+        with self._lock:
+            return {
+                "samples": self._samples,
+                "fitted": self._coefficients is not None,
+                "coefficients": None if self._coefficients is None else dict(zip(
+                    ("base", "download_km2", "edges_k", "raster_megapixels", "vector_edges_k"),
+                    (round(float(c), 4) for c in self._coefficients),
+                )),
+                "edge_density_per_km2": round(self._edge_density, 1),
+            }
+
+
+def schedule_eta(running, queued, workers):
+    """
+    Simulate the queue: running is a list of remaining seconds, queued a list of
+    estimates in claim order. Returns (start_in, finish_in) per queued job.
+    """
+    free_at = sorted(list(running) + [0.0] * max(1 - len(running), workers - len(running), 0))
+    result = []
+    for estimate in queued:
+        start = free_at.pop(0)
+        finish = start + estimate
+        free_at.append(finish)
+        free_at.sort()
+        result.append((round(start, 1), round(finish, 1)))
+    return result
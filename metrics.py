@@ -0,0 +1,427 @@
+"""
+Metrics for MapToPoster
+Counters, gauges and histograms exposed in the Prometheus text format at /metrics.
+
+gunicorn runs several web processes and the process backend adds render
+workers, so no single process sees every event. Each process keeps its own
+values in memory and periodically writes them to a per-process snapshot file
+in METRICS_DIR; a scrape merges every snapshot. Counters and histograms are
+summed across all processes, including ones that have exited (their files are
+folded into one archive so the directory doesn't grow). Gauges describe live
+state and are summed over running processes only.
+
+A snapshot records its process's start time (from /proc), so a snapshot left
+by an earlier container whose pid has been reused counts as exited.
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+METRICS_DIR = os.environ.get(
+    "MAPTOPOSTER_METRICS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "metrics"),
+)
+
+# Seconds between snapshot writes of a process with new values
+FLUSH_INTERVAL = 5
+
+# Default histogram buckets in seconds, from fast HTTP handlers to long renders
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+ARCHIVE_FILE = "archive.json"
+
+_METRICS = {}  # name -> metric, in definition order
+_lock = threading.Lock()
+_values = {}  # (name, labels) -> float, or [bucket counts..., sum, count] for histograms
+_dirty = False
+_flusher = None
+_token = uuid.uuid4().hex[:8]
+
+
+def _read_boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+# Whether process start times can be read; without /proc liveness falls back to the pid alone
+_HAVE_PROC = os.path.isdir("/proc/self")
+_BOOT_ID = _read_boot_id()
+
+
+def _process_start(pid):
+    """Boot id and start time (clock ticks since boot) of a process, or None if it isn't running."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name (field 2) may contain spaces; field 3 onwards follow its closing parenthesis
+    return f"{_BOOT_ID}:{stat[stat.rindex(')') + 2:].split()[19]}"
+
+
+_start = _process_start(os.getpid())
+
+
+def _reset_after_fork():
+    """A forked child starts with empty values and its own snapshot file."""
+    global _lock, _values, _dirty, _flusher, _token, _start
+    _lock = threading.Lock()
+    _values = {}
+    _dirty = False
+    _flusher = None
+    _token = uuid.uuid4().hex[:8]
+    _start = _process_start(os.getpid())
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _METRICS[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return (self.name, tuple(str(labels[label]) for label in self.labels))
+
+    def _add(self, labels, amount):
+        global _dirty
+        key = self._key(labels)
+        with _lock:
+            _values[key] = _values.get(key, 0.0) + amount
+            _dirty = True
+        _ensure_flusher()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self._add(labels, amount)
+
+
+class Gauge(Metric):
+    """Per-process gauge; a scrape reports the sum over live processes."""
+
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        self._add(labels, amount)
+
+    def dec(self, amount=1, **labels):
+        self._add(labels, -amount)
+
+    def set(self, value, **labels):
+        global _dirty
+        key = self._key(labels)
+        with _lock:
+            _values[key] = float(value)
+            _dirty = True
+        _ensure_flusher()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        global _dirty
+        key = self._key(labels)
+        with _lock:
+            entry = _values.get(key)
+            if entry is None:
+                entry = _values[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+            _dirty = True
+        _ensure_flusher()
+
+    def time(self, **labels):
+        """
+        Context manager observing the duration of its block. If the histogram
+        has an outcome label that isn't given, it is "ok", or "error" when the
+        block raises; the block may set timer.outcome itself.
+        """
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.outcome = labels.get("outcome")
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = dict(self.labels)
+        if "outcome" in self.histogram.labels:
+            labels["outcome"] = self.outcome or ("error" if exc_type else "ok")
+        self.histogram.observe(time.perf_counter() - self.started, **labels)
+        return False
+
+
+# --- Metric definitions, shared by every process ---
+
+HTTP_REQUESTS = Counter(
+    "maptoposter_http_requests_total", "HTTP requests handled.", ("method", "endpoint", "status")
+)
+HTTP_DURATION = Histogram(
+    "maptoposter_http_request_duration_seconds", "Time to produce an HTTP response.", ("method", "endpoint")
+)
+SSE_CONNECTIONS = Gauge(
+    "maptoposter_sse_connections", "Open server-sent event streams.", ("stream",)
+)
+JOBS_FINISHED = Counter(
+    "maptoposter_jobs_finished_total", "Poster jobs that left the running state.", ("status",)
+)
+JOB_DURATION = Histogram(
+    "maptoposter_job_duration_seconds", "Time from a job being claimed to it finishing.", ("format", "status")
+)
+JOB_QUEUE_WAIT = Histogram(
+    "maptoposter_job_queue_wait_seconds", "Time a job waited in the queue before a worker claimed it.", ("priority",)
+)
+MAP_CACHE_LOOKUPS = Counter(
+    "maptoposter_map_cache_lookups_total", "Map data cache lookups.", ("result",)
+)
+OVERPASS_DURATION = Histogram(
+    "maptoposter_overpass_request_duration_seconds", "OpenStreetMap downloads per layer.", ("layer", "outcome")
+)
+GEOCODE_CACHE_LOOKUPS = Counter(
+    "maptoposter_geocode_cache_lookups_total", "Geocoder cache lookups.", ("operation", "result")
+)
+NOMINATIM_DURATION = Histogram(
+    "maptoposter_nominatim_request_duration_seconds", "Nominatim geocoder requests.", ("operation", "outcome")
+)
+
+
+# --- Per-process snapshots ---
+
+def _snapshot_path():
+    return os.path.join(METRICS_DIR, f"pid-{os.getpid()}-{_token}.json")
+
+
+def _encode(values):
+    return [[name, list(labels), value] for (name, labels), value in values.items()]
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def flush():
+    """Write this process's values to its snapshot file."""
+    global _dirty
+    with _lock:
+        if not _values:
+            return
+        data = {"values": _encode(_values), "start": _start}
+        _dirty = False
+    try:
+        _write_json(_snapshot_path(), data)
+    except OSError:
+        pass
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if _dirty:
+            flush()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush)
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _snapshot_alive(pid, data):
+    """Whether the process that wrote a snapshot is still running (not just some process with its pid)."""
+    if _HAVE_PROC:
+        start = (data or {}).get("start")
+        return start is not None and _process_start(pid) == start
+    return pid == os.getpid() or _pid_alive(pid)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(totals, entries, include_gauges=True):
+    for name, labels, value in entries:
+        metric = _METRICS.get(name)
+        if metric is None or (metric.kind == "gauge" and not include_gauges):
+            continue
+        key = (name, tuple(labels))
+        if isinstance(value, list):
+            current = totals.get(key)
+            totals[key] = value[:] if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            totals[key] = totals.get(key, 0.0) + value
+
+
+def _archive_dead(dead_paths):
+    """Fold counters and histograms of exited processes into the archive file."""
+    if fcntl is None or not dead_paths:
+        return
+    with open(os.path.join(METRICS_DIR, "archive.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+        totals = {}
+        _merge(totals, (_read_json(archive_path) or {}).get("values", []))
+        merged = []
+        for path in dead_paths:
+            data = _read_json(path)
+            if data is None and os.path.exists(path):
+                continue
+            _merge(totals, (data or {}).get("values", []), include_gauges=False)
+            merged.append(path)
+        _write_json(archive_path, {"values": _encode(totals)})
+        for path in merged:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def collect():
+    """Merged values of every process: {(name, labels): value}."""
+    flush()
+    live, dead = {}, []
+    for path in glob.glob(os.path.join(METRICS_DIR, "pid-*.json")):
+        try:
+            pid = int(os.path.basename(path).split("-")[1])
+        except (IndexError, ValueError):
+            continue
+        data = _read_json(path)
+        if _snapshot_alive(pid, data):
+            live[path] = data
+        else:
+            dead.append(path)
+    try:
+        _archive_dead(dead)
+    except OSError:
+        pass
+
+    totals = {}
+    for data in live.values():
+        if data is not None:
+            _merge(totals, data.get("values", []))
+    for path in dead:
+        # Left over only if archiving failed; count its counters but not its gauges
+        data = _read_json(path) if os.path.exists(path) else None
+        if data is not None:
+            _merge(totals, data.get("values", []), include_gauges=False)
+    _merge(totals, (_read_json(os.path.join(METRICS_DIR, ARCHIVE_FILE)) or {}).get("values", []))
+    return totals
+
+
+# --- Exposition ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def gauge_family(name, documentation, samples, labels=()):
+    """Text for a gauge computed at scrape time; samples is [(label values, value)]."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for label_values, value in samples:
+        lines.append(f"{name}{_labels(labels, label_values)} {_number(value)}")
+    return "\n".join(lines)
+
+
+def render(extra=()):
+    """Prometheus text exposition of every defined metric, followed by `extra` families."""
+    totals = collect()
+    by_metric = {}
+    for (name, labels), value in sorted(totals.items()):
+        by_metric.setdefault(name, []).append((labels, value))
+
+    blocks = []
+    for name, metric in _METRICS.items():
+        lines = [f"# HELP {name} {metric.documentation}", f"# TYPE {name} {metric.kind}"]
+        for labels, value in by_metric.get(name, []):
+            if metric.kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(metric.labels, labels, [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(metric.labels, labels, [('le', '+Inf')])} {int(value[-1])}")
+                lines.append(f"{name}_sum{_labels(metric.labels, labels)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(metric.labels, labels)} {int(value[-1])}")
+            else:
+                lines.append(f"{name}{_labels(metric.labels, labels)} {_number(value)}")
+        blocks.append("\n".join(lines))
+    blocks.extend(extra)
+    return "\n".join(blocks) + "\n"
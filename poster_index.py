@@ -0,0 +1,257 @@
+"""
+Poster Index for MapToPoster
+Incremental index of generated posters, their thumbnails and _config.json files.
+
+Instead of listing the posters folder and parsing every config on each request,
+the index keeps one entry per poster in memory and only re-reads files whose
+mtime changed. The folder's own mtime (which changes whenever a file is added,
+removed or renamed) is checked on every access; a full stat of every file runs
+at most once per FULL_SCAN_INTERVAL, or right after the app edits a config in
+place. Entries are persisted to SQLite so a restart doesn't re-parse every
+config.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+POSTER_INDEX_DB = os.environ.get(
+    "MAPTOPOSTER_POSTER_INDEX_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "posters.sqlite3"),
+)
+
+# Seconds between full stat scans that catch files edited in place by other processes
+FULL_SCAN_INTERVAL = 30
+
+POSTER_EXTENSIONS = (".png", ".svg", ".pdf")
+
+SORT_KEYS = {
+    "mtime": lambda item: item["mtime"],
+    "city": lambda item: ((item["config"] or {}).get("city") or "").lower(),
+    "theme": lambda item: ((item["config"] or {}).get("theme") or "").lower(),
+    "filename": lambda item: item["filename"].lower(),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posters (
+    filename TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    config_mtime_ns INTEGER,
+    has_thumb INTEGER NOT NULL,
+    config TEXT
+);
+"""
+
+
+def _is_poster_file(name):
+    if "_thumb.png" in name or "_config.json" in name:
+        return False
+    return name.lower().endswith(POSTER_EXTENSIONS)
+
+
+class PosterIndex:
+    """In-memory poster catalog, newest first, kept in sync with the posters folder."""
+
+    def __init__(self, posters_dir, db_path=POSTER_INDEX_DB, full_scan_interval=FULL_SCAN_INTERVAL):
+        self.posters_dir = posters_dir
+        self.db_path = db_path
+        self.full_scan_interval = full_scan_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._state = {}  # filename -> (mtime_ns, config_mtime_ns, has_thumb)
+        self._entries = {}  # filename -> public item dict
+        self._sorted = []
+        self._by_render_key = {}  # render_key -> newest poster item with it
+        self._dir_mtime = None
+        self._last_full_scan = 0.0
+        self._etag = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            # Seed from the last run so unchanged configs are not parsed again
+            for filename, mtime_ns, config_mtime_ns, has_thumb, config in self._conn.execute(
+                "SELECT filename, mtime_ns, config_mtime_ns, has_thumb, config FROM posters"
+            ):
+                self._state[filename] = (mtime_ns, config_mtime_ns, bool(has_thumb))
+                self._entries[filename] = self._make_item(
+                    filename, mtime_ns, bool(has_thumb), json.loads(config) if config else None
+                )
+        return self._conn
+
+    def _make_item(self, filename, mtime_ns, has_thumb, config):
+        base_name = filename.rsplit(".", 1)[0]
+        return {
+            "filename": filename,
+            "url": f"/posters/{filename}",
+            "thumb_url": f"/posters/{base_name}_thumb.png" if has_thumb else None,
+            "config": config,
+            "path": os.path.abspath(os.path.join(self.posters_dir, filename)),
+            "mtime": mtime_ns / 1e9,
+            "has_thumb": has_thumb,
+        }
+
+    def _read_config(self, filename):
+        path = os.path.join(self.posters_dir, f"{filename.rsplit('.', 1)[0]}_config.json")
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _scan(self):
+        """Stat every file in the folder and update entries whose files changed."""
+        mtimes = {}
+        try:
+            with os.scandir(self.posters_dir) as it:
+                for entry in it:
+                    try:
+                        mtimes[entry.name] = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            pass
+
+        upserts = []
+        removed = [name for name in self._state if name not in mtimes]
+        for name, mtime_ns in mtimes.items():
+            if not _is_poster_file(name):
+                continue
+            base_name = name.rsplit(".", 1)[0]
+            config_mtime_ns = mtimes.get(f"{base_name}_config.json")
+            has_thumb = f"{base_name}_thumb.png" in mtimes
+            state = (mtime_ns, config_mtime_ns, has_thumb)
+            if self._state.get(name) == state:
+                continue
+            config = self._read_config(name) if config_mtime_ns is not None else None
+            self._state[name] = state
+            self._entries[name] = self._make_item(name, mtime_ns, has_thumb, config)
+            upserts.append((name, mtime_ns, config_mtime_ns, int(has_thumb), json.dumps(config) if config else None))
+
+        for name in removed:
+            del self._state[name]
+            del self._entries[name]
+
+        if upserts or removed:
+            conn = self._db()
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO posters VALUES (?, ?, ?, ?, ?)", upserts)
+            conn.executemany("DELETE FROM posters WHERE filename = ?", [(name,) for name in removed])
+            conn.execute("COMMIT")
+        if upserts or removed or self._etag is None:
+            self._sorted = sorted(self._entries.values(), key=lambda item: item["mtime"], reverse=True)
+            self._by_render_key = {}
+            for item in self._sorted:
+                key = (item["config"] or {}).get("render_key")
+                if key:
+                    self._by_render_key.setdefault(key, item)
+            signature = "|".join(f"{name}:{state}" for name, state in sorted(self._state.items()))
+            self._etag = hashlib.md5(signature.encode()).hexdigest()
+
+    def _refresh(self):
+        self._db()
+        now = time.monotonic()
+        try:
+            dir_mtime = os.stat(self.posters_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        if dir_mtime != self._dir_mtime or now - self._last_full_scan >= self.full_scan_interval:
+            self._dir_mtime = dir_mtime
+            self._last_full_scan = now
+            self._scan()
+
+    def invalidate(self):
+        """Force a full scan on next access (after a config or thumbnail is rewritten in place)."""
+        with self._lock:
+            self._dir_mtime = None
+            self._last_full_scan = 0.0
+
+    def items(self):
+        """All posters, newest first."""
+        with self._lock:
+            self._refresh()
+            return list(self._sorted)
+
+    def find(self, render_key):
+        """The newest poster rendered with this render key, or None."""
+        with self._lock:
+            self._refresh()
+            return self._by_render_key.get(render_key)
+
+    def etag(self):
+        """Changes whenever any poster, thumbnail or config changes."""
+        with self._lock:
+            self._refresh()
+            return self._etag
+
+    def query(self, offset=0, limit=None, sort="mtime", order="desc", theme=None, city=None,
+              collection=None, since=None, until=None, after=None, thumbs=False):
+        """
+        Filtered, sorted page of posters. Returns (items, total_matching).
+
+        city matches case-insensitively anywhere in the name; since/until are
+        Unix timestamps compared with the poster's modification time; thumbs
+        keeps only posters with a thumbnail. after is the (filename, mtime) of
+        the last item of the previous page and takes precedence over offset, so
+        pages stay stable while new posters arrive.
+        """
+        with self._lock:
+            self._refresh()
+            items = self._sorted
+        city = city.lower() if city else None
+        if theme or city or collection or since is not None or until is not None or thumbs:
+            matched = []
+            for item in items:
+                if thumbs and not item["has_thumb"]:
+                    continue
+                config = item["config"] or {}
+                if theme and config.get("theme") != theme:
+                    continue
+                if city and city not in (config.get("city") or "").lower():
+                    continue
+                if collection and config.get("collection") != collection:
+                    continue
+                if since is not None and item["mtime"] < since:
+                    continue
+                if until is not None and item["mtime"] > until:
+                    continue
+                matched.append(item)
+            items = matched
+        if sort != "mtime" or order != "desc":
+            items = sorted(items, key=SORT_KEYS.get(sort, SORT_KEYS["mtime"]), reverse=order == "desc")
+        total = len(items)
+        if after is not None:
+            offset = self._offset_after(items, after, sort, order)
+        end = None if limit is None else offset + limit
+        return items[offset:end], total
+
+    def collection_counts(self, thumbs=False):
+        """Number of posters in each collection (optionally only those with a thumbnail)."""
+        with self._lock:
+            self._refresh()
+            items = self._sorted
+        counts = {}
+        for item in items:
+            collection = (item["config"] or {}).get("collection")
+            if collection and (item["has_thumb"] or not thumbs):
+                counts[collection] = counts.get(collection, 0) + 1
+        return counts
+
+    @staticmethod
+    def _offset_after(items, after, sort, order):
+        filename, mtime = after
+        for position, item in enumerate(items):
+            if item["filename"] == filename:
+                return position + 1
+        # The cursor item was deleted: resume at the first item past its mtime
+        if sort == "mtime":
+            for position, item in enumerate(items):
+                if (item["mtime"] < mtime) if order == "desc" else (item["mtime"] > mtime):
+                    return position
+        return len(items)
@@ -0,0 +1,436 @@
+"""
+Poster Preview for MapToPoster
+Renders small raster previews of a poster straight into memory.
+
+A full render projects the street graph, classifies every edge and plots it
+through osmnx and geopandas at print resolution, then writes the poster, a
+thumbnail and a config file to posters/. A preview needs none of that: the
+map's projected geometry is reduced once per cached map to a PreviewGeometry
+(roads simplified to well under a pixel at preview size and packed per road
+class into flat float32 arrays, water, parks and ocean as ready-made
+matplotlib paths), which is kept in memory and under cache/preview/. Every
+preview after the first draws those arrays at screen resolution and returns
+the PNG bytes, typically well inside PREVIEW_BUDGET_SECONDS. The theme
+editor's vector preview (preview_svg) is built from the same geometry.
+
+Previews only use map data that is already cached; they never download.
+"""
+
+import collections
+import io
+import os
+import pickle
+import queue
+import threading
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+import create_map_poster as poster
+
+PREVIEW_CACHE_DIR = os.path.join(poster.CACHE_DIR, "preview")
+# Bump when PreviewGeometry's layout changes so stale pickles are rebuilt
+PREVIEW_CACHE_VERSION = 3
+# Preview geometries kept in memory, most recently used first
+PREVIEW_CACHE_ENTRIES = int(os.environ.get("MAPTOPOSTER_PREVIEW_CACHE_ENTRIES", "16"))
+# Geometry builds run at once; each loads a full street graph, so this bounds their memory
+PREVIEW_BUILD_WORKERS = max(1, int(os.environ.get("MAPTOPOSTER_PREVIEW_BUILD_WORKERS", "1")))
+# Seconds a preview request may take, including waiting for its geometry to be built
+PREVIEW_BUDGET_SECONDS = float(os.environ.get("MAPTOPOSTER_PREVIEW_BUDGET", "1.0"))
+# Pixel width limits for previews (the longer poster side is scaled to fit)
+PREVIEW_MIN_WIDTH = 200
+PREVIEW_MAX_WIDTH = 1200
+PREVIEW_DEFAULT_WIDTH = 600
+# Road simplification tolerance as a fraction of the map distance; at the
+# largest preview one pixel covers roughly distance / 600 meters
+SIMPLIFY_FRACTION = 1 / 1500
+
+# matplotlib Path codes, so building geometry doesn't need matplotlib
+_MOVETO, _LINETO, _CLOSEPOLY = 1, 2, 79
+
+
+class PreviewNotCached(Exception):
+    """The map data for a preview has not been downloaded yet."""
+
+
+class PreviewPending(Exception):
+    """The preview geometry is still being built; retry shortly."""
+
+
+class PreviewGeometry:
+    """
+    Projected, simplified map geometry for previews of one cached map.
+
+    Coordinates are float32 meters relative to origin (the projected center of
+    the map), which keeps them precise to well under a meter.
+    """
+
+    def __init__(self, crs, origin, bounds, roads, polygons, source_mtime):
+        self.crs = crs                # the projected CRS (UTM zone of the map)
+        self.origin = origin          # (x, y) in the projected CRS
+        self.bounds = bounds          # node extents (minx, miny, maxx, maxy), relative to origin
+        self.roads = roads            # road class -> (coords float32 (n, 2), offsets int32 (lines + 1,))
+        self.polygons = polygons      # "ocean"/"water"/"parks" -> (vertices float32 (n, 2), codes uint8 (n,))
+        self.source_mtime = source_mtime
+
+    def segments(self, road_class):
+        """The lines of one road class as a list of (n, 2) arrays, for a LineCollection."""
+        coords, offsets = self.roads[road_class]
+        return np.split(coords, offsets[1:-1])
+
+    @property
+    def vertices(self):
+        return sum(len(coords) for coords, _ in self.roads.values()) + sum(
+            len(vertices) for vertices, _ in self.polygons.values()
+        )
+
+
+def _pack_lines(geoms, origin):
+    """Flatten line geometries into (coords, offsets); multi-part lines become separate lines."""
+    parts = shapely.get_parts(geoms)
+    parts = parts[~shapely.is_empty(parts)]
+    if len(parts) == 0:
+        return np.zeros((0, 2), dtype=np.float32), np.zeros(1, dtype=np.int32)
+    coords, index = shapely.get_coordinates(parts, return_index=True)
+    counts = np.bincount(index, minlength=len(parts))
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int32)
+    return (coords - origin).astype(np.float32), offsets
+
+
+def _pack_polygons(geoms, origin):
+    """
+    Turn polygon geometries into one matplotlib path (vertices, codes). Rings are
+    oriented so holes stay empty under matplotlib's nonzero fill rule.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    geoms = geoms[shapely.get_type_id(geoms) > 2]  # Polygon and MultiPolygon only
+    parts = shapely.get_parts(shapely.orient_polygons(geoms))
+    parts = parts[~shapely.is_empty(parts)]
+    rings = shapely.get_rings(parts)
+    if len(rings) == 0:
+        return np.zeros((0, 2), dtype=np.float32), np.zeros(0, dtype=np.uint8)
+    vertices, index = shapely.get_coordinates(rings, return_index=True)
+    codes = np.full(len(vertices), _LINETO, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+    codes[starts] = _MOVETO
+    codes[np.concatenate((starts[1:], [len(codes)])) - 1] = _CLOSEPOLY
+    return (vertices - origin).astype(np.float32), codes
+
+
+def build_preview_geometry(map_data, dist, source_mtime=None):
+    """
+    Reduce cached map data, a (graph, water, parks, coastlines) tuple from
+    load_map_cache, to a PreviewGeometry.
+    """
+    G, water, parks, coastlines = map_data
+    # Two-way streets are stored once per direction; a preview only needs one
+    data = poster.RenderData.from_graph(G, one_way=True).project()
+    crs = data.crs
+    minx, miny, maxx, maxy = data.bounds
+    origin = np.array([(minx + maxx) / 2, (miny + maxy) / 2])
+
+    tolerance = max(dist * SIMPLIFY_FRACTION, 0.5)
+    classes = data.edge_classes()
+    roads = {
+        name: _pack_lines(shapely.simplify(data.lines(classes == code), tolerance), origin)
+        for code, name in enumerate(poster.ROAD_CLASSES)
+    }
+
+    polygons = {}
+    for name, layer in (("water", water), ("parks", parks)):
+        if layer is None or layer.empty:
+            continue
+        layer = layer[layer.geometry.type.isin(['Polygon', 'MultiPolygon'])]
+        if layer.empty:
+            continue
+        geoms = shapely.simplify(layer.to_crs(crs).geometry.values, tolerance)
+        polygons[name] = _pack_polygons(geoms, origin)
+
+    if coastlines is not None and not coastlines.empty:
+        try:
+            # Flood against the full node extent; every aspect ratio's crop lies inside it
+            ocean = poster.create_ocean_polygon(coastlines.to_crs(crs), box(minx, miny, maxx, maxy), crs)
+            if ocean is not None and not ocean.is_empty:
+                polygons["ocean"] = _pack_polygons([shapely.simplify(ocean, tolerance)], origin)
+        except Exception as e:
+            poster.log(f"  [Preview] Could not build ocean polygon: {e}")
+
+    bounds = (minx - origin[0], miny - origin[1], maxx - origin[0], maxy - origin[1])
+    return PreviewGeometry(crs, tuple(origin), bounds, roads, polygons, source_mtime)
+
+
+class PreviewCache:
+    """
+    PreviewGeometry per map cache key: an in-memory LRU in front of pickles
+    under PREVIEW_CACHE_DIR. Entries are rebuilt when their map data changes.
+    Builds are queued to PREVIEW_BUILD_WORKERS background threads, so a request
+    never waits past its budget and many requests can't load many graphs at once.
+    """
+
+    def __init__(self, directory=PREVIEW_CACHE_DIR, max_entries=PREVIEW_CACHE_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._svgs = collections.OrderedDict()  # cache key -> (PreviewGeometry, SVG text)
+        self._building = {}  # cache key -> threading.Event set when the build finishes
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, cache_key):
+        return os.path.join(self.directory, f"{cache_key}.pkl")
+
+    def _remember(self, cache_key, geometry):
+        with self._lock:
+            self._entries[cache_key] = geometry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, cache_key, source_mtime):
+        try:
+            with open(self._path(cache_key), "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if data.get("version") != PREVIEW_CACHE_VERSION or data["geometry"].source_mtime != source_mtime:
+            return None
+        return data["geometry"]
+
+    def _work(self):
+        while True:
+            self._build(*self._queue.get())
+
+    def _build(self, cache_key, dist, source_mtime, done):
+        try:
+            map_data = poster.load_map_cache(cache_key)
+            if map_data is None:
+                return
+            started = time.perf_counter()
+            geometry = build_preview_geometry(map_data, dist, source_mtime)
+            tmp_path = f"{self._path(cache_key)}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"version": PREVIEW_CACHE_VERSION, "geometry": geometry}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(cache_key))
+            self._remember(cache_key, geometry)
+            poster.log(f"  [Preview] Built {cache_key} ({geometry.vertices} vertices) in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            poster.log(f"  [Preview] Could not build {cache_key}: {e}")
+        finally:
+            with self._lock:
+                self._building.pop(cache_key, None)
+            done.set()
+
+    def get(self, lat, lng, dist, wait=None):
+        """
+        The PreviewGeometry for a map, waiting up to wait seconds if it has to
+        be built. Raises PreviewNotCached if the map hasn't been downloaded and
+        PreviewPending if the build is still running when the wait is over.
+        """
+        return self.get_cached(poster.get_cache_key(lat, lng, dist), dist, wait)
+
+    def get_cached(self, cache_key, dist, wait=None):
+        """get() for a map cache key (the name of a file in cache/map_data, without .pkl)."""
+        try:
+            source_mtime = os.path.getmtime(os.path.join(poster.MAP_CACHE_DIR, f"{cache_key}.pkl"))
+        except OSError:
+            raise PreviewNotCached(cache_key)
+
+        with self._lock:
+            geometry = self._entries.get(cache_key)
+            if geometry is not None and geometry.source_mtime == source_mtime:
+                self._entries.move_to_end(cache_key)
+                return geometry
+        geometry = self._load(cache_key, source_mtime)
+        if geometry is not None:
+            self._remember(cache_key, geometry)
+            return geometry
+
+        with self._lock:
+            done = self._building.get(cache_key)
+            if done is None:
+                done = self._building[cache_key] = threading.Event()
+                self._queue.put((cache_key, dist, source_mtime, done))
+                if len(self._workers) < PREVIEW_BUILD_WORKERS:
+                    worker = threading.Thread(target=self._work, name="preview-build", daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+        if not done.wait(wait):
+            raise PreviewPending(cache_key)
+        with self._lock:
+            geometry = self._entries.get(cache_key)
+        if geometry is None:
+            raise PreviewNotCached(cache_key)
+        return geometry
+
+    def svg(self, cache_key, dist, wait=None):
+        """
+        The theme editor's vector preview of a map (see preview_svg), kept in
+        memory and next to the geometry pickle. Raises like get_cached().
+        """
+        geometry = self.get_cached(cache_key, dist, wait)
+        with self._lock:
+            cached = self._svgs.get(cache_key)
+            if cached is not None and cached[0] is geometry:
+                return cached[1]
+        svg_path = os.path.join(self.directory, f"{cache_key}.v{PREVIEW_CACHE_VERSION}.svg")
+        try:
+            if os.path.getmtime(svg_path) >= os.path.getmtime(self._path(cache_key)):
+                with open(svg_path, encoding="utf-8") as f:
+                    content = f.read()
+            else:
+                content = None
+        except OSError:
+            content = None
+        if content is None:
+            content = preview_svg(geometry)
+            tmp_path = f"{svg_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, svg_path)
+        with self._lock:
+            self._svgs[cache_key] = (geometry, content)
+            self._svgs.move_to_end(cache_key)
+            while len(self._svgs) > self.max_entries:
+                self._svgs.popitem(last=False)
+        return content
+
+    def clear(self):
+        """Drop every preview geometry from memory and disk."""
+        with self._lock:
+            self._entries.clear()
+            self._svgs.clear()
+        for name in os.listdir(self.directory):
+            if name.endswith((".pkl", ".svg")):
+                os.remove(os.path.join(self.directory, name))
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """The process-wide PreviewCache, created on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = PreviewCache()
+        return _default
+
+
+def _svg_path_data(vertices, starts, closed):
+    """
+    SVG path data for runs of vertices beginning at starts. Uses implicit
+    lineto ("M x y x y ...") and one decimal, which is a tenth of a pixel here.
+    """
+    ends = np.append(starts[1:], len(vertices))
+    text = np.char.mod("%.1f", vertices).reshape(-1, 2)
+    pairs = np.char.add(np.char.add(text[:, 0], " "), text[:, 1])
+    close = "Z" if closed else ""
+    return "".join(f"M{' '.join(pairs[start:end])}{close}" for start, end in zip(starts, ends) if end - start > 1)
+
+
+def preview_svg(geometry, aspect_ratio="2:3", width=600):
+    """
+    A compact vector scene of a map for the theme editor: one <g> per layer
+    with stable ids (preview-bg, preview-water, preview-parks and
+    preview-roads-<class> for every road class), each holding a single path.
+    Colors are neutral placeholders; the editor restyles the groups from the
+    theme being edited, so the scene never depends on a theme.
+    """
+    fig_width, fig_height = poster.get_figure_size(aspect_ratio)
+    crop_xlim, crop_ylim = poster.crop_limits(geometry.bounds, fig_width / fig_height)
+    scale = width / (crop_xlim[1] - crop_xlim[0])
+    height = round((crop_ylim[1] - crop_ylim[0]) * scale)
+    # Line widths are in points on a fig_width-inch poster
+    points = width / (fig_width * 72)
+
+    def to_view(coords):
+        # Map meters to view units, flipping y so north is up
+        view = np.empty_like(coords)
+        view[:, 0] = (coords[:, 0] - crop_xlim[0]) * scale
+        view[:, 1] = (crop_ylim[1] - coords[:, 1]) * scale
+        return view
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}">',
+        f'<defs><clipPath id="preview-clip"><rect width="{width}" height="{height}"/></clipPath></defs>',
+        f'<g id="preview-bg"><rect width="{width}" height="{height}" fill="#FFFFFF"/></g>',
+        '<g clip-path="url(#preview-clip)">',
+    ]
+    def polygon_group(group, layers, color):
+        data = ""
+        for name in layers:
+            vertices, codes = geometry.polygons.get(name, (np.zeros((0, 2)), np.zeros(0)))
+            if len(vertices):
+                data += _svg_path_data(to_view(vertices), np.flatnonzero(codes == _MOVETO), closed=True)
+        return f'<g id="preview-{group}" fill="{color}" stroke="none"><path d="{data}"/></g>'
+
+    # Stacked like the poster: water, then roads (minor first), then parks
+    parts.append(polygon_group("water", ("ocean", "water"), "#C0C0C0"))
+    for name in reversed(poster.ROAD_CLASSES):
+        coords, offsets = geometry.roads[name]
+        data = _svg_path_data(to_view(coords), offsets[:-1], closed=False) if len(coords) else ""
+        parts.append(
+            f'<g id="preview-roads-{name}" fill="none" stroke="#3A3A3A" '
+            f'stroke-width="{poster.ROAD_CLASS_WIDTHS[name] * points:.2f}" stroke-linecap="round" '
+            f'stroke-linejoin="round"><path d="{data}"/></g>'
+        )
+    parts.append(polygon_group("parks", ("parks",), "#F0F0F0"))
+    parts.append('</g></svg>')
+    return "\n".join(parts)
+
+
+def render_preview(geometry, theme, city, country, point, width=PREVIEW_DEFAULT_WIDTH, font_family=None,
+                   tagline=None, pin=None, pin_color=None, aspect_ratio="2:3"):
+    """
+    Draw a poster preview from a PreviewGeometry and return it as PNG bytes.
+
+    The figure has the poster's size in inches and is rasterized at a low dpi,
+    so line widths, text and the center pin keep the poster's proportions.
+    """
+    from matplotlib.collections import LineCollection
+    from matplotlib.patches import PathPatch
+    from matplotlib.path import Path
+
+    ctx = poster.RenderContext(theme, font_family=font_family, aspect_ratio=aspect_ratio)
+    try:
+        fig, ax = ctx.create_figure()
+        fig_width, fig_height = fig.get_size_inches()
+        width = min(max(int(width), PREVIEW_MIN_WIDTH), PREVIEW_MAX_WIDTH)
+        dpi = width / max(fig_width, fig_height)
+
+        palette = theme.get('rgba', theme)
+        for zorder, name, color in ((0, "ocean", "water"), (1, "water", "water"), (2, "parks", "parks")):
+            if name in geometry.polygons:
+                vertices, codes = geometry.polygons[name]
+                if len(vertices):
+                    ax.add_patch(PathPatch(Path(vertices, codes), facecolor=palette[color], edgecolor='none', zorder=zorder))
+
+        # Minor roads first so major roads are drawn over them; like the poster's, roads
+        # sit above water (drawn after it at the same zorder) and below parks
+        for name in reversed(poster.ROAD_CLASSES):
+            if name in geometry.roads and len(geometry.roads[name][0]):
+                ax.add_collection(LineCollection(
+                    geometry.segments(name),
+                    colors=palette[poster.ROAD_CLASS_COLORS[name]],
+                    linewidths=poster.ROAD_CLASS_WIDTHS[name],
+                    zorder=1,
+                ))
+
+        crop_xlim, crop_ylim = poster.crop_limits(geometry.bounds, fig_width / fig_height)
+        ax.set_axis_off()
+        ax.set_aspect('equal', adjustable='box')
+        ax.set_xlim(crop_xlim)
+        ax.set_ylim(crop_ylim)
+        poster.draw_overlays(ctx, crop_xlim, crop_ylim, city, country, point,
+                             tagline=tagline, pin=pin, pin_color=pin_color)
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi, facecolor=theme['bg'])
+        return buffer.getvalue()
+    finally:
+        ctx.close()
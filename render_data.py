@@ -0,0 +1,233 @@
+"""
+Render Data for MapToPoster
+A compact, array-backed copy of a street network holding only what a poster draws.
+
+An osmnx MultiDiGraph keeps a Python dict per node and per edge, and
+projecting it (ox.project_graph) or plotting it (ox.plot_graph, which goes
+through a GeoDataFrame) makes further full copies; for a large metro that
+adds up to several GB. Rendering only needs node coordinates, edge geometry
+and each edge's highway tag, so RenderData stores exactly that:
+
+    node_x, node_y    float64 node coordinates
+    edge_coords       float64 (n, 2) vertices of every edge, edge after edge
+    edge_offsets      int64, edge i is edge_coords[edge_offsets[i]:edge_offsets[i + 1]]
+    edge_highway      uint8 codes into highway_names (the edge's OSM highway tag)
+
+It is built once from the graph; projection, crop limits, road
+classification, drawing and the laser export all work from it, so the graph
+can be released before any of them runs.
+"""
+
+import numpy as np
+import shapely
+
+# Road classes, major to minor, with the theme color and line width (points) each is drawn with
+ROAD_CLASSES = ("motorway", "primary", "secondary", "tertiary", "residential", "minor")
+ROAD_CLASS_COLORS = {
+    "motorway": "road_motorway",
+    "primary": "road_primary",
+    "secondary": "road_secondary",
+    "tertiary": "road_tertiary",
+    "residential": "road_residential",
+    "minor": "road_default",
+}
+ROAD_CLASS_WIDTHS = {
+    "motorway": 1.2,
+    "primary": 1.0,
+    "secondary": 0.8,
+    "tertiary": 0.6,
+    "residential": 0.4,
+    "minor": 0.4,
+}
+
+# Beyond these latitudes UTM is undefined and osmnx projects to UPS instead
+UTM_SOUTH_LIMIT = -80
+UTM_NORTH_LIMIT = 84
+
+
+def highway_tag(highway):
+    """The highway tag an edge is drawn as: the first entry of a list, 'unclassified' if empty."""
+    if isinstance(highway, list):
+        return highway[0] if highway else 'unclassified'
+    return highway
+
+
+def road_class(highway):
+    """
+    Road class (one of ROAD_CLASSES) of an OSM highway tag, which may be a list
+    (the first entry wins).
+    """
+    highway = highway_tag(highway)
+    if highway in ['motorway', 'motorway_link']:
+        return "motorway"
+    if highway in ['trunk', 'trunk_link', 'primary', 'primary_link']:
+        return "primary"
+    if highway in ['secondary', 'secondary_link']:
+        return "secondary"
+    if highway in ['tertiary', 'tertiary_link']:
+        return "tertiary"
+    if highway in ['residential', 'living_street', 'unclassified']:
+        return "residential"
+    return "minor"
+
+
+def utm_crs(lon_min, lat_min, lon_max, lat_max):
+    """
+    The projected CRS osmnx would pick for data within these lon/lat bounds:
+    the UTM zone at their center, or UPS near the poles.
+    """
+    from pyproj import CRS
+    from pyproj.aoi import AreaOfInterest
+    from pyproj.database import query_utm_crs_info
+
+    if lat_min < UTM_SOUTH_LIMIT:
+        return CRS.from_user_input("epsg:32761")
+    if lat_max > UTM_NORTH_LIMIT:
+        return CRS.from_user_input("epsg:32661")
+    lon = (lon_min + lon_max) / 2
+    lat = (lat_min + lat_max) / 2
+    zones = query_utm_crs_info(
+        datum_name="WGS 84",
+        area_of_interest=AreaOfInterest(west_lon_degree=lon, south_lat_degree=lat,
+                                        east_lon_degree=lon, north_lat_degree=lat),
+    )
+    return CRS.from_epsg(zones[0].code)
+
+
+class RenderData:
+    """Node coordinates, edge geometry and highway tags of a street network, in flat arrays."""
+
+    def __init__(self, crs, node_x, node_y, edge_coords, edge_offsets, edge_highway, highway_names):
+        self.crs = crs
+        self.node_x = node_x
+        self.node_y = node_y
+        self.edge_coords = edge_coords
+        self.edge_offsets = edge_offsets
+        self.edge_highway = edge_highway
+        self.highway_names = highway_names
+
+    @classmethod
+    def from_graph(cls, G, one_way=False):
+        """
+        Build from an osmnx graph in one pass over its edges. Edges without a
+        geometry become straight lines between their nodes. With one_way, an
+        edge whose reverse is also in the graph is kept only once.
+        """
+        node_index = {}
+        node_x = np.empty(G.number_of_nodes())
+        node_y = np.empty(G.number_of_nodes())
+        for i, (node, data) in enumerate(G.nodes(data=True)):
+            node_index[node] = i
+            node_x[i] = data['x']
+            node_y[i] = data['y']
+
+        names = {}
+        highway = []
+        ends = []        # (u index, v index) of every edge
+        numbers = []     # edges that have a geometry
+        geometries = []
+        for u, v, data in G.edges(data=True):
+            if one_way and u > v and G.has_edge(v, u):
+                continue
+            tag = highway_tag(data.get('highway', 'unclassified'))
+            highway.append(names.setdefault(tag, len(names)))
+            geometry = data.get('geometry')
+            if geometry is not None:
+                numbers.append(len(ends))
+                geometries.append(geometry)
+            ends.append((node_index[u], node_index[v]))
+
+        ends = np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+        numbers = np.asarray(numbers, dtype=np.int64)
+        counts = np.full(len(ends), 2, dtype=np.int64)
+        counts[numbers] = shapely.get_num_coordinates(geometries)
+        edge_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=edge_offsets[1:])
+        edge_coords = np.empty((int(edge_offsets[-1]), 2))
+
+        if geometries:
+            coords, index = shapely.get_coordinates(geometries, return_index=True)
+            # Position of each vertex within its edge, then its row in edge_coords
+            first = np.zeros(len(numbers) + 1, dtype=np.int64)
+            np.cumsum(counts[numbers], out=first[1:])
+            edge_coords[edge_offsets[numbers][index] + np.arange(len(coords)) - first[index]] = coords
+        straight = np.ones(len(ends), dtype=bool)
+        straight[numbers] = False
+        starts = edge_offsets[:-1][straight]
+        edge_coords[starts, 0] = node_x[ends[straight, 0]]
+        edge_coords[starts, 1] = node_y[ends[straight, 0]]
+        edge_coords[starts + 1, 0] = node_x[ends[straight, 1]]
+        edge_coords[starts + 1, 1] = node_y[ends[straight, 1]]
+
+        names = list(names)
+        dtype = np.uint8 if len(names) <= 256 else np.uint16
+        return cls(G.graph.get('crs'), node_x, node_y, edge_coords, edge_offsets,
+                   np.asarray(highway, dtype=dtype), names)
+
+    def project(self, to_crs=None):
+        """
+        A copy projected to to_crs, by default the UTM zone osmnx's
+        project_graph would choose for these nodes.
+        """
+        from pyproj import Transformer
+
+        if to_crs is None:
+            to_crs = utm_crs(*self.bounds)
+        transformer = Transformer.from_crs(self.crs or "epsg:4326", to_crs, always_xy=True)
+        node_x, node_y = transformer.transform(self.node_x, self.node_y)
+        edge_coords = np.column_stack(transformer.transform(self.edge_coords[:, 0], self.edge_coords[:, 1]))
+        return RenderData(to_crs, np.asarray(node_x), np.asarray(node_y), edge_coords,
+                          self.edge_offsets, self.edge_highway, self.highway_names)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_x)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_highway)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.node_x, self.node_y, self.edge_coords, self.edge_offsets, self.edge_highway
+        ))
+
+    @property
+    def bounds(self):
+        """Node extents (minx, miny, maxx, maxy)."""
+        return self.node_x.min(), self.node_y.min(), self.node_x.max(), self.node_y.max()
+
+    def edge_classes(self):
+        """Index into ROAD_CLASSES of every edge, as uint8."""
+        lookup = np.array([ROAD_CLASSES.index(road_class(name)) for name in self.highway_names], dtype=np.uint8)
+        return lookup[self.edge_highway]
+
+    def edge_colors(self, theme):
+        """(n, 4) RGBA color of every edge, by road class."""
+        from matplotlib.colors import to_rgba
+
+        # Prefer the precompiled RGBA tuples so matplotlib doesn't re-parse hex per class
+        palette = theme.get('rgba', theme)
+        lookup = np.array([to_rgba(palette[ROAD_CLASS_COLORS[name]]) for name in ROAD_CLASSES])
+        return lookup[self.edge_classes()]
+
+    def edge_widths(self):
+        """Line width in points of every edge, by road class."""
+        lookup = np.array([ROAD_CLASS_WIDTHS[name] for name in ROAD_CLASSES])
+        return lookup[self.edge_classes()]
+
+    def segments(self):
+        """Every edge's vertices as a list of (n, 2) views into edge_coords, for a LineCollection."""
+        return np.split(self.edge_coords, self.edge_offsets[1:-1])
+
+    def lines(self, mask=None):
+        """The edges (those selected by a boolean mask, if given) as an array of shapely LineStrings."""
+        counts = np.diff(self.edge_offsets)
+        index = np.repeat(np.arange(len(counts)), counts)
+        if mask is None:
+            return shapely.linestrings(self.edge_coords, indices=index)
+        keep = mask[index]
+        # Renumber the selected edges 0..k-1 so no output slots are left empty
+        renumbered = (np.cumsum(mask) - 1)[index[keep]]
+        return shapely.linestrings(self.edge_coords[keep], indices=renumbered)
@@ -0,0 +1,302 @@
+"""
+Render Worker for MapToPoster
+A render daemon that warms up once and forks a fresh process for every job.
+
+A new render process normally spends seconds importing osmnx, geopandas and
+matplotlib, loading the font registry and themes, and unpickling map data
+before it draws anything. The daemon does all of that once, up front, and
+then forks each claimed job from its warm state, so the first job is as fast
+as the hundredth and every job still runs in a process of its own that is
+thrown away afterwards (no memory growth, no state shared between renders).
+
+    python render_worker.py --concurrency 2
+    python app.py --worker                  # same daemon, MAX_CONCURRENT_JOBS jobs at once
+
+The daemon claims jobs from the shared job store like the web app's
+dispatcher threads do, so it can run next to Gunicorn with
+MAPTOPOSTER_EMBEDDED_WORKER=0. It stays single-threaded so forking is safe;
+jobs report progress straight to the store. Needs os.fork (not Windows).
+
+Importing this module also imports the whole rendering stack, which is why
+job_runner's forkserver preloads it: worker processes started from there
+skip the imports too.
+"""
+
+import argparse
+import collections
+import io
+import os
+import signal
+import sys
+import time
+import traceback
+
+import create_map_poster as poster
+import gazetteer
+import job_runner
+import job_store
+import metrics
+
+# The rendering stack, imported eagerly so every forked process starts with it loaded
+import geopandas  # noqa: F401
+import osmnx  # noqa: F401
+from matplotlib import font_manager
+from matplotlib.backends import backend_agg  # noqa: F401
+
+# Jobs rendered at once, one forked process each
+WORKER_CONCURRENCY = int(os.environ.get("MAPTOPOSTER_WORKER_CONCURRENCY", os.environ.get("MAX_CONCURRENT_JOBS", "1")))
+# Most-used map cache entries unpickled before forking, and how much cache file they may add up to
+HOT_CACHE_ENTRIES = int(os.environ.get("MAPTOPOSTER_WORKER_HOT_ENTRIES", "8"))
+HOT_CACHE_MB = float(os.environ.get("MAPTOPOSTER_WORKER_HOT_CACHE_MB", "512"))
+# Seconds between queue polls while idle, and between checks on running jobs
+POLL_INTERVAL = 0.5
+
+
+def hot_cache_keys(store, limit=HOT_CACHE_ENTRIES):
+    """
+    Map cache keys worth preloading: the places finished jobs rendered most
+    often, then the most recently written cache files.
+    """
+    counts = collections.Counter()
+    if store is not None:
+        for job in store.list(["done"]):
+            if job.get("lat") is not None and job.get("lng") is not None and job.get("distance"):
+                counts[poster.get_cache_key(float(job["lat"]), float(job["lng"]), job["distance"])] += 1
+    keys = [key for key, _ in counts.most_common()
+            if os.path.exists(os.path.join(poster.MAP_CACHE_DIR, f"{key}.pkl"))]
+    try:
+        files = [name for name in os.listdir(poster.MAP_CACHE_DIR) if name.endswith(".pkl")]
+    except OSError:
+        files = []
+    files.sort(key=lambda name: os.path.getmtime(os.path.join(poster.MAP_CACHE_DIR, name)), reverse=True)
+    for name in files:
+        key = name[:-len(".pkl")]
+        if key not in keys:
+            keys.append(key)
+    return keys[:limit]
+
+
+def warm_up(store=None, hot_entries=HOT_CACHE_ENTRIES, hot_mb=HOT_CACHE_MB):
+    """
+    Load everything a render needs before it starts: osmnx settings, every
+    theme, every font file and matplotlib's text path (by drawing a tiny
+    poster), the gazetteer and the hottest map cache entries. Returns a
+    summary dict.
+    """
+    started = time.perf_counter()
+    poster.get_osmnx()
+    themes = poster.get_available_themes()
+    for theme in themes:
+        poster.THEME_STORE.get(theme)
+
+    families = poster.discover_font_families()
+    font_files = [path for weights in families.values() for path in weights.values()]
+    for path in font_files:
+        try:
+            font_manager.get_font(path)
+        except Exception as e:
+            poster.log(f"  [Warm-up] Could not load font {path}: {e}")
+    ctx = poster.RenderContext(poster.load_theme())
+    try:
+        fig, ax = ctx.create_figure()
+        for weight in ("bold", "regular", "light"):
+            ax.text(0.5, 0.5, "MAPTOPOSTER 0123456789", fontproperties=ctx.font(weight, 12))
+        fig.savefig(io.BytesIO(), format="png", dpi=10)
+    finally:
+        ctx.close()
+
+    cities = gazetteer.default_gazetteer()
+    map_entries = poster.preload_map_cache(hot_cache_keys(store, hot_entries), max_mb=hot_mb) if hot_entries else []
+    return {
+        "seconds": round(time.perf_counter() - started, 2),
+        "themes": len(themes),
+        "fonts": len(font_files),
+        "gazetteer": len(cities) if cities is not None else 0,
+        "map_entries": len(map_entries),
+    }
+
+
+def _run_child(job, partial_fd):
+    """Body of a forked job process: render the job, report to the store, exit."""
+    # Shutdown is the daemon's call: a Ctrl-C in the terminal shouldn't kill renders mid-save
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 0
+    try:
+        job_runner.apply_memory_limit(job_runner.WORKER_MEMORY_LIMIT_MB)
+        # A connection inherited across fork must not be used, so the child opens its own
+        store = job_store.JobStore()
+        job_id = job["id"]
+
+        def emit(_job_id, payload):
+            if payload.get("partial_output"):
+                # Lets the daemon clean up if it has to kill this process
+                os.write(partial_fd, f"{payload['partial_output']}\n".encode("utf-8"))
+            store.update(job_id, payload)
+
+        job_runner.run_job(
+            job_id, emit, is_cancelled=lambda: store.is_cancel_requested(job_id), **job_runner.job_params(job)
+        )
+        if job["started_at"] and job["created_at"]:
+            metrics.JOB_QUEUE_WAIT.observe(job["started_at"] - job["created_at"], priority=job["priority"])
+        finished = store.get(job_id)
+        if finished is not None:
+            metrics.JOBS_FINISHED.inc(status=finished["status"])
+            metrics.JOB_DURATION.observe(
+                time.time() - (job["started_at"] or time.time()),
+                format=job.get("format") or "png",
+                status=finished["status"],
+            )
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        try:
+            metrics.flush()
+        finally:
+            # Skip the parent's atexit handlers and buffered output inherited across fork
+            os._exit(status)
+
+
+def _read_partial_output(fd):
+    """Last partial output path a child reported, or None."""
+    os.set_blocking(fd, False)
+    data = b""
+    try:
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            data += chunk
+    except BlockingIOError:
+        pass
+    lines = data.decode("utf-8", "replace").splitlines()
+    return lines[-1] if lines else None
+
+
+class RenderDaemon:
+    """Claims jobs from the store and renders each in a process forked from this warm one."""
+
+    def __init__(self, store, concurrency=WORKER_CONCURRENCY):
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.worker_id = job_store.worker_identity()
+        self.children = {}  # pid -> {"job_id", "partial_fd", "checked_at", "cancel_at"}
+        self.stopping = False
+
+    def fork_job(self, job):
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _run_child(job, write_fd)
+        os.close(write_fd)
+        self.children[pid] = {
+            "job_id": job["id"],
+            "partial_fd": read_fd,
+            "checked_at": time.monotonic(),
+            "cancel_at": None,
+        }
+        poster.log(f"[Worker] Job {job['id']} -> pid {pid} ({job['city']}, {job['theme']})")
+
+    def _finish(self, pid, exit_code):
+        child = self.children.pop(pid)
+        partial_output = _read_partial_output(child["partial_fd"])
+        os.close(child["partial_fd"])
+        job = self.store.get(child["job_id"])
+        if job is not None and job["status"] == "done" and job.get("collection"):
+            # A request attached while this job was running may have asked for another collection
+            job_runner.file_poster(job["output"], job["collection"])
+        if job is not None and job["status"] not in job_store.FINISHED_STATUSES:
+            # The process died mid-job (memory cap, segfault in a C extension, ...);
+            # drop whatever it had written so the half-saved poster isn't indexed
+            job_runner.remove_outputs(partial_output)
+            self.store.update(child["job_id"], {
+                "status": "error",
+                "stage": "error",
+                "percent": 100,
+                "message": "Generation failed",
+                "error": f"Render process exited unexpectedly (exit code {exit_code})",
+            })
+
+    def reap(self):
+        """Collect finished children and fail jobs whose process died without finishing them."""
+        for pid in list(self.children):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                self._finish(pid, os.waitstatus_to_exitcode(status))
+
+    def enforce_cancels(self):
+        """Kill children that haven't stopped within CANCEL_GRACE_SECONDS of a cancel request."""
+        now = time.monotonic()
+        for pid, child in list(self.children.items()):
+            if child["cancel_at"] is None:
+                if now - child["checked_at"] >= job_runner.CANCEL_POLL_INTERVAL:
+                    child["checked_at"] = now
+                    if self.store.is_cancel_requested(child["job_id"]):
+                        child["cancel_at"] = now
+            elif now - child["cancel_at"] >= job_runner.CANCEL_GRACE_SECONDS:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                job_runner.remove_outputs(_read_partial_output(child["partial_fd"]))
+                self.store.update(child["job_id"], job_runner.cancelled_event())
+                self._finish(pid, -signal.SIGKILL)
+
+    def stop(self, signum=None, frame=None):
+        if self.stopping:
+            # Second signal: don't wait for renders in progress
+            for pid in self.children:
+                os.kill(pid, signal.SIGKILL)
+            return
+        self.stopping = True
+        poster.log(f"[Worker] Stopping after {len(self.children)} job(s) in progress (signal again to kill them)")
+
+    def serve(self):
+        """Run until stopped, then wait for the jobs in progress."""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        while self.children or not self.stopping:
+            self.reap()
+            self.enforce_cancels()
+            if not self.stopping and len(self.children) < self.concurrency:
+                job = self.store.claim_next(self.worker_id)
+                if job is not None:
+                    self.fork_job(job)
+                    continue
+                if not self.children:
+                    self.store.prune()
+            time.sleep(POLL_INTERVAL)
+
+
+def serve(concurrency=WORKER_CONCURRENCY, warm=True):
+    """Warm up, then render queued jobs until SIGINT/SIGTERM. Returns an exit status."""
+    if not hasattr(os, "fork"):
+        poster.log("Error: the render worker daemon needs os.fork; use MAPTOPOSTER_EXECUTOR=process instead")
+        return 1
+    store = job_store.JobStore()
+    store.recover_orphans()
+    store.prune(force=True)
+    if warm:
+        summary = warm_up(store)
+        poster.log(
+            f"[Worker] Warmed up in {summary['seconds']}s: {summary['themes']} themes, {summary['fonts']} fonts, "
+            f"{summary['gazetteer']} gazetteer cities, {summary['map_entries']} map cache entries"
+        )
+    poster.log(f"[Worker] Rendering up to {max(1, concurrency)} job(s) at once (pid {os.getpid()})")
+    RenderDaemon(store, concurrency).serve()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm render worker daemon for the MapToPoster job queue.")
+    parser.add_argument("--concurrency", "-n", type=int, default=WORKER_CONCURRENCY,
+                        help=f"Jobs rendered at once (default: {WORKER_CONCURRENCY})")
+    parser.add_argument("--no-warm-up", action="store_true", help="Skip the warm-up (for debugging)")
+    args = parser.parse_args()
+    return serve(args.concurrency, warm=not args.no_warm_up)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -142,6 +142,7 @@ let radiusCircle = null;
 let aspectRatioRect = null;
 let centerMarker = null;
 let currentTileLayer = null;
+let posterTileLayer = null;
 
 // ===== JOB/PROGRESS =====
 let activeSource = null;
@@ -157,6 +158,14 @@ let galleryIndex = 0;
 let gallerySource = null;
 let lastGallerySignature = "";
 let lightboxBuiltCount = 0;
+// The gallery loads compact pages of posters (newest first) and more as the grid scrolls
+const GALLERY_PAGE_SIZE = 60;
+const GALLERY_PAGE_MAX = 500;
+let galleryNextCursor = null;
+let galleryTotal = 0;
+let galleryCollectionCounts = {};
+let galleryLoadingMore = false;
+let galleryStreamEtag = null;
 
 // ===== SEARCH =====
 let searchTimeout = null;
@@ -1347,7 +1356,7 @@ function renderCollectionModalTabs() {
   // "All Posters" tab
   const allTab = document.createElement("button");
   allTab.className = "collection-tab" + (modalCollectionFilter === null ? " active" : "");
-  allTab.innerHTML = `All <span class="collection-tab-count">${window.galleryItems?.length || 0}</span>`;
+  allTab.innerHTML = `All <span class="collection-tab-count">${galleryTotal}</span>`;
   allTab.addEventListener("click", () => {
     modalCollectionFilter = null;
     renderCollectionModalTabs();
@@ -1357,7 +1366,7 @@ function renderCollectionModalTabs() {
 
   // Collection tabs
   collectionList.forEach(coll => {
-    const count = window.galleryItems?.filter(item => item.config?.collection === coll.id).length || 0;
+    const count = galleryCollectionCounts[coll.id] || 0;
     const tab = document.createElement("button");
     tab.className = "collection-tab" + (modalCollectionFilter === coll.id ? " active" : "");
     tab.innerHTML = `${escapeHtml(coll.name)} <span class="collection-tab-count">${count}</span>
@@ -1399,7 +1408,7 @@ function renderCollectionModalGrid() {
     ? window.galleryItems || []
     : (window.galleryItems || []).filter(item => item.config?.collection === modalCollectionFilter);
 
-  if (items.length === 0) {
+  if (items.length === 0 && !galleryNextCursor) {
     elements.collectionModalGrid.innerHTML = '<div class="collection-modal-empty">No posters in this collection</div>';
     return;
   }
@@ -1481,7 +1490,7 @@ function renderCollectionModalGrid() {
       if (galleryMultiselectMode) return; // Handled by card click
       closeCollectionModal();
       if (item.config) {
-        loadConfigFromGallery(item.config);
+        fetchPosterConfig(item).then((config) => config && loadConfigFromGallery(config));
       }
     });
 
@@ -1528,6 +1537,21 @@ function renderCollectionModalGrid() {
     fragment.appendChild(card);
   });
 
+  if (galleryNextCursor) {
+    // Loads the next page once scrolled into view (and again after each render while more remain)
+    const sentinel = document.createElement("div");
+    sentinel.className = "collection-modal-empty";
+    sentinel.textContent = "Loading more posters...";
+    fragment.appendChild(sentinel);
+    const observer = new IntersectionObserver((entries) => {
+      if (entries.some((entry) => entry.isIntersecting)) {
+        observer.disconnect();
+        loadMoreGallery();
+      }
+    });
+    observer.observe(sentinel);
+  }
+
   elements.collectionModalGrid.appendChild(fragment);
 }
 
@@ -1844,6 +1868,7 @@ function renderQueueList(data) {
       <span class="queue-item-city">${job.city}</span>
       <span class="queue-item-theme">${job.theme}</span>
       <span class="queue-item-progress">${job.percent}%</span>
+      <button class="queue-item-remove" data-job-id="${job.id}" title="Cancel">×</button>
     `;
     elements.queueList.appendChild(item);
   });
@@ -2145,6 +2170,14 @@ function initLeafletMap() {
   // Set initial tile layer
   setTileLayer("cartodb-voyager");
 
+  // Areas with cached map data, drawn in the selected poster theme
+  posterTileLayer = L.tileLayer(posterTileUrl(), {
+    // Matches tiles.MIN_ZOOM; farther out the server only returns empty tiles
+    minZoom: 10,
+    maxZoom: 19,
+    zIndex: 10,
+  }).addTo(leafletMap);
+
   // Add radius circle (initially hidden until click)
   radiusCircle = L.circle([defaultLat, defaultLng], {
     radius: state.radius,
@@ -2193,6 +2226,12 @@ function setTileLayer(providerId) {
   }).addTo(leafletMap);
 }
 
+function posterTileUrl() {
+  // The theme's version changes when it is edited, so the browser doesn't keep old-colored tiles
+  const version = themeCatalog[state.theme]?.version || "";
+  return `/api/tiles/${encodeURIComponent(state.theme)}/{z}/{x}/{y}.png?v=${version}`;
+}
+
 // Normalize longitude to -180 to 180 range (Leaflet can return wrapped values)
 function normalizeLng(lng) {
   while (lng > 180) lng -= 360;
@@ -2287,15 +2326,26 @@ function updateSyncButtons() {
 
 // ===== LOCATION SEARCH (pans map, doesn't set poster text) =====
 
+// Identifies this tab's searches so the server can drop ones that were typed over
+const searchSession = window.crypto?.randomUUID?.() || Math.random().toString(36).slice(2);
+let searchController = null;
+
 async function searchLocation(query) {
+  searchController?.abort();
   if (!query || query.length < 2) {
     hideSearchResults();
     return;
   }
 
+  const controller = new AbortController();
+  searchController = controller;
   try {
-    const response = await fetch(`/api/geocode/search?q=${encodeURIComponent(query)}&limit=5`);
+    const response = await fetch(
+      `/api/geocode/search?q=${encodeURIComponent(query)}&limit=5&session=${searchSession}`,
+      { signal: controller.signal },
+    );
     const data = await response.json();
+    if (data.superseded || controller !== searchController) return;
 
     if (data.results && data.results.length > 0) {
       showSearchResults(data.results);
@@ -2303,7 +2353,7 @@ async function searchLocation(query) {
       showSearchResults([]);
     }
   } catch (err) {
-    hideSearchResults();
+    if (err.name !== "AbortError") hideSearchResults();
   }
 }
 
@@ -2441,10 +2491,11 @@ function renderRecentGenerations() {
   });
 }
 
-function loadConfigFromGalleryItem(item) {
+async function loadConfigFromGalleryItem(item) {
   if (!item.config) return;
 
-  const config = item.config;
+  const config = await fetchPosterConfig(item);
+  if (!config) return;
 
   // Set location
   if (config.lat !== undefined && config.lng !== undefined) {
@@ -2921,6 +2972,7 @@ async function loadThemes() {
     // Set initial theme name and update preview
     updateSelectedThemeName();
     updatePreview();
+    if (posterTileLayer) posterTileLayer.setUrl(posterTileUrl());
   } catch (err) {
     console.error("Failed to load themes:", err);
   }
@@ -4298,6 +4350,7 @@ function selectTheme(themeId) {
 
   updateSelectedThemeName();
   updatePreview();
+  if (posterTileLayer) posterTileLayer.setUrl(posterTileUrl());
 
   // Update pin color swatches with new theme colors
   if (state.pin && state.pin !== "none") {
@@ -4386,9 +4439,18 @@ function toggleWidget() {
 
 // ===== GALLERY DATA =====
 
+function galleryPageUrl(limit, cursor = null) {
+  const params = new URLSearchParams({ fields: "compact", thumbs: "1", limit: String(limit) });
+  if (cursor) params.set("cursor", cursor);
+  return `/api/posters?${params}`;
+}
+
 async function loadGallery(force = false) {
   try {
-    const response = await fetch("/api/posters");
+    // Refetch as many posters as are already loaded, so a refresh doesn't shrink the grid;
+    // the response's ETag turns an unchanged refetch into a 304
+    const limit = Math.min(GALLERY_PAGE_MAX, Math.max(GALLERY_PAGE_SIZE, galleryItems.length));
+    const response = await fetch(galleryPageUrl(limit));
     const payload = await response.json();
     applyGalleryPayload(payload, force);
   } catch (err) {
@@ -4396,10 +4458,42 @@ async function loadGallery(force = false) {
   }
 }
 
+async function loadMoreGallery() {
+  if (!galleryNextCursor || galleryLoadingMore) return;
+  galleryLoadingMore = true;
+  try {
+    const response = await fetch(galleryPageUrl(GALLERY_PAGE_SIZE, galleryNextCursor));
+    const payload = await response.json();
+    const loaded = new Set(galleryItems.map((item) => item.filename));
+    const items = galleryItems.concat((payload.items || []).filter((item) => !loaded.has(item.filename)));
+    applyGalleryPayload({ ...payload, items });
+  } catch (err) {
+    console.error("Failed to load more posters:", err);
+  } finally {
+    galleryLoadingMore = false;
+  }
+}
+
+// Gallery items carry only the config fields the grid shows; the full config
+// (location, distance, pin, ...) is fetched from the poster's _config.json when needed
+async function fetchPosterConfig(item) {
+  if (!item.fullConfig) {
+    const base = item.filename.replace(/\.[^.]+$/, "");
+    const response = await fetch(`/posters/${encodeURIComponent(base)}_config.json`);
+    if (!response.ok) return null;
+    item.fullConfig = await response.json();
+  }
+  return item.fullConfig;
+}
+
 function applyGalleryPayload(payload, force = false) {
   const items = payload.items || [];
   const signature = items.map((item) => `${item.filename}:${item.mtime}`).join("|");
 
+  galleryNextCursor = payload.next_cursor || null;
+  galleryTotal = payload.total ?? items.length;
+  galleryCollectionCounts = payload.collections || {};
+
   if (!force && signature === lastGallerySignature) {
     return;
   }
@@ -4566,10 +4660,13 @@ function startGalleryStream() {
   if (!("EventSource" in window)) return;
 
   gallerySource = new EventSource("/api/posters/stream");
+  // The stream only announces the poster index's etag; the posters themselves come from /api/posters
   gallerySource.onmessage = (event) => {
     try {
-      const payload = JSON.parse(event.data);
-      applyGalleryPayload(payload);
+      const { etag } = JSON.parse(event.data);
+      if (etag === galleryStreamEtag) return;
+      galleryStreamEtag = etag;
+      loadGallery();
     } catch (err) {
       loadGallery(true);
     }
@@ -4743,12 +4840,18 @@ const startPulse = (stage, basePercent) => {
   }, 1200);
 };
 
-function setProgress({ percent, message, stage, status, output_url, error }) {
+function formatEta(seconds) {
+  if (seconds < 60) return `${Math.max(1, Math.round(seconds))}s`;
+  return `${Math.round(seconds / 60)} min`;
+}
+
+function setProgress({ percent, message, stage, status, output_url, error, eta_seconds }) {
   const bounded = Math.max(0, Math.min(100, percent || 0));
 
   elements.progressFill.style.width = `${bounded}%`;
   elements.progressPercent.textContent = `${Math.round(bounded)}%`;
-  elements.progressMessage.textContent = message || "Working...";
+  const eta = status === "running" && eta_seconds != null ? ` · about ${formatEta(eta_seconds)} left` : "";
+  elements.progressMessage.textContent = (message || "Working...") + eta;
   lastKnownPercent = bounded;
 
   const currentIndex = stageOrder.indexOf(stage || "queued");
@@ -4849,6 +4952,7 @@ async function generatePoster() {
     pin: state.pin !== "none" ? state.pin : null,
     pin_color: state.pin !== "none" ? state.pinColor : null,
     dpi: state.dpi,
+    priority: "interactive",
   };
 
   try {
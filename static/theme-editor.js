@@ -119,10 +119,17 @@ async function init() {
   }
 }
 
-async function loadPreviewSvg() {
+async function loadPreviewSvg(mapFile = null) {
   try {
-    // Load static SVG with proper layer IDs for real-time recoloring
-    const response = await fetch('/static/preview-map-final.svg');
+    // Vector scene of a cached map, built once per map on the server and
+    // recolored here; fall back to the bundled sample map without a cache
+    const url = mapFile
+      ? `/api/editor-preview-svg?map=${encodeURIComponent(mapFile)}`
+      : '/api/editor-preview-svg';
+    let response = await fetch(url);
+    if (!response.ok) {
+      response = await fetch('/static/preview-map-final.svg');
+    }
     if (response.ok) {
       const svgText = await response.text();
       elements.previewAspectWrapper.innerHTML = svgText;
@@ -134,6 +141,7 @@ async function loadPreviewSvg() {
       }
       editorState.useRealMap = true;
       console.log('Loaded map preview');
+      updatePreview();
     } else {
       // Fallback to simple mockup SVG
       await loadMockupSvg();
@@ -741,43 +749,23 @@ function updateRealMapPreview(svg, theme) {
     });
   }
 
-  // Roads - SVG uses "preview-roads-*" (plural)
-  // Roads in this SVG are filled polygon shapes, not stroked lines
-  // Motorway
-  const motorway = svg.querySelector('#preview-roads-motorway');
-  if (motorway) {
-    motorway.querySelectorAll('path').forEach(child => setFill(child, theme.road_motorway));
-  }
-
-  // Primary
-  const primary = svg.querySelector('#preview-roads-primary');
-  if (primary) {
-    primary.querySelectorAll('path').forEach(child => setFill(child, theme.road_primary));
-  }
-
-  // Secondary
-  const secondary = svg.querySelector('#preview-roads-secondary');
-  if (secondary) {
-    secondary.querySelectorAll('path').forEach(child => setFill(child, theme.road_secondary));
-  }
-
-  // Tertiary
-  const tertiary = svg.querySelector('#preview-roads-tertiary');
-  if (tertiary) {
-    tertiary.querySelectorAll('path').forEach(child => setFill(child, theme.road_tertiary));
-  }
-
-  // Residential
-  const residential = svg.querySelector('#preview-roads-residential');
-  if (residential) {
-    residential.querySelectorAll('path').forEach(child => setFill(child, theme.road_residential));
-  }
-
-  // Minor/Default roads
-  const minor = svg.querySelector('#preview-roads-minor');
-  if (minor) {
-    minor.querySelectorAll('path').forEach(child => setFill(child, theme.road_default));
-  }
+  // Roads - one group per road class. The server's scene strokes a single
+  // path per group (fill="none"); the bundled sample has filled road shapes
+  const paintRoads = (id, color) => {
+    const group = svg.querySelector(`#preview-roads-${id}`);
+    if (!group) return;
+    if (group.getAttribute('fill') === 'none') {
+      setStroke(group, color);
+    } else {
+      group.querySelectorAll('path').forEach(child => setFill(child, color));
+    }
+  };
+  paintRoads('motorway', theme.road_motorway);
+  paintRoads('primary', theme.road_primary);
+  paintRoads('secondary', theme.road_secondary);
+  paintRoads('tertiary', theme.road_tertiary);
+  paintRoads('residential', theme.road_residential);
+  paintRoads('minor', theme.road_default);
 
   // Update text colors - text groups contain paths (converted text)
   const cityText = svg.querySelector('#preview-city');
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep metric snapshots written by the modules under test out of the real cache folder
+os.environ.setdefault("MAPTOPOSTER_METRICS_DIR", tempfile.mkdtemp(prefix="maptoposter-metrics-"))
@@ -0,0 +1,103 @@
+import json
+import threading
+
+import event_bus
+
+
+def take(subscription, count):
+    return [next(subscription) for _ in range(count)]
+
+
+def test_new_subscriber_gets_the_latest_snapshot_only():
+    topic = event_bus.Topic("job:1")
+    for percent in range(3):
+        topic.publish({"percent": percent})
+    subscription = topic.subscribe(keepalive=0.01)
+    assert next(subscription).data == {"percent": 2}
+    assert next(subscription) is None
+
+
+def test_identical_snapshots_are_published_once():
+    topic = event_bus.Topic("job:1")
+    assert topic.publish({"percent": 5})
+    assert not topic.publish({"percent": 5})
+    assert topic.publish({"percent": 6})
+
+
+def test_reconnect_replays_exactly_what_was_missed():
+    topic = event_bus.Topic("job:1")
+    ids = []
+    for percent in range(5):
+        topic.publish({"percent": percent})
+        ids.append(topic.latest().id)
+    subscription = topic.subscribe(last_event_id=ids[1], keepalive=0.01)
+    assert [event.data["percent"] for event in take(subscription, 3)] == [2, 3, 4]
+    assert next(subscription) is None
+
+
+def test_reconnect_after_the_ring_buffer_overflowed_gets_the_latest_snapshot():
+    topic = event_bus.Topic("job:1", history=4)
+    topic.publish({"percent": 0})
+    evicted = topic.latest().id
+    for percent in range(1, 10):
+        topic.publish({"percent": percent})
+    subscription = topic.subscribe(last_event_id=evicted, keepalive=0.01)
+    assert next(subscription).data == {"percent": 9}
+    assert next(subscription) is None
+
+
+def test_reconnect_with_an_id_from_another_process_gets_the_latest_snapshot():
+    topic = event_bus.Topic("job:1")
+    topic.publish({"percent": 1})
+    topic.publish({"percent": 2})
+    other = event_bus.Topic("job:1")
+    other.publish({"percent": 1})
+    subscription = topic.subscribe(last_event_id=other.latest().id, keepalive=0.01)
+    assert next(subscription).data == {"percent": 2}
+
+
+def test_slow_subscriber_skips_to_the_newest_snapshot():
+    topic = event_bus.Topic("job:1", history=4)
+    topic.publish({"percent": 0})
+    subscription = topic.subscribe(keepalive=0.01)
+    assert next(subscription).data == {"percent": 0}
+    # The subscriber's cursor falls out of the buffer while it isn't reading
+    for percent in range(1, 10):
+        topic.publish({"percent": percent})
+    assert next(subscription).data == {"percent": 9}
+    assert next(subscription) is None
+
+
+def test_subscriber_is_woken_by_publish():
+    topic = event_bus.Topic("job:1")
+    topic.publish({"percent": 0})
+    subscription = topic.subscribe(keepalive=5)
+    next(subscription)
+    timer = threading.Timer(0.05, topic.publish, args=({"percent": 1},))
+    timer.start()
+    assert next(subscription).data == {"percent": 1}
+    timer.join()
+
+
+def test_subscribers_are_counted_until_the_stream_closes():
+    topic = event_bus.Topic("job:1")
+    topic.publish({"percent": 0})
+    subscription = topic.subscribe(keepalive=0.01)
+    next(subscription)
+    assert topic.subscribers == 1
+    subscription.close()
+    assert topic.subscribers == 0
+
+
+def test_sse_stream_frames_events_and_stops_when_done():
+    topic = event_bus.Topic("job:1")
+    topic.publish({"status": "running"})
+    stream = event_bus.sse_stream(topic, until=lambda data: data["status"] == "done")
+    frame = next(stream)
+    event_id, data = frame.strip().split("\n")
+    assert event_id == f"id: {topic.latest().id}"
+    assert json.loads(data[len("data: "):]) == {"status": "running"}
+
+    topic.publish({"status": "done"})
+    assert json.loads(next(stream).strip().split("\n")[1][len("data: "):]) == {"status": "done"}
+    assert list(stream) == []
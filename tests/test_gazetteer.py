@@ -0,0 +1,87 @@
+import pytest
+
+import gazetteer
+
+COUNTRIES = {
+    "NE": "Niger",
+    "NG": "Nigeria",
+    "GN": "Guinea",
+    "GW": "Guinea-Bissau",
+    "DM": "Dominica",
+    "DO": "Dominican Republic",
+    "FR": "France",
+    "US": "United States",
+    "PT": "Portugal",
+}
+
+# (name, ascii name, alternate names, lat, lng, country code, population)
+ROWS = [
+    ("Kano", "Kano", [], 12.0, 8.52, "NG", 3626068),
+    ("Kano", "Kano", [], 13.8, 7.0, "NE", 12000),
+    ("Conakry", "Conakry", [], 9.54, -13.68, "GN", 1767200),
+    ("Bissau", "Bissau", [], 11.86, -15.6, "GW", 388028),
+    ("Roseau", "Roseau", [], 15.3, -61.39, "DM", 16571),
+    ("Santo Domingo", "Santo Domingo", [], 18.47, -69.89, "DO", 2201941),
+    ("Paris", "Paris", ["Parigi", "Parijs"], 48.85, 2.35, "FR", 2138551),
+    ("Paris", "Paris", [], 33.66, -95.56, "US", 24782),
+    ("Lisbon", "Lisbon", ["Lisboa"], 38.72, -9.13, "PT", 517802),
+    ("São Paulo", "Sao Paulo", [], -23.55, -46.64, "BR", 10021295),
+]
+
+
+@pytest.fixture(scope="module")
+def cities():
+    return gazetteer.Gazetteer.from_rows(ROWS, COUNTRIES)
+
+
+def test_lookup_picks_the_most_populous_match(cities):
+    assert cities.lookup("Paris")["country_code"] == "FR"
+    assert cities.lookup("paris", "United States")["country_code"] == "US"
+
+
+def test_lookup_accepts_the_full_country_name_or_iso_code(cities):
+    assert cities.lookup("Kano", "Niger")["country_code"] == "NE"
+    assert cities.lookup("Kano", "ne")["country_code"] == "NE"
+    assert cities.lookup("Kano", "Nigeria")["country_code"] == "NG"
+
+
+@pytest.mark.parametrize("city, country", [
+    ("Santo Domingo", "Dominica"),   # not the Dominican Republic
+    ("Bissau", "Guinea"),            # not Guinea-Bissau
+    ("Paris", "United"),
+])
+def test_lookup_never_matches_a_country_prefix(cities, city, country):
+    assert cities.lookup(city, country) is None
+
+
+def test_lookup_folds_case_accents_and_hyphens(cities):
+    assert cities.lookup("sao paulo")["name"] == "São Paulo"
+    assert cities.lookup("Bissau", "guinea bissau")["country_code"] == "GW"
+
+
+def test_lookup_matches_alternate_names_of_large_cities(cities):
+    assert cities.lookup("Lisboa")["name"] == "Lisbon"
+
+
+def test_lookup_of_an_unknown_city_is_none(cities):
+    assert cities.lookup("Atlantis") is None
+
+
+def test_search_is_prefix_matched_and_ordered_by_population(cities):
+    assert [(city["name"], city["country_code"]) for city in cities.search("par")] == [("Paris", "FR"), ("Paris", "US")]
+
+
+def test_search_narrows_by_country_prefix(cities):
+    assert [city["country_code"] for city in cities.search("kano, nig")] == ["NG", "NE"]
+    assert [city["country_code"] for city in cities.search("paris, united")] == ["US"]
+    assert [city["country_code"] for city in cities.search("paris, us")] == ["US"]
+
+
+def test_search_falls_back_to_names_one_edit_away(cities):
+    assert [city["name"] for city in cities.search("lisbn")] == ["Lisbon"]
+    assert cities.search("lisbn", fuzzy=False) == []
+
+
+def test_nearest_finds_the_closest_city_within_range(cities):
+    assert cities.nearest(48.86, 2.34)["name"] == "Paris"
+    assert cities.nearest(0.0, -140.0) is None
@@ -0,0 +1,194 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import gazetteer
+import geocoder
+
+
+class FakeNominatim:
+    """Stands in for geopy's client; geocode() blocks until released when gated."""
+
+    def __init__(self, gated=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not gated:
+            self.release.set()
+
+    def geocode(self, query, **kwargs):
+        self.calls.append(query)
+        self.started.set()
+        self.release.wait(5)
+        return [SimpleNamespace(address=f"{query} (found)", latitude=48.85, longitude=2.35, raw={})]
+
+
+@pytest.fixture
+def make_geocoder(tmp_path):
+    def make(client, rate=1000.0):
+        geo = geocoder.Geocoder(path=str(tmp_path / "geocode.sqlite3"), rate=rate, use_gazetteer=False)
+        geo._client = client
+        return geo
+    return make
+
+
+def in_thread(target):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = target()
+        except Exception as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def wait_for_flight(geo, key_part):
+    deadline = time.monotonic() + 5
+    while not any(key_part in key for key in geo._inflight):
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_results_are_cached(make_geocoder):
+    client = FakeNominatim()
+    geo = make_geocoder(client)
+    first = geo.search("Paris")
+    assert geo.search("  paris ") == first
+    assert client.calls == ["Paris"]
+
+
+def test_identical_lookups_in_flight_share_one_upstream_call(make_geocoder):
+    client = FakeNominatim(gated=True)
+    geo = make_geocoder(client)
+    leader, leader_outcome = in_thread(lambda: geo.search("Paris"))
+    assert client.started.wait(5)
+    follower, follower_outcome = in_thread(lambda: geo.search("paris"))
+    time.sleep(0.1)
+    client.release.set()
+    leader.join()
+    follower.join()
+    assert client.calls == ["Paris"]
+    assert follower_outcome["result"] == leader_outcome["result"]
+
+
+def test_superseded_follower_stops_waiting_without_affecting_the_leader(make_geocoder):
+    client = FakeNominatim(gated=True)
+    geo = make_geocoder(client)
+    leader, leader_outcome = in_thread(lambda: geo.search("Paris"))
+    assert client.started.wait(5)
+    with pytest.raises(geocoder.Superseded):
+        geo.search("Paris", cancelled=lambda: True)
+    client.release.set()
+    leader.join()
+    assert leader_outcome["result"][0]["display"] == "Paris (found)"
+
+
+def test_superseded_lookup_gives_up_while_waiting_for_the_rate_limit(make_geocoder):
+    client = FakeNominatim()
+    geo = make_geocoder(client, rate=0.5)
+    geo.acquire()  # take the only token
+    started = time.monotonic()
+    with pytest.raises(geocoder.Superseded):
+        geo.search("Paris", cancelled=lambda: time.monotonic() - started > 0.1)
+    assert time.monotonic() - started < 1
+    assert client.calls == []
+
+
+def test_follower_takes_over_when_the_leader_is_superseded(make_geocoder):
+    client = FakeNominatim()
+    geo = make_geocoder(client, rate=5)
+    geo.acquire()  # the leader has to wait for a token
+    leader_cancelled = threading.Event()
+    leader, leader_outcome = in_thread(lambda: geo.search("Paris", cancelled=leader_cancelled.is_set))
+    wait_for_flight(geo, "paris")
+    follower, follower_outcome = in_thread(lambda: geo.search("Paris"))
+    leader_cancelled.set()
+    leader.join()
+    follower.join()
+    assert isinstance(leader_outcome["error"], geocoder.Superseded)
+    assert follower_outcome["result"][0]["display"] == "Paris (found)"
+    assert client.calls == ["Paris"]
+
+
+def test_busy_rate_limit_fails_fast_for_interactive_lookups(make_geocoder):
+    geo = make_geocoder(FakeNominatim(), rate=0.01)
+    geo.acquire()
+    with pytest.raises(geocoder.GeocoderRateLimited):
+        geo.search("Paris", max_wait=0.1)
+
+
+def test_prefix_is_answered_from_a_longer_cached_query(make_geocoder):
+    client = FakeNominatim()
+    geo = make_geocoder(client)
+    geo.search("Lisbon")
+    assert geo.search("Lisb", autocomplete=True)[0]["display"] == "Lisbon (found)"
+    assert client.calls == ["Lisbon"]
+    # Without autocomplete the prefix is its own query
+    geo.search("Lisb")
+    assert client.calls == ["Lisbon", "Lisb"]
+
+
+
+@pytest.fixture
+def offline_geocoder(make_geocoder, monkeypatch):
+    countries = {"GN": "Guinea", "GW": "Guinea-Bissau", "DM": "Dominica", "DO": "Dominican Republic",
+                 "FR": "France", "US": "United States"}
+    rows = [
+        ("Bissau", "Bissau", [], 11.86, -15.6, "GW", 388028),
+        ("Santo Domingo", "Santo Domingo", [], 18.47, -69.89, "DO", 2201941),
+        ("Paris", "Paris", [], 48.85, 2.35, "FR", 2138551),
+        ("Paris", "Paris", [], 33.66, -95.56, "US", 24782),
+    ]
+    cities = gazetteer.Gazetteer.from_rows(rows, countries)
+    client = FakeNominatim()
+    geo = make_geocoder(client)
+    monkeypatch.setattr(geo, "_gazetteer", lambda: cities)
+    return geo, client
+
+
+@pytest.mark.parametrize("city, country", [
+    ("Santo Domingo", "Dominica"),   # not the Dominican Republic
+    ("Bissau", "Guinea"),            # not Guinea-Bissau
+    ("Paris", "United"),
+])
+def test_coordinates_never_resolve_a_country_prefix_from_the_gazetteer(offline_geocoder, city, country):
+    geo, client = offline_geocoder
+    assert geo.coordinates(city, country) == (48.85, 2.35, f"{city}, {country} (found)")
+    assert client.calls == [f"{city}, {country}"]
+
+
+def test_coordinates_of_an_exact_gazetteer_match_stay_offline(offline_geocoder):
+    geo, client = offline_geocoder
+    assert geo.coordinates("Bissau", "Guinea-Bissau")[:2] == (11.86, -15.6)
+    assert client.calls == []
+
+
+def test_follower_willing_to_wait_outlasts_a_rate_limited_leader(make_geocoder, monkeypatch):
+    client = FakeNominatim()
+    geo = make_geocoder(client)
+    waits = []
+    busy = threading.Event()
+
+    def acquire(max_wait=None, cancelled=None):
+        waits.append(max_wait)
+        if max_wait is not None:
+            busy.wait(5)
+            raise geocoder.GeocoderRateLimited("busy")
+
+    monkeypatch.setattr(geo, "acquire", acquire)
+    leader, leader_outcome = in_thread(lambda: geo.search("Paris", max_wait=2))
+    wait_for_flight(geo, "paris")
+    follower, follower_outcome = in_thread(lambda: geo.search("Paris"))
+    time.sleep(0.1)
+    busy.set()
+    leader.join()
+    follower.join()
+    assert isinstance(leader_outcome["error"], geocoder.GeocoderRateLimited)
+    assert follower_outcome["result"][0]["display"] == "Paris (found)"
+    assert waits == [2, None]
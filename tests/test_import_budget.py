@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous ceilings (several times benchmarks/imports.py's budgets) so only a
+# real regression, such as a heavy library imported at module level, fails
+BUDGETS = {
+    "create_map_poster": 2.0,
+    "app": 3.0,
+}
+
+# Loaded on first render or download, never at import
+LAZY_MODULES = ("osmnx", "geopandas", "matplotlib.pyplot", "geopy", "scipy")
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": sorted(set({lazy!r}) & set(sys.modules))}}))
+"""
+
+
+def probe(module, cwd):
+    env = dict(os.environ, MPLBACKEND="Agg", MAPTOPOSTER_EMBEDDED_WORKER="0")
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=ROOT, module=module, lazy=LAZY_MODULES)],
+        capture_output=True, text=True, env=env, cwd=cwd, timeout=60,
+    )
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_loads_no_heavy_dependencies(module, tmp_path):
+    assert probe(module, tmp_path)["loaded"] == []
+
+
+@pytest.mark.parametrize("module", sorted(BUDGETS))
+def test_import_stays_within_budget(module, tmp_path):
+    # Best of two, so a cold disk cache on the first import doesn't fail the test
+    seconds = min(probe(module, tmp_path)["seconds"] for _ in range(2))
+    assert seconds <= BUDGETS[module], f"import {module} took {seconds:.2f}s"
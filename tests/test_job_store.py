@@ -0,0 +1,163 @@
+import socket
+import threading
+
+import pytest
+
+import job_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return job_store.JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def job(job_id, **fields):
+    return {"id": job_id, "city": "Paris", "country": "France", "theme": "noir", **fields}
+
+
+def claim_all(store):
+    claimed = []
+    while True:
+        next_job = store.claim_next("test")
+        if next_job is None:
+            return claimed
+        claimed.append(next_job["id"])
+
+
+def test_claims_follow_priority_lanes(store):
+    store.enqueue([job("batch", priority="batch"), job("single"), job("interactive", priority="interactive")])
+    assert claim_all(store) == ["interactive", "single", "batch"]
+
+
+def test_cheaper_jobs_are_claimed_first_within_a_round(store):
+    store.enqueue([job("large", cost=4.0, owner="a"), job("small", cost=1.0, owner="b")])
+    assert claim_all(store) == ["small", "large"]
+
+
+def test_owners_take_turns_within_a_lane(store):
+    store.enqueue([job("a1", owner="a"), job("a2", owner="a"), job("a3", owner="a")])
+    store.enqueue([job("b1", owner="b")])
+    assert claim_all(store) == ["a1", "b1", "a2", "a3"]
+
+
+def test_newcomer_joins_at_the_current_round(store):
+    store.enqueue([job("a1", owner="a"), job("a2", owner="a"), job("a3", owner="a")])
+    assert store.claim_next("test")["id"] == "a1"
+    # a2 and a3 are in rounds 1 and 2; b starts at round 1, not 0, and not behind a3
+    store.enqueue([job("b1", owner="b"), job("b2", owner="b")])
+    assert claim_all(store) == ["a2", "b1", "a3", "b2"]
+
+
+def test_queue_positions_match_claim_order(store):
+    results = store.enqueue([job("a1", owner="a"), job("a2", owner="a"), job("b1", owner="b")])
+    assert results == [("a1", 1), ("a2", 3), ("b1", 2)]
+    assert [queued["id"] for queued in store.queued()] == ["a1", "b1", "a2"]
+
+
+def test_identical_job_attaches_to_the_one_in_flight(store):
+    assert store.enqueue([job("first", render_key="k")]) == [("first", 1)]
+    assert store.enqueue([job("second", render_key="k")]) == [("first", 1)]
+    assert store.get("second") is None
+
+    store.claim_next("test")
+    assert store.enqueue([job("third", render_key="k")])[0][0] == "first"
+
+
+def test_finished_job_is_not_attached_to(store):
+    store.enqueue([job("first", render_key="k")])
+    store.claim_next("test")
+    store.update("first", {"status": "done", "output": "posters/x.png"})
+    assert store.enqueue([job("second", render_key="k")]) == [("second", 1)]
+    assert store.find_done("k")["id"] == "first"
+
+
+def test_interactive_duplicate_promotes_a_batch_job(store):
+    store.enqueue([job("batch", priority="batch", render_key="k"), job("single")])
+    store.enqueue([job("again", priority="interactive", render_key="k")])
+    assert claim_all(store) == ["batch", "single"]
+
+
+def test_attached_job_takes_over_the_requested_collection(store):
+    store.enqueue([job("first", render_key="k")])
+    store.enqueue([job("second", render_key="k", collection="favourites")])
+    assert store.get("first")["collection"] == "favourites"
+
+
+def test_concurrent_claims_never_share_a_job(store):
+    store.enqueue([job(f"job{i}") for i in range(40)])
+    claimed = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            next_job = store.claim_next("test")
+            if next_job is None:
+                return
+            with lock:
+                claimed.append(next_job["id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(f"job{i}" for i in range(40))
+
+
+def test_cancel_only_removes_queued_jobs(store):
+    store.enqueue([job("running"), job("queued")])
+    store.claim_next("test")
+    assert store.cancel("queued")
+    assert not store.cancel("running")
+    assert store.request_cancel("running") == "cancelling"
+    assert store.is_cancel_requested("running")
+
+
+def make_stale(store, job_id):
+    store._conn().execute("UPDATE jobs SET updated_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_recover_orphans_requeues_jobs_of_dead_workers(store):
+    store.enqueue([job("orphan")])
+    store.claim_next(f"{socket.gethostname()}:999999999:deadbeef:1")
+    assert store.recover_orphans() == 1
+    assert store.get("orphan")["status"] == "queued"
+
+
+def test_recover_orphans_keeps_long_running_jobs_of_live_workers(store):
+    store.enqueue([job("slow")])
+    store.claim_next(job_store.worker_identity())
+    make_stale(store, "slow")
+    assert store.recover_orphans() == 0
+    assert store.get("slow")["status"] == "running"
+
+
+def test_recover_orphans_detects_this_process_reusing_a_pid(store):
+    store.enqueue([job("orphan")])
+    host, pid, instance, thread = job_store.worker_identity().split(":")
+    store.claim_next(f"{host}:{pid}:0badf00d.{instance.partition('.')[2]}:{thread}")
+    assert store.recover_orphans() == 1
+
+
+@pytest.mark.skipif(job_store._process_start(1) is None, reason="needs /proc")
+def test_recover_orphans_detects_another_process_reusing_a_pid(store):
+    store.enqueue([job("orphan")])
+    # pid 1 is alive, but didn't start at this time
+    store.claim_next(f"{socket.gethostname()}:1:deadbeef.never:1")
+    assert store.recover_orphans() == 1
+
+
+def test_recover_orphans_waits_for_jobs_claimed_on_other_hosts_to_go_stale(store):
+    store.enqueue([job("remote")])
+    store.claim_next("elsewhere:1:deadbeef:1")
+    assert store.recover_orphans() == 0
+    make_stale(store, "remote")
+    assert store.recover_orphans() == 1
+
+
+def test_recover_orphans_fails_jobs_out_of_attempts(store):
+    store.enqueue([job("flaky")])
+    for _ in range(job_store.MAX_ATTEMPTS):
+        store.claim_next(f"{socket.gethostname()}:999999999:deadbeef:1")
+        store.recover_orphans()
+    assert store.get("flaky")["status"] == "error"
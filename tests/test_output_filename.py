@@ -0,0 +1,65 @@
+import os
+import re
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import create_map_poster as poster
+
+
+@pytest.fixture
+def posters_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(poster, "POSTERS_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_name_has_city_theme_timestamp_and_token(posters_dir):
+    path = poster.generate_output_filename("New York", "noir", "png")
+    assert os.path.dirname(path) == str(posters_dir)
+    assert re.fullmatch(r"new_york_noir_\d{8}_\d{6}_[0-9a-f]{6}\.png", os.path.basename(path))
+
+
+def test_laser_svg_gets_a_suffix(posters_dir):
+    name = os.path.basename(poster.generate_output_filename("Paris", "noir", "svg-laser"))
+    assert re.fullmatch(r"paris_noir_laser_\d{8}_\d{6}_[0-9a-f]{6}\.svg", name)
+
+
+def test_names_within_the_same_second_are_unique(posters_dir):
+    names = {poster.generate_output_filename("Paris", "noir", "png") for _ in range(200)}
+    assert len(names) == 200
+
+
+def test_concurrent_renders_get_unique_names(posters_dir):
+    names = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(50):
+            name = poster.generate_output_filename("Paris", "noir", "png")
+            with lock:
+                names.append(name)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(names)) == len(names)
+
+
+def test_existing_files_are_not_reused(posters_dir, monkeypatch):
+    class FixedClock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2026, 1, 18, 15, 33, 28)
+
+    tokens = iter(["aaaaaa", "aaaaaa", "bbbbbb"])
+    monkeypatch.setattr(poster, "datetime", FixedClock)
+    monkeypatch.setattr(poster.uuid, "uuid4", lambda: SimpleNamespace(hex=next(tokens)))
+
+    taken = poster.generate_output_filename("Paris", "noir", "png")
+    open(taken, "w").close()
+    assert os.path.basename(taken) == "paris_noir_20260118_153328_aaaaaa.png"
+    assert os.path.basename(poster.generate_output_filename("Paris", "noir", "png")) == "paris_noir_20260118_153328_bbbbbb.png"
@@ -0,0 +1,43 @@
+import json
+import os
+
+import pytest
+
+import poster_index
+
+
+@pytest.fixture
+def index(tmp_path):
+    posters_dir = tmp_path / "posters"
+    posters_dir.mkdir()
+
+    def add(name, collection=None, thumb=True, mtime=0):
+        base = posters_dir / name
+        base.with_suffix(".png").write_bytes(b"")
+        (posters_dir / f"{name}_config.json").write_text(json.dumps({"city": name, "collection": collection}))
+        if thumb:
+            (posters_dir / f"{name}_thumb.png").write_bytes(b"")
+        os.utime(base.with_suffix(".png"), (mtime, mtime))
+
+    add("a", "trips", mtime=1)
+    add("b", "trips", thumb=False, mtime=2)
+    add("c", "gifts", mtime=3)
+    add("d", mtime=4)
+    return poster_index.PosterIndex(str(posters_dir), db_path=str(tmp_path / "posters.sqlite3"))
+
+
+def test_thumbs_keeps_only_posters_with_a_thumbnail(index):
+    items, total = index.query(limit=10, thumbs=True)
+    assert [item["filename"] for item in items] == ["d.png", "c.png", "a.png"]
+    assert total == 3
+
+
+def test_cursor_pages_through_the_filtered_posters(index):
+    first, _ = index.query(limit=2, thumbs=True)
+    rest, _ = index.query(limit=2, thumbs=True, after=(first[-1]["filename"], first[-1]["mtime"]))
+    assert [item["filename"] for item in first + rest] == ["d.png", "c.png", "a.png"]
+
+
+def test_collection_counts(index):
+    assert index.collection_counts() == {"trips": 2, "gifts": 1}
+    assert index.collection_counts(thumbs=True) == {"trips": 1, "gifts": 1}
@@ -0,0 +1,238 @@
+"""
+Theme Store for MapToPoster
+Loads, validates and normalizes theme JSON files once and keeps them in memory.
+
+Files are only re-read when their modification time changes, and the theme
+catalog used by the web UI is rebuilt only when a theme file changes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Color fields every compiled theme is guaranteed to have
+COLOR_FIELDS = (
+    "bg", "text", "gradient_color", "water", "parks",
+    "road_motorway", "road_primary", "road_secondary",
+    "road_tertiary", "road_residential", "road_default",
+)
+
+# Optional color fields that are validated and compiled when present
+OPTIONAL_COLOR_FIELDS = ("ocean",)
+
+DEFAULT_THEME = {
+    "name": "Feature-Based Shading",
+    "description": "",
+    "category": "other",
+    "bg": "#FFFFFF",
+    "text": "#000000",
+    "gradient_color": "#FFFFFF",
+    "water": "#C0C0C0",
+    "parks": "#F0F0F0",
+    "road_motorway": "#0A0A0A",
+    "road_primary": "#1A1A1A",
+    "road_secondary": "#2A2A2A",
+    "road_tertiary": "#3A3A3A",
+    "road_residential": "#4A4A4A",
+    "road_default": "#3A3A3A",
+}
+
+# Missing fields inherit from a sibling field before falling back to DEFAULT_THEME
+FIELD_FALLBACKS = {
+    "gradient_color": "bg",
+    "road_motorway": "road_primary",
+}
+
+
+def hex_to_rgba(value):
+    """
+    Convert '#RGB', '#RRGGBB' or '#RRGGBBAA' to an (r, g, b, a) tuple of floats in 0..1.
+    Raises ValueError for anything else.
+    """
+    if not isinstance(value, str) or not value.startswith("#"):
+        raise ValueError(f"not a hex color: {value!r}")
+    digits = value[1:]
+    if len(digits) == 3:
+        digits = "".join(c * 2 for c in digits) + "FF"
+    elif len(digits) == 6:
+        digits += "FF"
+    elif len(digits) != 8:
+        raise ValueError(f"not a hex color: {value!r}")
+    try:
+        channels = [int(digits[i:i + 2], 16) for i in range(0, 8, 2)]
+    except ValueError:
+        raise ValueError(f"not a hex color: {value!r}") from None
+    return tuple(round(c / 255.0, 6) for c in channels)
+
+
+def normalize_theme(raw, theme_id=None):
+    """
+    Validate a theme dict and fill in defaults.
+
+    Returns (theme, warnings). The theme keeps the original hex strings and
+    gains an 'rgba' mapping of field -> (r, g, b, a) for every color field.
+    """
+    theme = dict(raw) if isinstance(raw, dict) else {}
+    warnings = []
+
+    theme.setdefault("name", theme_id or DEFAULT_THEME["name"])
+    theme.setdefault("description", "")
+    theme.setdefault("category", "other")
+
+    rgba = {}
+    for field in COLOR_FIELDS + OPTIONAL_COLOR_FIELDS:
+        value = theme.get(field)
+        if value is None:
+            if field in OPTIONAL_COLOR_FIELDS:
+                continue
+            sibling = FIELD_FALLBACKS.get(field)
+            value = theme.get(sibling) if sibling else None
+            if value is None:
+                value = DEFAULT_THEME[field]
+        try:
+            rgba[field] = hex_to_rgba(value)
+        except ValueError:
+            warnings.append(f"{field}: invalid color {value!r}")
+            if field in OPTIONAL_COLOR_FIELDS:
+                theme.pop(field, None)
+                continue
+            value = DEFAULT_THEME[field]
+            rgba[field] = hex_to_rgba(value)
+        theme[field] = value
+
+    theme["rgba"] = rgba
+    return theme, warnings
+
+
+def theme_version(theme):
+    """Short hash of a compiled theme's colors; changes whenever any color does."""
+    return hashlib.md5(json.dumps(theme["rgba"], sort_keys=True).encode()).hexdigest()[:12]
+
+
+def theme_summary(theme_id, theme):
+    """Catalog entry for a compiled theme, as served by /api/themes."""
+    return {
+        "id": theme_id,
+        "version": theme_version(theme),
+        "name": theme["name"],
+        "description": theme["description"],
+        "category": theme["category"],
+        "colors": {
+            field: theme[field]
+            for field in (
+                "bg", "text", "water", "parks", "road_motorway",
+                "road_primary", "road_secondary", "road_tertiary",
+            )
+        },
+    }
+
+
+class ThemeStore:
+    """
+    In-memory cache of compiled themes keyed by theme id (file name without .json).
+
+    The themes directory is rescanned at most once per check_interval seconds;
+    only files whose mtime changed since the last scan are re-read.
+    """
+
+    def __init__(self, themes_dir, check_interval=1.0):
+        self.themes_dir = themes_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._last_scan = 0.0
+        self._catalog = []
+        self._etag = None
+
+    def _load_entry(self, theme_id, path, mtime):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception as e:
+            raw = {}
+            errors = [f"unreadable: {e}"]
+        else:
+            errors = []
+        theme, warnings = normalize_theme(raw, theme_id)
+        return {
+            "mtime": mtime,
+            "raw": raw,
+            "theme": theme,
+            "warnings": errors + warnings,
+        }
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_scan < self.check_interval:
+            return
+        self._last_scan = now
+
+        seen = {}
+        try:
+            with os.scandir(self.themes_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        try:
+                            seen[entry.name[:-5]] = (entry.path, entry.stat().st_mtime_ns)
+                        except OSError:
+                            continue
+        except FileNotFoundError:
+            pass
+
+        changed = set(self._entries) - set(seen)
+        for theme_id in changed:
+            del self._entries[theme_id]
+        for theme_id, (path, mtime) in seen.items():
+            cached = self._entries.get(theme_id)
+            if cached is None or cached["mtime"] != mtime:
+                self._entries[theme_id] = self._load_entry(theme_id, path, mtime)
+                changed.add(theme_id)
+
+        if changed or self._etag is None:
+            names = sorted(self._entries)
+            self._catalog = [theme_summary(name, self._entries[name]["theme"]) for name in names]
+            signature = "|".join(f"{name}:{self._entries[name]['mtime']}" for name in names)
+            self._etag = hashlib.md5(signature.encode()).hexdigest()
+
+    def invalidate(self, theme_id=None):
+        """Force a rescan on next access (after the app writes or deletes a theme)."""
+        with self._lock:
+            if theme_id is not None:
+                self._entries.pop(theme_id, None)
+            self._last_scan = 0.0
+            self._etag = None
+
+    def names(self):
+        """Sorted list of available theme ids."""
+        with self._lock:
+            self._refresh()
+            return sorted(self._entries)
+
+    def get(self, theme_id):
+        """Compiled theme dict for theme_id, or None if it does not exist."""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(theme_id)
+            return dict(entry["theme"]) if entry else None
+
+    def raw(self, theme_id):
+        """Theme exactly as stored on disk, or None if it does not exist."""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(theme_id)
+            return dict(entry["raw"]) if entry else None
+
+    def warnings(self, theme_id):
+        """Validation problems found when the theme was compiled."""
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(theme_id)
+            return list(entry["warnings"]) if entry else []
+
+    def catalog(self):
+        """Return (catalog, etag) for the theme picker."""
+        with self._lock:
+            self._refresh()
+            return self._catalog, self._etag
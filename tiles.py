@@ -0,0 +1,284 @@
+"""
+Map Tiles for MapToPoster
+Serves XYZ (slippy map) raster tiles of cached maps, styled with a theme.
+
+Tiles are drawn on demand from the same projected, simplified geometry the
+poster previews use (see preview.py), reprojected once per map to Web
+Mercator and indexed with an STRtree, so a tile only touches the roads and
+polygons that intersect it. Rendered tiles are kept in an LRU cache keyed by
+theme and its colors, tile and the versions of the maps they show.
+
+Only areas with cached map data are drawn; everything else is transparent,
+so the tiles can be laid over any base map.
+"""
+
+import collections
+import io
+import math
+import os
+import threading
+
+import numpy as np
+import shapely
+
+import create_map_poster as poster
+import preview
+import theme_store
+
+TILE_SIZE = 256
+# Below MIN_ZOOM a tile would cover dozens of cached maps, each needing its
+# geometry loaded, while the roads on it would be far below a pixel wide
+MIN_ZOOM = 10
+MAX_ZOOM = 19
+# Rendered tiles kept in memory
+TILE_CACHE_ENTRIES = int(os.environ.get("MAPTOPOSTER_TILE_CACHE_ENTRIES", "1024"))
+# Maps kept reprojected and indexed in memory
+TILE_SOURCE_ENTRIES = int(os.environ.get("MAPTOPOSTER_TILE_SOURCE_ENTRIES", "16"))
+# Seconds a tile waits for a map's preview geometry before drawing without that map
+TILE_BUILD_WAIT = 0.5
+# Road widths are the poster's, scaled to the zoom level, within these pixel limits
+MIN_LINE_PX = 0.3
+MAX_LINE_PX = 12.0
+
+# Web Mercator (EPSG:3857) extent
+WORLD_HALF = 20037508.342789244
+
+
+def tile_bounds(z, x, y):
+    """(minx, miny, maxx, maxy) of an XYZ tile in Web Mercator meters."""
+    size = 2 * WORLD_HALF / 2 ** z
+    minx = -WORLD_HALF + x * size
+    maxy = WORLD_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def parse_cache_key(cache_key):
+    """(lat, lon, dist) from a map cache key (see poster.get_cache_key), or None."""
+    parts = cache_key.split("_")
+    try:
+        return float(parts[1]), float(parts[2]), int(parts[3])
+    except (IndexError, ValueError):
+        return None
+
+
+class TileSource:
+    """One cached map's preview geometry in Web Mercator, with an STRtree per layer."""
+
+    def __init__(self, geometry):
+        from pyproj import Transformer
+
+        transformer = Transformer.from_crs(geometry.crs, "EPSG:3857", always_xy=True)
+        origin = np.asarray(geometry.origin)
+
+        def to_mercator(coords):
+            coords = coords.astype(float) + origin
+            return np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+
+        self.geometry = geometry
+        minx, miny, maxx, maxy = geometry.bounds
+        corners = to_mercator(np.array([[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy]]))
+        self.extent = shapely.Polygon(corners)
+
+        # Web Mercator stretches distances by 1 / cos(latitude)
+        lat = math.degrees(2 * math.atan(math.exp(self.extent.centroid.y / 6378137.0)) - math.pi / 2)
+        self.stretch = 1 / math.cos(math.radians(lat))
+        # Ground meters per point on the poster this map would print as
+        fig_width, fig_height = poster.get_figure_size("2:3")
+        crop_xlim, _ = poster.crop_limits(geometry.bounds, fig_width / fig_height)
+        self.meters_per_point = (crop_xlim[1] - crop_xlim[0]) / (fig_width * 72)
+
+        # Roads: one LineString per line, with its road class
+        lines = []
+        classes = []
+        for code, name in enumerate(poster.ROAD_CLASSES):
+            coords, offsets = geometry.roads[name]
+            if len(coords):
+                lines.append(self._geometries(shapely.linestrings, to_mercator(coords), offsets, 2))
+                classes.append(np.full(len(lines[-1]), code, dtype=np.uint8))
+        self.lines = np.concatenate(lines) if lines else np.array([], dtype=object)
+        self.line_classes = np.concatenate(classes) if classes else np.array([], dtype=np.uint8)
+        self.line_tree = shapely.STRtree(self.lines)
+
+        # Polygons: one ring per entry. Rings are oriented, and a hole's bounding box
+        # lies inside its exterior's, so any selection of rings fills correctly
+        self.rings = {}
+        for name, (vertices, codes) in geometry.polygons.items():
+            if len(vertices):
+                offsets = np.append(np.flatnonzero(codes == preview._MOVETO), len(vertices))
+                rings = self._geometries(shapely.linearrings, to_mercator(vertices), offsets, 4)
+                self.rings[name] = (rings, shapely.STRtree(rings))
+
+    @staticmethod
+    def _geometries(constructor, coords, offsets, min_points):
+        """Geometries from runs of coords between offsets, skipping runs shorter than min_points."""
+        counts = np.diff(offsets)
+        index = np.repeat(np.arange(len(counts)), counts)
+        keep = np.repeat(counts >= min_points, counts)
+        return constructor(coords[keep], indices=index[keep])
+
+    def line_width(self, road_class, meters_per_pixel):
+        """Pixel width of a road class at a zoom level with meters_per_pixel (Web Mercator)."""
+        points = poster.ROAD_CLASS_WIDTHS[poster.ROAD_CLASSES[road_class]]
+        width = points * self.meters_per_point * self.stretch / meters_per_pixel
+        return min(max(width, MIN_LINE_PX), MAX_LINE_PX)
+
+
+class TileRenderer:
+    """Finds the cached maps under a tile, draws them and caches the PNG."""
+
+    def __init__(self, cache=None, max_tiles=TILE_CACHE_ENTRIES):
+        self.cache = cache or preview.default_cache()
+        self.max_tiles = max_tiles
+        self._tiles = collections.OrderedDict()
+        self._sources = collections.OrderedDict()  # cache key -> TileSource
+        self._index = None  # (directory mtime, cache keys, STRtree of map extents)
+        self._empty_tile = None
+        self._lock = threading.Lock()
+
+    def _map_index(self):
+        """Cache keys and an STRtree of approximate map extents, refreshed when cache/map_data changes."""
+        mtime = os.path.getmtime(poster.MAP_CACHE_DIR)
+        with self._lock:
+            if self._index is not None and self._index[0] == mtime:
+                return self._index[1], self._index[2]
+        keys = []
+        boxes = []
+        for name in sorted(os.listdir(poster.MAP_CACHE_DIR)):
+            if not name.endswith(".pkl"):
+                continue
+            parsed = parse_cache_key(name[:-len(".pkl")])
+            if parsed is None:
+                continue
+            lat, lon, dist = parsed
+            x = math.radians(lon) * 6378137.0
+            y = math.log(math.tan(math.pi / 4 + math.radians(max(min(lat, 85), -85)) / 2)) * 6378137.0
+            # A map spans dist meters each way; pad for the mercator stretch and the graph's reach
+            half = 1.5 * dist / math.cos(math.radians(lat))
+            keys.append(name[:-len(".pkl")])
+            boxes.append(shapely.box(x - half, y - half, x + half, y + half))
+        tree = shapely.STRtree(boxes)
+        with self._lock:
+            self._index = (mtime, keys, tree)
+        return keys, tree
+
+    def _source(self, cache_key, dist):
+        geometry = self.cache.get_cached(cache_key, dist, wait=TILE_BUILD_WAIT)
+        with self._lock:
+            source = self._sources.get(cache_key)
+            if source is not None and source.geometry.source_mtime == geometry.source_mtime:
+                self._sources.move_to_end(cache_key)
+                return source
+        source = TileSource(geometry)
+        with self._lock:
+            self._sources[cache_key] = source
+            while len(self._sources) > TILE_SOURCE_ENTRIES:
+                self._sources.popitem(last=False)
+        return source
+
+    def render(self, theme_name, theme, z, x, y):
+        """PNG bytes of a tile, and whether it is complete (no map was still being built)."""
+        if z < MIN_ZOOM:
+            return self._empty(), True
+        bounds = tile_bounds(z, x, y)
+        keys, tree = self._map_index()
+        candidates = [keys[i] for i in tree.query(shapely.box(*bounds))]
+
+        sources = []
+        complete = True
+        for cache_key in candidates:
+            try:
+                sources.append((cache_key, self._source(cache_key, parse_cache_key(cache_key)[2])))
+            except preview.PreviewPending:
+                complete = False
+            except preview.PreviewNotCached:
+                continue
+        sources = [(key, source) for key, source in sources if source.extent.intersects(shapely.box(*bounds))]
+
+        versions = tuple((key, source.geometry.source_mtime) for key, source in sources)
+        # An edited theme keeps its name, so its colors are part of the key too
+        tile_key = (theme_name, theme_store.theme_version(theme), z, x, y, versions)
+        with self._lock:
+            tile = self._tiles.get(tile_key)
+            if tile is not None:
+                self._tiles.move_to_end(tile_key)
+                return tile, complete
+
+        tile = self._draw(theme, bounds, [source for _, source in sources])
+        if complete:
+            with self._lock:
+                self._tiles[tile_key] = tile
+                while len(self._tiles) > self.max_tiles:
+                    self._tiles.popitem(last=False)
+        return tile, complete
+
+    def _empty(self):
+        """A transparent tile, drawn once."""
+        if self._empty_tile is None:
+            self._empty_tile = self._draw({}, tile_bounds(0, 0, 0), [])
+        return self._empty_tile
+
+    def _draw(self, theme, bounds, sources):
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+        from matplotlib.patches import PathPatch, Polygon as MplPolygon
+        from matplotlib.path import Path
+
+        dpi = 100
+        fig = Figure(figsize=(TILE_SIZE / dpi, TILE_SIZE / dpi), dpi=dpi)
+        fig.patch.set_alpha(0)
+        ax = fig.add_axes((0, 0, 1, 1))
+        ax.set_axis_off()
+        ax.set_xlim(bounds[0], bounds[2])
+        ax.set_ylim(bounds[1], bounds[3])
+        meters_per_pixel = (bounds[2] - bounds[0]) / TILE_SIZE
+        query = shapely.box(*bounds).buffer(meters_per_pixel * MAX_LINE_PX)
+        palette = theme.get('rgba', theme)
+
+        for source in sources:
+            ax.add_patch(MplPolygon(np.asarray(source.extent.exterior.coords), closed=True,
+                                    facecolor=palette['bg'], edgecolor='none', zorder=0))
+            for zorder, name, color in ((1, "ocean", "water"), (2, "water", "water"), (3, "parks", "parks")):
+                if name not in source.rings:
+                    continue
+                rings, tree = source.rings[name]
+                hits = tree.query(query)
+                if len(hits):
+                    path = Path.make_compound_path(
+                        *(Path(shapely.get_coordinates(ring), closed=True) for ring in rings[np.sort(hits)])
+                    )
+                    ax.add_patch(PathPatch(path, facecolor=palette[color], edgecolor='none', zorder=zorder))
+
+        for source in sources:
+            hits = source.line_tree.query(query)
+            if not len(hits):
+                continue
+            classes = source.line_classes[hits]
+            # Minor roads first so major roads are drawn over them; as on the poster,
+            # roads sit above water and below parks
+            for code in sorted(set(classes.tolist()), reverse=True):
+                lines = source.lines[hits[classes == code]]
+                ax.add_collection(LineCollection(
+                    [shapely.get_coordinates(line) for line in lines],
+                    colors=palette[poster.ROAD_CLASS_COLORS[poster.ROAD_CLASSES[code]]],
+                    linewidths=source.line_width(code, meters_per_pixel) * 72 / dpi,
+                    capstyle='round',
+                    zorder=2.5,
+                ))
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=dpi)
+        fig.clear()
+        return buffer.getvalue()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_renderer():
+    """The process-wide TileRenderer, created on first use."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = TileRenderer()
+        return _default